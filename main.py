@@ -1,40 +1,188 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from config import settings
-from src.api.dashboards import router as dashboards_router
-from src.api.metrics import router as metrics_router
-from src.schemas.dashboard import HealthCheck
-import logging
-
-
-
-# Настройка логирования
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-app = FastAPI(title="Dashboards Service", version=settings.get('service_version', '1.0.0'))
-
-# Настройка CORS для работы с WebUI
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",
-        "http://localhost:8080", 
-        "http://127.0.0.1:3000",
-        "http://127.0.0.1:8080",
-        "http://webui.localhost",
-        "http://webui.localhost:3000",
-        "http://webui.localhost:8080",
-        "*"  # В продакшене лучше указать конкретные домены
-    ],
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
-    allow_headers=["*"],
+from src.observability.startup import STARTUP
+
+with STARTUP.phase("settings"):
+    from config import settings
+    # Dynaconf читает файлы настроек при первом обращении
+    settings.get('service_version')
+
+with STARTUP.phase("imports"):
+    import asyncio
+    from contextlib import asynccontextmanager, suppress
+    from fastapi import FastAPI
+    from fastapi.middleware.cors import CORSMiddleware
+    from src.api.dashboards import router as dashboards_router, grafana_service
+    from src.api.metrics import router as metrics_router
+    from src.api.promql import router as promql_router
+    from src.api.events import router as events_router
+    from src.api.debug import router as debug_router
+    from src.schemas.dashboard import HealthCheck
+    from src.middleware.admission import AdmissionControlMiddleware
+    from src.middleware.compression import CompressionMiddleware
+    from src.middleware.metrics import RequestMetricsMiddleware
+    from src.middleware.tracing import TracingMiddleware
+    from src.observability.log_pipeline import setup_logging
+    import logging
+
+
+
+# Настройка логирования: запись через очередь в фоновом потоке
+setup_logging(
+    level=settings.get('log_level', 'INFO'),
+    fmt=settings.get('log_format', 'text'),
+    sampling=settings.get('log_sampling', {}),
+    queue_size=settings.get('log_queue_size', 10000),
 )
 
-# ВАЖНО: Подключаем metrics_router ПЕРЕД dashboards_router
-# чтобы избежать конфликта с маршрутом /api/dashboards/{uid}
-app.include_router(metrics_router, prefix="/api", tags=["metrics"])
-app.include_router(dashboards_router, prefix="/api", tags=["dashboards"])
+async def _startup_background():
+    """Проверка связи с Grafana и прогрев кэша после начала приема запросов"""
+    with STARTUP.phase("first_upstream_connection") as entry:
+        entry["backends"] = await grafana_service.check_health()
+        entry["ok"] = all(entry["backends"].values())
+        for name, healthy in entry["backends"].items():
+            if not healthy:
+                logging.getLogger(__name__).warning("Grafana backend %s is not reachable at startup: %s",
+                                                    name, grafana_service.backends[name].health_error)
+
+    if settings.get('cache_warmup_enabled', False):
+        uids = list(dict.fromkeys(
+            list(settings.get('cache_warmup_uids', []))
+            + grafana_service.most_used(settings.get('cache_warmup_top', 20))
+        ))
+        with STARTUP.phase("cache_warmup", requested=len(uids)) as entry:
+            entry["loaded"] = await grafana_service.warm_up(
+                uids, concurrency=settings.get('cache_warmup_concurrency', 4)
+            )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    usage_file = settings.get('cache_usage_file', 'cache_usage.json')
+    usage_top = settings.get('cache_usage_top', 100)
+    grafana_service.load_usage(usage_file, usage_top)
+
+    mirror_sync = None
+    if settings.get('mirror_enabled', False):
+        from src.services.dashboard_mirror import DashboardMirror, MirrorSync
+
+        with STARTUP.phase("mirror_open") as entry:
+            grafana_service.mirror = DashboardMirror(
+                settings.get('mirror_path', 'dashboards_mirror.sqlite3'),
+                max_staleness=settings.get('mirror_max_staleness', 300.0),
+            )
+            entry["entries"] = grafana_service.mirror.count()
+        mirror_sync = asyncio.create_task(MirrorSync(
+            grafana_service,
+            grafana_service.mirror,
+            interval=settings.get('mirror_sync_interval', 60.0),
+            concurrency=settings.get('mirror_sync_concurrency', 4),
+            version_checks=settings.get('mirror_sync_version_checks', 500),
+        ).run())
+
+    metadata_refresh = None
+    if settings.get('promql_validation_enabled', True):
+        from src.services.prometheus import MetricMetadataCache
+        from src.services.promql_validator import PromQLValidator
+
+        metadata = MetricMetadataCache(
+            grafana_service.prometheus,
+            refresh_interval=settings.get('promql_metadata_refresh_interval', 300.0),
+            cardinality_limit=settings.get('prometheus_cardinality_limit', 10000),
+        )
+        grafana_service.promql = PromQLValidator(metadata)
+        grafana_service.query_cost.metadata = metadata
+        metadata_refresh = asyncio.create_task(metadata.run())
+
+    # Keepalive потоков событий и проверка версий дашбордов подписчиков
+    events_tasks = [
+        asyncio.create_task(grafana_service.events.heartbeat()),
+        asyncio.create_task(grafana_service.events.poll(
+            grafana_service,
+            interval=settings.get('events_poll_interval', 30.0),
+            concurrency=settings.get('events_poll_concurrency', 4),
+        )),
+    ]
+
+    STARTUP.mark_ready()
+    background = asyncio.create_task(_startup_background())
+    try:
+        yield
+    finally:
+        background.cancel()
+        for task in events_tasks:
+            task.cancel()
+        grafana_service.events.close()
+        if mirror_sync is not None:
+            mirror_sync.cancel()
+            # Синхронизация может писать в зеркало из пула потоков: закрываем после ее завершения
+            with suppress(asyncio.CancelledError):
+                await mirror_sync
+            grafana_service.mirror.close()
+        if metadata_refresh is not None:
+            metadata_refresh.cancel()
+        grafana_service.save_usage(usage_file, usage_top)
+        await grafana_service.aclose()
+
+with STARTUP.phase("router_setup"):
+    app = FastAPI(title="Dashboards Service", version=settings.get('service_version', '1.0.0'), lifespan=lifespan)
+
+    # Сжатие ответов и распаковка gzip-тел запросов. Подключается первым
+    # (самым внутренним), чтобы отклоненные admission control запросы не распаковывались
+    if settings.get('compression_enabled', True):
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.get('compression_minimum_size', 1024),
+            gzip_level=settings.get('compression_gzip_level', 6),
+            brotli_quality=settings.get('compression_brotli_quality', 4),
+            offload_size=settings.get('compression_offload_size', 262144),
+            max_request_size=settings.get('compression_max_request_size', 67108864),
+        )
+
+    # Ограничение нагрузки от одного клиента. Добавляется до CORS, чтобы
+    # ответы 429/503 тоже получали CORS-заголовки
+    if settings.get('admission_enabled', True):
+        app.add_middleware(
+            AdmissionControlMiddleware,
+            rate=settings.get('admission_rate', 20.0),
+            burst=settings.get('admission_burst', 40.0),
+            max_concurrent=settings.get('admission_max_concurrent', 8),
+            queue_size=settings.get('admission_queue_size', 32),
+            max_queue_wait=settings.get('admission_max_queue_wait', 2.0),
+            max_loop_lag=settings.get('admission_max_loop_lag', 0.5),
+            client_header=settings.get('admission_client_header', 'X-Client-Id'),
+            trusted_proxies=settings.get('admission_trusted_proxies', []),
+            exempt_paths=settings.get('admission_exempt_paths', ['/healthz', '/api/metrics', '/api/events']),
+        )
+
+    # Настройка CORS для работы с WebUI
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[
+            "http://localhost:3000",
+            "http://localhost:8080", 
+            "http://127.0.0.1:3000",
+            "http://127.0.0.1:8080",
+            "http://webui.localhost",
+            "http://webui.localhost:3000",
+            "http://webui.localhost:8080",
+            "*"  # В продакшене лучше указать конкретные домены
+        ],
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
+        allow_headers=["*"],
+    )
+
+    app.add_middleware(TracingMiddleware)
+
+    # Метрики запросов подключаются последними, чтобы учитывать все ответы,
+    # включая отклоненные admission control
+    app.add_middleware(RequestMetricsMiddleware)
+
+    # ВАЖНО: Подключаем metrics_router ПЕРЕД dashboards_router
+    # чтобы избежать конфликта с маршрутом /api/dashboards/{uid}
+    app.include_router(metrics_router, prefix="/api", tags=["metrics"])
+    app.include_router(promql_router, prefix="/api", tags=["promql"])
+    app.include_router(events_router, prefix="/api", tags=["events"])
+    app.include_router(dashboards_router, prefix="/api", tags=["dashboards"])
+    app.include_router(debug_router, prefix="/debug", tags=["debug"])
 
 @app.get("/healthz", response_model=HealthCheck, tags=["health"])
 async def health_check():
@@ -38,10 +38,12 @@ class Router1DashboardDeployer:
                         "datasource": {"type": "prometheus"},
                         "targets": [
                             {
+                                "refId": "A",
                                 "expr": "rate(ifInOctets{instance=\"router1\",ifDescr!~\".*Loopback.*\"}[5m])*8",
                                 "legendFormat": "{{ifDescr}} In (bps)"
                             },
                             {
+                                "refId": "B",
                                 "expr": "rate(ifOutOctets{instance=\"router1\",ifDescr!~\".*Loopback.*\"}[5m])*8",
                                 "legendFormat": "{{ifDescr}} Out (bps)"
                             }
@@ -55,6 +57,7 @@ class Router1DashboardDeployer:
                         "datasource": {"type": "prometheus"},
                         "targets": [
                             {
+                                "refId": "A",
                                 "expr": "avg(cpu_usage{instance=\"router1\"})",
                                 "legendFormat": "CPU %"
                             }
@@ -69,6 +72,7 @@ class Router1DashboardDeployer:
                         "datasource": {"type": "prometheus"},
                         "targets": [
                             {
+                                "refId": "A",
                                 "expr": "memory_usage{instance=\"router1\"}",
                                 "legendFormat": "Memory %"
                             }
@@ -83,6 +87,7 @@ class Router1DashboardDeployer:
                         "datasource": {"type": "prometheus"},
                         "targets": [
                             {
+                                "refId": "A",
                                 "expr": "ifOperStatus{instance=\"router1\"}",
                                 "legendFormat": "{{ifDescr}}"
                             }
@@ -96,10 +101,12 @@ class Router1DashboardDeployer:
                         "datasource": {"type": "prometheus"},
                         "targets": [
                             {
+                                "refId": "A",
                                 "expr": "rate(ifInErrors{instance=\"router1\"}[5m])",
                                 "legendFormat": "{{ifDescr}} In Errors/sec"
                             },
                             {
+                                "refId": "B",
                                 "expr": "rate(ifOutErrors{instance=\"router1\"}[5m])",
                                 "legendFormat": "{{ifDescr}} Out Errors/sec"
                             }
@@ -113,6 +120,7 @@ class Router1DashboardDeployer:
                         "datasource": {"type": "prometheus"},
                         "targets": [
                             {
+                                "refId": "A",
                                 "expr": "sysUpTime{instance=\"router1\"}/100",
                                 "legendFormat": "Uptime"
                             }
@@ -126,10 +134,12 @@ class Router1DashboardDeployer:
                         "datasource": {"type": "prometheus"},
                         "targets": [
                             {
+                                "refId": "A",
                                 "expr": "probe_success{instance=\"router1\"}",
                                 "legendFormat": "Ping Success"
                             },
                             {
+                                "refId": "B",
                                 "expr": "probe_duration_seconds{instance=\"router1\"}*1000",
                                 "legendFormat": "Response Time (ms)"
                             }
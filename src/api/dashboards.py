@@ -1,5 +1,6 @@
-from fastapi import APIRouter, HTTPException, Path, Query, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Path, Query, File, Request, UploadFile
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 from typing import Any, Dict, List
 
 from src.schemas.dashboard import (
@@ -10,44 +11,64 @@ from src.schemas.dashboard import (
     PanelUpdate,
     PanelResponse
 )
+from src.middleware.compression import accepts_encoding
+from src.services.dashboard_cache import gzip_decompress
 from src.services.grafana_service import GrafanaService
 
+GZIP_MAGIC = b"\x1f\x8b"
+
 router = APIRouter()
 grafana_service = GrafanaService()
 
 @router.post("/", response_model=DashboardResponse, status_code=201)
-async def create_dashboard(dashboard: DashboardCreate):
+async def create_dashboard(
+    dashboard: DashboardCreate,
+    backend: str = Query(None, description="Target Grafana backend")
+):
     try:
-        return await grafana_service.create_dashboard(dashboard.model_dump())
+        return await grafana_service.create_dashboard(dashboard, backend=backend)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/", response_model=List[DashboardMetadata])
 async def list_dashboards(
     tag: str = Query(None, description="Filter dashboards by tag"),
-    search: str = Query(None, description="Search dashboards by title")
+    search: str = Query(None, description="Search dashboards by title"),
+    backend: str = Query(None, description="Query only this Grafana backend")
 ):
     try:
-        return await grafana_service.get_dashboards(tag=tag, search=search)
+        return await grafana_service.get_dashboards(tag=tag, search=search, backend=backend)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/{uid}", response_model=Dict[str, Any])
 async def get_dashboard(
+    request: Request,
     uid: str = Path(..., description="Dashboard UID")
 ):
     try:
-        return await grafana_service.get_dashboard(uid)
+        dashboard = await grafana_service.get_dashboard(uid)
     except Exception as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+    # Готовые gzip-байты из кэша отдаются без повторной сериализации и сжатия
+    if accepts_encoding(request.headers.get("accept-encoding", ""), "gzip"):
+        compressed = await grafana_service.get_dashboard_gzip(uid)
+        if compressed is not None:
+            return Response(
+                content=compressed,
+                media_type="application/json",
+                headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+            )
+    return dashboard
+
 @router.put("/{uid}", response_model=DashboardResponse)
 async def update_dashboard(
     uid: str,
     dashboard: DashboardCreate
 ):
     try:
-        return await grafana_service.update_dashboard(uid, dashboard.model_dump())
+        return await grafana_service.update_dashboard(uid, dashboard)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -68,13 +89,19 @@ async def duplicate_dashboard(uid: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/import")
-async def import_dashboard_from_file(file: UploadFile):
+async def import_dashboard_from_file(
+    file: UploadFile,
+    backend: str = Query(None, description="Target Grafana backend")
+):
     try:
         temp_path = f"temp_{file.filename}"
         with open(temp_path, "wb") as f:
             content = await file.read()
+            # Файл экспорта может быть загружен сжатым (.json.gz)
+            if content[:2] == GZIP_MAGIC:
+                content = await run_in_threadpool(gzip_decompress, content)
             f.write(content)
-        result = await grafana_service.import_dashboard(temp_path)
+        result = await grafana_service.import_dashboard(temp_path, backend=backend)
         return result
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -82,11 +109,26 @@ async def import_dashboard_from_file(file: UploadFile):
 @router.get("/{uid}/export")
 async def export_dashboard_to_file(uid: str):
     try:
-        filepath = await grafana_service.export_dashboard(uid)
-        return {"message": "Dashboard exported", "filepath": filepath}
+        export = await grafana_service.export_dashboard(uid)
+        filepath = grafana_service.export_store.manifests_dir / export["export_id"]
+        return {"message": "Dashboard exported", "filepath": str(filepath), **export}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{uid}/exports")
+async def list_dashboard_exports(uid: str):
+    try:
+        return await grafana_service.list_exports(uid)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/{uid}/exports/{name}")
+async def get_dashboard_export(uid: str, name: str):
+    try:
+        return await grafana_service.load_export(f"{uid}/{name}")
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 @router.get("/{uid}/compare")
 async def compare_dashboard_versions(
     uid: str,
@@ -115,7 +157,7 @@ async def create_panel(
     """Добавление новой панели на дашборд"""
     try:
         result = await grafana_service.add_panel(uid, panel.model_dump())
-        return {**panel.model_dump(), "dashboardUid": uid, "id": result["panel_id"]}
+        return {**panel.model_dump(), "gridPos": result["gridPos"], "dashboardUid": uid, "id": result["panel_id"]}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -128,7 +170,7 @@ async def update_panel(
     """Обновление существующей панели"""
     try:
         result = await grafana_service.update_panel(uid, panel_id, panel.model_dump())
-        return {**panel.model_dump(), "dashboardUid": uid, "id": panel_id}
+        return {**panel.model_dump(), "gridPos": result["gridPos"], "dashboardUid": uid, "id": panel_id}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -153,5 +195,43 @@ async def get_panel(
     try:
         panel = await grafana_service.get_panel(uid, panel_id)
         return {**panel, "dashboardUid": uid}
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/{uid}/panels/{panel_id}/data")
+async def get_panel_data(
+    request: Request,
+    uid: str,
+    panel_id: int,
+    time_from: str = Query(None, alias="from", description="Start: 'now-1h', unix seconds or ms"),
+    time_to: str = Query(None, alias="to", description="End: 'now', unix seconds or ms"),
+    points: int = Query(None, ge=0, description="Downsample each series to this many points, 0 - off"),
+):
+    """Данные целей панели из Prometheus; переменные шаблона - параметрами var-<имя>"""
+    variables = {key[4:]: value for key, value in request.query_params.items() if key.startswith("var-")}
+    try:
+        # Ответ уже состоит из JSON-типов: без обхода jsonable_encoder по каждой точке
+        return JSONResponse(await grafana_service.get_panel_data(uid, panel_id, time_from, time_to, variables, points))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/{uid}/data")
+async def get_dashboard_data(
+    request: Request,
+    uid: str,
+    time_from: str = Query(None, alias="from", description="Start: 'now-1h', unix seconds or ms"),
+    time_to: str = Query(None, alias="to", description="End: 'now', unix seconds or ms"),
+    points: int = Query(None, ge=0, description="Downsample each series to this many points, 0 - off"),
+    concurrency: int = Query(None, ge=1, le=64, description="Prometheus queries in flight"),
+):
+    """Данные всех панелей дашборда; повторяющиеся запросы панелей выполняются один раз"""
+    variables = {key[4:]: value for key, value in request.query_params.items() if key.startswith("var-")}
+    try:
+        return JSONResponse(await grafana_service.get_dashboard_data(
+            uid, time_from, time_to, variables, points, concurrency))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=404, detail=str(e))
\ No newline at end of file
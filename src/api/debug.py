@@ -0,0 +1,69 @@
+import asyncio
+import hmac
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+
+from config import settings
+from src.observability.startup import STARTUP
+from src.observability.tracing import TRACES
+
+router = APIRouter()
+
+# Профилировщик создается при первом запросе, чтобы не замедлять запуск
+_profiler = None
+
+def _get_profiler():
+    global _profiler
+    if _profiler is None:
+        from src.observability.profiler import SamplingProfiler
+        _profiler = SamplingProfiler(
+            interval=settings.get('profiler_interval', 0.01),
+            max_seconds=settings.get('profiler_max_seconds', 60.0),
+        )
+    return _profiler
+
+def require_debug_token(x_debug_token: Optional[str] = Header(None)):
+    """Проверка токена для отладочных эндпоинтов с доступом к внутренностям процесса"""
+    expected = settings.get('debug_token', '')
+    if not expected:
+        raise HTTPException(status_code=403, detail="Debug endpoint is disabled: debug_token is not configured")
+    if not x_debug_token or not hmac.compare_digest(x_debug_token, expected):
+        raise HTTPException(status_code=401, detail="Invalid debug token")
+
+@router.get("/traces")
+async def get_traces(
+    limit: int = Query(20, ge=1, le=200, description="Number of traces to return"),
+    min_duration_ms: float = Query(0.0, ge=0, description="Only traces slower than this")
+):
+    """Самые медленные недавние запросы с деревьями span"""
+    return {
+        "buffered": len(TRACES),
+        "traces": TRACES.slowest(limit=limit, min_duration_ms=min_duration_ms)
+    }
+
+@router.get("/startup")
+async def get_startup_report():
+    """Длительность фаз запуска сервиса"""
+    return STARTUP.to_dict()
+
+@router.get("/profile", response_class=PlainTextResponse, dependencies=[Depends(require_debug_token)])
+async def get_profile(
+    seconds: float = Query(5.0, gt=0, description="Sampling duration in seconds")
+):
+    """Семплирование стеков процесса, ответ в collapsed-формате для flamegraph"""
+    from src.observability.profiler import ProfilerBusyError, SamplingProfiler
+
+    profiler = _get_profiler()
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="Another profile is already running")
+    loop = asyncio.get_running_loop()
+    try:
+        samples = await asyncio.to_thread(profiler.profile, seconds, loop)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(
+        SamplingProfiler.collapse(samples),
+        headers={"X-Profile-Samples": str(sum(samples.values()))}
+    )
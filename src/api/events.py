@@ -0,0 +1,60 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Header, Query
+from fastapi.responses import StreamingResponse
+
+from config import settings
+from src.api.dashboards import grafana_service
+from src.services.change_events import CLOSE, Subscription
+
+router = APIRouter()
+
+
+async def _stream(subscription: Subscription):
+    """Байты SSE из очереди подписчика; накопившиеся события отправляются одной записью"""
+    events = grafana_service.events
+    try:
+        # Пауза переподключения EventSource после обрыва, мс
+        yield f"retry: {int(settings.get('events_retry_ms', 3000))}\n\n".encode()
+        queue = subscription.queue
+        while True:
+            chunks = [await queue.get()]
+            while not queue.empty():
+                chunks.append(queue.get_nowait())
+            if CLOSE in chunks:
+                chunks = chunks[:chunks.index(CLOSE)]
+                if chunks:
+                    yield b"".join(chunks)
+                return
+            yield b"".join(chunks)
+    finally:
+        events.unsubscribe(subscription)
+
+
+@router.get("/events")
+async def dashboard_events(
+    uid: Optional[List[str]] = Query(None, description="Dashboard UIDs to watch (default: all dashboards)"),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Поток Server-Sent Events об изменениях дашбордов: dashboard.created,
+    dashboard.updated, dashboard.deleted, panel.added, panel.updated,
+    panel.deleted и resync (события потеряны, данные нужно перечитать)
+    """
+    try:
+        after = int(last_event_id) if last_event_id else None
+    except ValueError:
+        after = None
+    subscription = grafana_service.events.subscribe(uid, after)
+    return StreamingResponse(
+        _stream(subscription),
+        media_type="text/event-stream",
+        # Без буферизации в прокси (nginx), иначе события приходят пачками
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/events/stats")
+async def dashboard_events_stats():
+    """Число подписчиков и опубликованных событий"""
+    return grafana_service.events.stats()
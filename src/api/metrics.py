@@ -1,180 +1,165 @@
 from fastapi import APIRouter
 from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-import httpx
+from typing import Any, Dict, Optional
+import asyncio
+import contextvars
 import time
-import os
 import logging
 from config import settings
+from src.api.dashboards import grafana_service
+from src.services.grafana_backend import GrafanaApiError
+from src.observability.metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Метрики содержимого Grafana, обновляются при каждом сборе
+GRAFANA_DASHBOARDS_TOTAL = REGISTRY.gauge(
+    "grafana_dashboards_total", "Total number of dashboards in Grafana")
+GRAFANA_PANELS_TOTAL = REGISTRY.gauge(
+    "grafana_panels_total", "Total number of panels across all dashboards")
+GRAFANA_API_RESPONSE_TIME = REGISTRY.gauge(
+    "grafana_api_response_time_milliseconds", "API response time in milliseconds")
+GRAFANA_HEALTH_STATUS = REGISTRY.gauge(
+    "grafana_health_status", "Grafana health status (1 = healthy, 0 = unhealthy)")
+GRAFANA_BACKEND_DASHBOARDS = REGISTRY.gauge(
+    "grafana_backend_dashboards", "Dashboards on each Grafana backend", ("backend",))
+GRAFANA_BACKEND_PANELS = REGISTRY.gauge(
+    "grafana_backend_panels", "Panels across dashboards of each Grafana backend", ("backend",))
+SERVICE_INFO = REGISTRY.gauge(
+    "dashboards_service_info", "Information about the dashboards service", ("version", "service"))
+SERVICE_INFO.labels(
+    str(settings.get('service_version', '1.0.0')),
+    settings.get('service_name', 'dashboards-service'),
+).set(1)
+
 class GrafanaMetrics(BaseModel):
     total_dashboards: int
     total_panels: int
     api_response_time_ms: float
     grafana_health_status: bool
+    # backend -> {"healthy", "dashboards", "panels"}
+    backends: Dict[str, Dict[str, Any]] = {}
 
 async def collect_grafana_metrics():
-    """Собирает метрики с Grafana используя тот же подход что и GrafanaService"""
-    
-    # Используем настройки из конфига как в GrafanaService
-    grafana_url = settings.get('grafana_url', 'http://grafana.localhost:3000')
-    grafana_api_key = settings.get('grafana_api_key', '')
-    
-    headers = {
-        "Authorization": f"Bearer {grafana_api_key}",
-        "Content-Type": "application/json",
-        "Accept": "application/json"
-    }
-    
+    """
+    Собирает метрики со всех backend'ов Grafana через GrafanaService:
+    запросы идут через повторы, circuit breaker и bulkhead, а дашборды
+    берутся из зеркала, если оно свежее
+    """
     metrics = {
         "total_dashboards": 0,
         "total_panels": 0,
         "api_response_time_ms": 0.0,
-        "grafana_health_status": False
+        "grafana_health_status": False,
+        "backends": {},
     }
-    
-    timeout = httpx.Timeout(30.0)
-    
+    start_time = time.time()
+    health = await grafana_service.check_health()
+    backends = {name: {"healthy": healthy, "dashboards": 0, "panels": 0} for name, healthy in health.items()}
+    metrics["backends"] = backends
+    metrics["grafana_health_status"] = all(health.values())
+
     try:
-        start_time = time.time()
-        
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            try:
-                # Проверка здоровья Grafana
-                health_response = await client.get(
-                    f"{grafana_url}/api/health",
-                    headers=headers,
-                    follow_redirects=False
-                )
-                
-                # Если получили редирект, пробуем альтернативный endpoint
-                if health_response.status_code in [307, 302, 301]:
-                    logger.warning(f"Grafana redirected health check - trying admin stats: {health_response.status_code}")
-                    health_response = await client.get(
-                        f"{grafana_url}/api/admin/stats",
-                        headers=headers,
-                        follow_redirects=False
-                    )
-                
-                if health_response.status_code == 200:
-                    metrics["grafana_health_status"] = True
-                    logger.info("Grafana health check passed")
-                else:
-                    logger.warning(f"Grafana health check failed: {health_response.status_code}")
-                
-                # Получение списка дашбордов
-                dashboards_response = await client.get(
-                    f"{grafana_url}/api/search",
-                    headers=headers,
-                    follow_redirects=False
-                )
-                
-                end_time = time.time()
-                api_response_time = (end_time - start_time) * 1000
-                
-                # Проверяем на редирект
-                if dashboards_response.status_code in [307, 302, 301]:
-                    logger.error("Grafana API requires authentication - check API key configuration")
-                    logger.error(f"Redirect response: {dashboards_response.headers.get('location', 'No location header')}")
-                    metrics["grafana_health_status"] = False
-                    metrics["api_response_time_ms"] = round(api_response_time, 2)
-                    return metrics
-                
-                if dashboards_response.status_code == 200:
-                    try:
-                        dashboards_data = dashboards_response.json()
-                        metrics["total_dashboards"] = len(dashboards_data)
-                        logger.info(f"Found {len(dashboards_data)} dashboards")
-                        
-                        # Подсчитываем общее количество панелей
-                        total_panels = 0
-                        for dashboard in dashboards_data:
-                            if dashboard.get("type") == "dash-db":
-                                try:
-                                    dashboard_detail_response = await client.get(
-                                        f"{grafana_url}/api/dashboards/uid/{dashboard['uid']}",
-                                        headers=headers,
-                                        follow_redirects=False
-                                    )
-                                    if dashboard_detail_response.status_code == 200:
-                                        dashboard_detail = dashboard_detail_response.json()
-                                        panels = dashboard_detail.get("dashboard", {}).get("panels", [])
-                                        total_panels += len(panels)
-                                except Exception as e:
-                                    logger.warning(f"Failed to get panels for dashboard {dashboard.get('uid')}: {e}")
-                                    continue
-                        
-                        metrics["total_panels"] = total_panels
-                        logger.info(f"Total panels found: {total_panels}")
-                        
-                    except Exception as e:
-                        logger.error(f"Failed to parse Grafana response: {e}")
-                        logger.debug(f"Response content: {dashboards_response.text[:200]}")
-                        metrics["grafana_health_status"] = False
-                        
-                else:
-                    logger.error(f"Failed to get dashboards: {dashboards_response.status_code}")
-                    logger.debug(f"Response: {dashboards_response.text[:200]}")
-                    
-                metrics["api_response_time_ms"] = round(api_response_time, 2)
-                
-            except httpx.HTTPStatusError as e:
-                logger.error(f"HTTP error: {e.response.status_code} - {e.response.text}")
-                metrics["grafana_health_status"] = False
-                metrics["api_response_time_ms"] = 0.0
-            except httpx.ConnectError as e:
-                logger.error(f"Connection error to Grafana at {grafana_url}: {e}")
-                metrics["grafana_health_status"] = False
-                metrics["api_response_time_ms"] = 0.0
-                
-    except Exception as e:
-        logger.error(f"Unexpected error getting Grafana metrics: {e}")
+        async for backend, uid, content in grafana_service.iter_fleet(
+                concurrency=settings.get('grafana_metrics_concurrency', 4)):
+            backends[backend]["dashboards"] += 1
+            backends[backend]["panels"] += len(content.get("dashboard", {}).get("panels", []))
+    except GrafanaApiError as e:
+        logger.error(f"Failed to collect Grafana dashboard metrics: {e}")
         metrics["grafana_health_status"] = False
-        metrics["api_response_time_ms"] = 0.0
-    
+
+    metrics["total_dashboards"] = sum(item["dashboards"] for item in backends.values())
+    metrics["total_panels"] = sum(item["panels"] for item in backends.values())
+    metrics["api_response_time_ms"] = round((time.time() - start_time) * 1000, 2)
+    logger.info(f"Found {metrics['total_dashboards']} dashboards, {metrics['total_panels']} panels")
     return metrics
 
+class GrafanaMetricsCache:
+    """
+    Последний результат collect_grafana_metrics. Сбор обходит все дашборды,
+    поэтому выполняется не чаще раза в max_age секунд и одной задачей на
+    всех ожидающих; scrape Prometheus не ждет сбора, а запускает его в фоне
+    """
+
+    def __init__(self, max_age: float = 60.0):
+        self.max_age = max_age
+        self.value: Optional[Dict] = None
+        self.collected_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def stale(self) -> bool:
+        return self.value is None or time.monotonic() - self.collected_at > self.max_age
+
+    async def _collect(self) -> Dict:
+        try:
+            metrics = await collect_grafana_metrics()
+            GRAFANA_DASHBOARDS_TOTAL.labels().set(metrics['total_dashboards'])
+            GRAFANA_PANELS_TOTAL.labels().set(metrics['total_panels'])
+            GRAFANA_API_RESPONSE_TIME.labels().set(metrics['api_response_time_ms'])
+            GRAFANA_HEALTH_STATUS.labels().set(1 if metrics['grafana_health_status'] else 0)
+            for name, backend in metrics['backends'].items():
+                GRAFANA_BACKEND_DASHBOARDS.labels(name).set(backend['dashboards'])
+                GRAFANA_BACKEND_PANELS.labels(name).set(backend['panels'])
+            self.value = metrics
+            self.collected_at = time.monotonic()
+            return metrics
+        finally:
+            self._task = None
+
+    def refresh(self) -> asyncio.Task:
+        """Задача сбора: уже идущая или новая"""
+        if self._task is None:
+            # Пустой контекст: фоновый сбор не должен попадать в span запроса,
+            # который его запустил
+            self._task = asyncio.create_task(self._collect(), context=contextvars.Context())
+            self._task.add_done_callback(self._log_failure)
+        return self._task
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Grafana metrics collection failed: {task.exception()!r}")
+
+    async def get(self) -> Dict:
+        """Метрики не старше max_age"""
+        if self.stale:
+            return await asyncio.shield(self.refresh())
+        return self.value
+
+
+GRAFANA_METRICS = GrafanaMetricsCache(settings.get('grafana_metrics_max_age', 60.0))
+
+
 @router.get("/metrics", response_class=PlainTextResponse)
 async def get_prometheus_metrics():
     """
-    Возвращает метрики в формате Prometheus
-    Использует тот же код сбора метрик что и JSON endpoint
+    Возвращает метрики в формате Prometheus из реестра. Метрики содержимого
+    Grafana обновляются в фоне, если устарели, и попадают в следующий scrape
     """
-    # Используем ту же функцию что и для JSON
-    metrics = await collect_grafana_metrics()
-    
-    prometheus_output = f"""# HELP grafana_dashboards_total Total number of dashboards in Grafana
-# TYPE grafana_dashboards_total gauge
-grafana_dashboards_total {metrics['total_dashboards']}
-
-# HELP grafana_panels_total Total number of panels across all dashboards
-# TYPE grafana_panels_total gauge
-grafana_panels_total {metrics['total_panels']}
-
-# HELP grafana_api_response_time_milliseconds API response time in milliseconds
-# TYPE grafana_api_response_time_milliseconds gauge
-grafana_api_response_time_milliseconds {metrics['api_response_time_ms']}
-
-# HELP grafana_health_status Grafana health status (1 = healthy, 0 = unhealthy)
-# TYPE grafana_health_status gauge
-grafana_health_status {1 if metrics['grafana_health_status'] else 0}
-
-# HELP dashboards_service_info Information about the dashboards service
-# TYPE dashboards_service_info gauge
-dashboards_service_info{{version="1.2.3",service="dashboards-service"}} 1
-"""
-    
-    return prometheus_output
+    if GRAFANA_METRICS.stale:
+        GRAFANA_METRICS.refresh()
+    return REGISTRY.render()
+
+@router.get("/backends")
+async def get_grafana_backends():
+    """
+    Состояние backend'ов Grafana; здоровье проверяется параллельно при запросе
+    """
+    await grafana_service.check_health()
+    return {
+        "default": grafana_service.default_backend,
+        "backends": grafana_service.resilience_stats()
+    }
 
 @router.get("/metrics/json", response_model=GrafanaMetrics)
 async def get_metrics_json():
     """
     Возвращает метрики в формате JSON
     """
-    metrics = await collect_grafana_metrics()
+    metrics = await GRAFANA_METRICS.get()
     return GrafanaMetrics(**metrics)
 
 @router.get("/metrics/summary")
@@ -182,14 +167,10 @@ async def get_metrics_summary():
     """
     Получает краткую сводку всех метрик в удобочитаемом формате
     """
-    metrics = await collect_grafana_metrics()
+    metrics = await GRAFANA_METRICS.get()
     
     status_emoji = "✅" if metrics["grafana_health_status"] else "❌"
     
-    # Добавляем диагностическую информацию используя settings
-    grafana_url = settings.get('grafana_url', 'http://grafana.localhost:3000')
-    grafana_api_key = settings.get('grafana_api_key', '')
-    
     return {
         "summary": f"{status_emoji} Grafana Status",
         "details": {
@@ -204,11 +185,14 @@ async def get_metrics_summary():
             "summary": "/api/metrics/summary"
         },
         "diagnostics": {
-            "grafana_url": grafana_url,
-            "api_key_configured": bool(grafana_api_key),
-            "api_key_length": len(grafana_api_key) if grafana_api_key else 0,
+            "grafana_url": grafana_service.base_url,
+            "backends": {name: {"url": backend.base_url, "api_key_configured": "Authorization" in backend.headers}
+                         for name, backend in grafana_service.backends.items()},
             "settings_source": "config.settings",
             "debug_info": "Metrics router working correctly"
         },
-        "raw_metrics": metrics
+        "raw_metrics": metrics,
+        "grafana_client": grafana_service.resilience_stats(),
+        "cache": grafana_service.cache_stats(),
+        "mirror": grafana_service.mirror.stats() if grafana_service.mirror is not None else None
     }
@@ -0,0 +1,77 @@
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from config import settings
+from src.api.dashboards import grafana_service
+
+router = APIRouter()
+
+
+def _validator():
+    if grafana_service.promql is None:
+        raise HTTPException(status_code=404, detail="PromQL validation is disabled")
+    return grafana_service.promql
+
+
+@router.post("/promql/check")
+async def check_dashboard_promql(dashboard: Dict[str, Any]):
+    """
+    Проверка PromQL дашборда без сохранения; принимает тело дашборда или {"dashboard": ...}
+    """
+    validator = _validator()
+    body = dashboard.get("dashboard", dashboard)
+    problems, warnings = validator.inspect_dashboard(body)
+    return {"valid": not problems, "problems": problems, "warnings": warnings}
+
+
+@router.get("/promql/scan")
+async def scan_promql(
+    backend: Optional[str] = Query(None, description="Grafana backend (default: all)"),
+    concurrency: Optional[int] = Query(None, ge=1, le=64, description="Dashboards checked concurrently"),
+):
+    """
+    Проверка PromQL всех дашбордов парка (из зеркала, если оно включено)
+    """
+    _validator()
+    try:
+        return await grafana_service.scan_promql(
+            backend, concurrency or settings.get('promql_scan_concurrency', 8))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/promql/metadata")
+async def get_promql_metadata():
+    """
+    Состояние кэша метаданных метрик Prometheus
+    """
+    validator = _validator()
+    return validator.metadata.stats()
+
+
+@router.post("/promql/metadata/refresh")
+async def refresh_promql_metadata():
+    """
+    Немедленное обновление кэша метаданных
+    """
+    validator = _validator()
+    await validator.metadata.refresh()
+    return validator.metadata.stats()
+
+
+@router.get("/promql/cost")
+async def query_cost(
+    backend: Optional[str] = Query(None, description="Grafana backend (default: all)"),
+    limit: int = Query(50, ge=1, le=1000, description="Panels in the ranking"),
+    sort: str = Query("cost", description="cost (one load) or hourly_cost (with dashboard refresh)"),
+    concurrency: Optional[int] = Query(None, ge=1, le=64, description="Dashboards loaded concurrently"),
+):
+    """
+    Панели парка по убыванию оценки стоимости запросов к Prometheus
+    """
+    try:
+        return await grafana_service.analyze_query_cost(
+            backend, limit, sort, concurrency or settings.get('promql_scan_concurrency', 8))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,203 @@
+import asyncio
+import ipaddress
+import json
+import logging
+import math
+import time
+from typing import Dict, Iterable, Optional
+
+from src.observability.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+class _ClientState:
+    """Token bucket и очередь одного клиента"""
+
+    __slots__ = ("tokens", "updated", "waiting", "active", "semaphore")
+
+    def __init__(self, burst: float, max_concurrent: int):
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.waiting = 0
+        self.active = 0
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware ограничения нагрузки от одного клиента.
+
+    Каждому ключу клиента (IP-адрес; заголовок клиента - только от доверенных
+    прокси из trusted_proxies) выдается token bucket и
+    ограниченная очередь на выполнение. Переполнение bucket или очереди
+    дает 429, долгое ожидание в очереди или задержка event loop - 503.
+    Оба ответа содержат Retry-After.
+    """
+
+    def __init__(
+        self,
+        app,
+        rate: float = 20.0,
+        burst: float = 40.0,
+        max_concurrent: int = 8,
+        queue_size: int = 32,
+        max_queue_wait: float = 2.0,
+        max_loop_lag: float = 0.5,
+        client_header: str = "X-Client-Id",
+        exempt_paths: Iterable[str] = ("/healthz",),
+        max_clients: int = 10000,
+        trusted_proxies: Iterable[str] = (),
+    ):
+        self.app = app
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.max_queue_wait = max_queue_wait
+        self.max_loop_lag = max_loop_lag
+        self.client_header = client_header.lower().encode("latin-1")
+        self.exempt_paths = tuple(exempt_paths)
+        self.max_clients = max_clients
+        # Адреса и сети прокси, которым доверяется заголовок клиента
+        self.trusted_proxies = tuple(ipaddress.ip_network(item, strict=False) for item in trusted_proxies)
+        self.loop_lag = 0.0
+        self.stats = {"admitted": 0, "rate_limited": 0, "queue_full": 0, "queue_timeout": 0, "overloaded": 0}
+        self._clients: Dict[str, _ClientState] = {}
+        self._lag_monitor: Optional[asyncio.Task] = None
+        REGISTRY.callback("dashboards_admission_decisions_total",
+                          "Admission control decisions by outcome", "counter",
+                          lambda: [((outcome,), count) for outcome, count in self.stats.items()],
+                          ("outcome",))
+        REGISTRY.callback("dashboards_event_loop_lag_seconds", "Measured event loop lag",
+                          "gauge", lambda: self.loop_lag)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.app(scope, receive, self._lifespan_send(send))
+            return
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        if self._lag_monitor is None:
+            self._lag_monitor = asyncio.get_running_loop().create_task(self._monitor_loop_lag())
+
+        if self.loop_lag > self.max_loop_lag:
+            self.stats["overloaded"] += 1
+            await self._reject(send, 503, "Service overloaded", self.loop_lag)
+            return
+
+        state = self._client_state(self._client_key(scope))
+
+        retry_after = self._take_token(state)
+        if retry_after is not None:
+            self.stats["rate_limited"] += 1
+            await self._reject(send, 429, "Rate limit exceeded", retry_after)
+            return
+
+        if state.waiting >= self.queue_size:
+            self.stats["queue_full"] += 1
+            # Отклоненный запрос не расходует токен
+            state.tokens = min(self.burst, state.tokens + 1.0)
+            await self._reject(send, 429, "Too many queued requests", 1.0 / self.rate)
+            return
+
+        state.waiting += 1
+        try:
+            await asyncio.wait_for(state.semaphore.acquire(), self.max_queue_wait)
+        except asyncio.TimeoutError:
+            self.stats["queue_timeout"] += 1
+            await self._reject(send, 503, "Request queue wait exceeded", self.max_queue_wait)
+            return
+        finally:
+            state.waiting -= 1
+
+        self.stats["admitted"] += 1
+        state.active += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            state.active -= 1
+            state.semaphore.release()
+
+    def _lifespan_send(self, send):
+        """send lifespan-сообщений: после остановки приложения отменяет измерение задержки"""
+        async def wrapped(message):
+            if message["type"] in ("lifespan.shutdown.complete", "lifespan.shutdown.failed"):
+                self._stop_lag_monitor()
+            await send(message)
+        return wrapped
+
+    def _stop_lag_monitor(self) -> None:
+        if self._lag_monitor is not None:
+            self._lag_monitor.cancel()
+            self._lag_monitor = None
+
+    def _client_key(self, scope) -> str:
+        """
+        Ключ клиента: IP-адрес; заголовок клиента принимается только от
+        доверенного прокси, иначе клиент мог бы менять ключ или занимать чужой
+        """
+        client = scope.get("client")
+        address = client[0] if client else None
+        if address is not None and self._is_trusted(address):
+            for name, value in scope.get("headers", ()):
+                if name == self.client_header:
+                    return value.decode("latin-1")
+        return address or "anonymous"
+
+    def _is_trusted(self, address: str) -> bool:
+        if not self.trusted_proxies:
+            return False
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in network for network in self.trusted_proxies)
+
+    def _client_state(self, key: str) -> _ClientState:
+        state = self._clients.get(key)
+        if state is None:
+            if len(self._clients) >= self.max_clients:
+                self._evict_idle()
+            state = _ClientState(self.burst, self.max_concurrent)
+            self._clients[key] = state
+        return state
+
+    def _evict_idle(self) -> None:
+        """Удаляет клиентов без активных запросов"""
+        for key in [k for k, s in self._clients.items() if s.waiting == 0 and s.active == 0]:
+            del self._clients[key]
+
+    def _take_token(self, state: _ClientState) -> Optional[float]:
+        """Берет токен из bucket, возвращает Retry-After при его отсутствии"""
+        now = time.monotonic()
+        state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rate)
+        state.updated = now
+        if state.tokens >= 1.0:
+            state.tokens -= 1.0
+            return None
+        return (1.0 - state.tokens) / self.rate
+
+    async def _monitor_loop_lag(self) -> None:
+        """Измеряет задержку event loop по опозданию таймера"""
+        loop = asyncio.get_running_loop()
+        interval = 0.1
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag = max(0.0, loop.time() - started - interval)
+
+    async def _reject(self, send, status: int, detail: str, retry_after: float) -> None:
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,229 @@
+import gzip
+import json
+import logging
+import zlib
+from typing import Dict, Iterable, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli - необязательная зависимость, без нее используется только gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+_GZIP_WBITS = 31
+_COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml")
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Разбор Accept-Encoding в словарь кодировка -> q"""
+    result = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        result[coding] = quality
+    return result
+
+
+def accepts_encoding(header: str, coding: str) -> bool:
+    """Клиент принимает кодировку coding (явно или через *)"""
+    encodings = accepted_encodings(header)
+    return encodings.get(coding, encodings.get("*", 0.0)) > 0
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware сжатия ответов и распаковки gzip-тел запросов.
+
+    Кодировка ответа выбирается по Accept-Encoding (br, если установлен
+    пакет brotli, затем gzip). Сжимаются только ответы одним блоком
+    сжимаемых типов не меньше minimum_size; потоковые ответы (SSE и т.п.)
+    передаются как есть. Тела больше offload_size сжимаются в пуле потоков,
+    чтобы не блокировать event loop. Ответы с уже заданным Content-Encoding
+    (например, готовые gzip-байты из кэша дашбордов) не трогаются.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        offload_size: int = 256 * 1024,
+        max_request_size: int = 64 * 1024 * 1024,
+        compressible_types: Iterable[str] = _COMPRESSIBLE_TYPES,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.offload_size = offload_size
+        self.max_request_size = max_request_size
+        self.compressible_types = tuple(compressible_types)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if headers.get("content-encoding", "").strip().lower() == "gzip":
+            try:
+                scope, receive = await self._decompress_request(scope, receive)
+            except _RequestBodyError as e:
+                await self._reject(send, e.status_code, e.detail)
+                return
+
+        encoding = self._choose_encoding(headers.get("accept-encoding", ""))
+        responder = _CompressingResponder(self, send, encoding)
+        await self.app(scope, receive, responder.send)
+
+    def _choose_encoding(self, header: str) -> Optional[str]:
+        encodings = accepted_encodings(header)
+        wildcard = encodings.get("*", 0.0)
+        if brotli is not None and encodings.get("br", wildcard) > 0:
+            return "br"
+        if encodings.get("gzip", wildcard) > 0:
+            return "gzip"
+        return None
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    async def _decompress_request(self, scope, receive):
+        """Читает gzip-тело целиком и подменяет его распакованным"""
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise _RequestBodyError(400, "Client disconnected")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_request_size:
+                raise _RequestBodyError(413, "Request body too large")
+            chunks.append(chunk)
+            more_body = message.get("more_body", False)
+
+        compressed = b"".join(chunks)
+        if len(compressed) >= self.offload_size:
+            body = await run_in_threadpool(self._gunzip, compressed)
+        else:
+            body = self._gunzip(compressed)
+
+        raw_headers = [
+            (name, value) for name, value in scope["headers"]
+            if name not in (b"content-encoding", b"content-length")
+        ]
+        raw_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        # Scope меняется на месте: внешние middleware (метрики, трассировка)
+        # читают из него route, который проставляет роутер FastAPI
+        scope["headers"] = raw_headers
+
+        delivered = False
+
+        async def receive_decompressed():
+            nonlocal delivered
+            if delivered:
+                return await receive()
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return scope, receive_decompressed
+
+    def _gunzip(self, data: bytes) -> bytes:
+        decompressor = zlib.decompressobj(_GZIP_WBITS)
+        try:
+            body = decompressor.decompress(data, self.max_request_size + 1)
+        except zlib.error as e:
+            raise _RequestBodyError(400, f"Invalid gzip request body: {e}")
+        if len(body) > self.max_request_size or decompressor.unconsumed_tail:
+            raise _RequestBodyError(413, "Decompressed request body too large")
+        return body
+
+    async def _reject(self, send, status_code: int, detail: str) -> None:
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class _RequestBodyError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class _CompressingResponder:
+    """Откладывает http.response.start до первого блока тела и решает, сжимать ли ответ"""
+
+    def __init__(self, middleware: CompressionMiddleware, send, encoding: Optional[str]):
+        self.middleware = middleware
+        self._send = send
+        self.encoding = encoding
+        self.start_message = None
+        self.passthrough = False
+
+    async def send(self, message):
+        if self.passthrough:
+            await self._send(message)
+            return
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.start_message is None:
+            await self._send(message)
+            return
+
+        self.passthrough = True
+        start = self.start_message
+        body = message.get("body", b"")
+        headers = MutableHeaders(raw=start["headers"])
+        if message.get("more_body", False) or not self._compressible(start, headers, body):
+            await self._send(start)
+            await self._send(message)
+            return
+
+        headers.add_vary_header("Accept-Encoding")
+        if self.encoding is None:
+            await self._send(start)
+            await self._send(message)
+            return
+
+        if len(body) >= self.middleware.offload_size:
+            compressed = await run_in_threadpool(self.middleware.compress, body, self.encoding)
+        else:
+            compressed = self.middleware.compress(body, self.encoding)
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        await self._send(start)
+        await self._send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+    def _compressible(self, start, headers: MutableHeaders, body: bytes) -> bool:
+        if start["status"] in (204, 304) or "content-encoding" in headers:
+            return False
+        if len(body) < self.middleware.minimum_size:
+            return False
+        return headers.get("content-type", "").startswith(self.middleware.compressible_types)
@@ -0,0 +1,55 @@
+import time
+
+from src.middleware.tracing import is_event_stream
+from src.observability.metrics import HTTP_IN_FLIGHT, HTTP_REQUEST_DURATION, HTTP_REQUESTS_TOTAL
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware учета запросов к API.
+
+    Метки route берутся из шаблона найденного маршрута FastAPI
+    (например, /api/{uid}/panels), чтобы число серий не зависело от UID.
+    Потоковые ответы (text/event-stream) открыты, пока подключен клиент:
+    они выходят из числа выполняемых запросов с началом ответа, а
+    длительность учитывается до начала ответа.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._in_flight = HTTP_IN_FLIGHT.labels()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if is_event_stream(message):
+                    streaming = True
+                    self._in_flight.dec()
+                    self._observe_duration(scope, started)
+            await send(message)
+
+        started = time.perf_counter()
+        self._in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not streaming:
+                self._in_flight.dec()
+                self._observe_duration(scope, started)
+            HTTP_REQUESTS_TOTAL.labels(scope["method"], self._route_path(scope), str(status)).inc()
+
+    @staticmethod
+    def _route_path(scope) -> str:
+        return getattr(scope.get("route"), "path", "unmatched")
+
+    def _observe_duration(self, scope, started: float) -> None:
+        HTTP_REQUEST_DURATION.labels(scope["method"], self._route_path(scope)).observe(time.perf_counter() - started)
@@ -0,0 +1,41 @@
+from src.observability.tracing import trace
+
+_EVENT_STREAM = b"text/event-stream"
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware, открывающий корневой span на каждый HTTP-запрос.
+    Потоковые ответы (text/event-stream) длятся, пока открыто соединение,
+    и в буфер трасс не попадают
+    """
+
+    def __init__(self, app, exclude_paths=("/debug",)):
+        self.app = app
+        self.exclude_paths = tuple(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and root is not None:
+                root.attributes["status"] = message["status"]
+                if is_event_stream(message):
+                    root.discarded = True
+            await send(message)
+
+        with trace(f"{scope['method']} {scope['path']}", path=scope["path"]) as root:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if root is not None and route is not None:
+                    root.name = f"{scope['method']} {route.path}"
+
+
+def is_event_stream(message) -> bool:
+    """Начало ответа потока Server-Sent Events"""
+    return any(name == b"content-type" and value.startswith(_EVENT_STREAM)
+               for name, value in message.get("headers", ()))
@@ -0,0 +1 @@
+# Этот файл инициализирует пакет наблюдаемости. Он может содержать общие настройки или импорты для других файлов в пакете.
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+Неблокирующий конвейер логирования.
+
+Обработчики с вводом-выводом и форматирование сообщений работают в
+отдельном потоке QueueListener, event loop только кладет запись в
+очередь. Записи уровней DEBUG/INFO можно семплировать по категориям
+(префиксу имени логгера), а большие структуры логируются через
+LazyPayload: repr строится только для прошедшей фильтры записи и
+ограничен по размеру.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import reprlib
+from typing import Dict, Optional
+
+from src.observability.metrics import REGISTRY
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Атрибуты LogRecord, которые не относятся к структурированным полям
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class LazyPayload:
+    """Ограниченное по размеру представление объекта, вычисляемое при форматировании"""
+
+    __slots__ = ("obj", "limit")
+
+    _repr = reprlib.Repr()
+    _repr.maxlevel = 4
+    _repr.maxdict = 8
+    _repr.maxlist = 8
+    _repr.maxstring = 120
+    _repr.maxother = 120
+
+    def __init__(self, obj, limit: int = 1000):
+        self.obj = obj
+        self.limit = limit
+
+    def __str__(self) -> str:
+        try:
+            text = self._repr.repr(self.obj)
+        except RuntimeError:
+            # Строится в потоке логирования: объект мог измениться во время обхода
+            text = f"<{type(self.obj).__name__} changed while logging>"
+        if len(text) > self.limit:
+            text = text[:self.limit] + "..."
+        return text
+
+
+class CategorySamplingFilter(logging.Filter):
+    """Пропускает долю записей DEBUG/INFO по самой длинной совпавшей категории"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = dict(rates)
+        self._resolved: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            best = -1
+            for category, category_rate in self.rates.items():
+                if (name == category or name.startswith(category + ".")) and len(category) > best:
+                    rate, best = float(category_rate), len(category)
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    При переполненной очереди запись отбрасывается, а не блокирует event
+    loop. Запись кладется в очередь без форматирования: сообщение (включая
+    LazyPayload) строится форматтером в потоке QueueListener
+    """
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler.prepare форматирует сообщение в вызывающем потоке;
+        # очередь внутри процесса не требует сериализации записи
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись, поля из extra добавляются как есть"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text",
+                  sampling: Optional[Dict[str, float]] = None, queue_size: int = 10000) -> None:
+    """Настраивает корневой логгер на запись через очередь и фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+    else:
+        atexit.register(_stop_listener)
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    queue_handler = _DroppingQueueHandler(log_queue)
+    if sampling:
+        queue_handler.addFilter(CategorySamplingFilter(sampling))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    """Дописывает оставшиеся записи при завершении процесса"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def dropped_records() -> int:
+    """Число записей, отброшенных из-за переполненной очереди"""
+    return _DroppingQueueHandler.dropped
+
+
+REGISTRY.callback("dashboards_log_records_dropped_total",
+                  "Log records dropped because the logging queue was full",
+                  "counter", dropped_records)
@@ -0,0 +1,102 @@
+"""
+Семплирующий профилировщик работающего процесса.
+
+Отдельный поток с заданным интервалом снимает стеки всех потоков
+(sys._current_frames) и стеки ожидания asyncio-задач event loop, чтобы
+были видны и CPU-нагрузка, и то, на чем висят обработчики. Результат
+отдается в collapsed-формате ("frame;frame;frame count"), который читают
+flamegraph.pl, speedscope и аналоги.
+"""
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional
+
+MAX_STACK_DEPTH = 64
+
+
+class ProfilerBusyError(Exception):
+    """Профилирование уже выполняется"""
+    pass
+
+
+def _frame_label(frame) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{frame.f_code.co_name}"
+
+
+def _thread_stack(frame) -> List[str]:
+    """Стек потока от корня к текущему кадру"""
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _task_stack(task: asyncio.Task) -> List[str]:
+    """Цепочка await задачи от корутины задачи к самому вложенному ожиданию"""
+    stack = []
+    coro = task.get_coro()
+    while coro is not None and len(stack) < MAX_STACK_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return stack
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01, max_seconds: float = 60.0):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def profile(self, seconds: float, loop: Optional[asyncio.AbstractEventLoop] = None) -> Counter:
+        """Семплирует процесс seconds секунд, возвращает счетчики collapsed-стеков"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("Another profile is already running")
+        try:
+            return self._sample(min(seconds, self.max_seconds), loop)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, loop: Optional[asyncio.AbstractEventLoop]) -> Counter:
+        samples: Counter = Counter()
+        own_thread = threading.get_ident()
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = _thread_stack(frame)
+                name = thread_names.get(thread_id, str(thread_id))
+                samples[";".join([f"thread:{name}"] + stack)] += 1
+
+            if loop is not None:
+                try:
+                    tasks = asyncio.all_tasks(loop)
+                except RuntimeError:
+                    tasks = ()
+                for task in tasks:
+                    stack = _task_stack(task)
+                    if stack:
+                        samples[";".join([f"task:{task.get_name()}"] + stack)] += 1
+
+            time.sleep(self.interval)
+        return samples
+
+    @staticmethod
+    def collapse(samples: Counter) -> str:
+        """Collapsed-формат для flamegraph-инструментов"""
+        return "\n".join(f"{stack} {count}" for stack, count in samples.most_common()) + "\n"
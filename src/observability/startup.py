@@ -0,0 +1,49 @@
+"""
+Учет времени запуска сервиса по фазам.
+
+Модуль импортируется первым в main.py и не тянет тяжелых зависимостей,
+поэтому точка отсчета близка к началу работы интерпретатора.
+"""
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+_PROCESS_START = time.perf_counter()
+
+
+class StartupReport:
+    def __init__(self, origin: float = _PROCESS_START):
+        self.origin = origin
+        self.phases: List[Dict[str, Any]] = []
+        self.ready_at: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str, **info):
+        """Замер фазы запуска"""
+        started = time.perf_counter()
+        entry = {"name": name, **info}
+        try:
+            yield entry
+        except BaseException as e:
+            entry["error"] = repr(e)
+            raise
+        finally:
+            self.record(entry, started, time.perf_counter())
+
+    def record(self, entry: Dict[str, Any], started: float, ended: float) -> None:
+        entry["start_ms"] = round((started - self.origin) * 1000, 3)
+        entry["duration_ms"] = round((ended - started) * 1000, 3)
+        self.phases.append(entry)
+
+    def mark_ready(self) -> None:
+        """Сервис начал принимать запросы"""
+        self.ready_at = time.perf_counter()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ready_ms": round((self.ready_at - self.origin) * 1000, 3) if self.ready_at else None,
+            "phases": self.phases,
+        }
+
+
+STARTUP = StartupReport()
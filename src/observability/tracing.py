@@ -0,0 +1,127 @@
+"""
+Внутрипроцессная трассировка запросов.
+
+Корневой span создается middleware на каждый HTTP-запрос, вложенные span
+открываются в методах GrafanaService и вокруг вызовов Grafana. Текущий
+span хранится в ContextVar, поэтому дерево собирается и для задач,
+запущенных через asyncio.gather. Завершенные трассы попадают в кольцевой
+буфер фиксированного размера, внешний коллектор не нужен.
+"""
+import functools
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from config import settings
+
+
+class Span:
+    __slots__ = ("name", "attributes", "start", "end", "children", "error", "discarded")
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: List["Span"] = []
+        self.error: Optional[str] = None
+        # Трасса не попадает в буфер (например, поток событий длиной в соединение)
+        self.discarded = False
+
+    @property
+    def duration(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        origin = self.start if origin is None else origin
+        result = {
+            "name": self.name,
+            "start_offset_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "children": [child.to_dict(origin) for child in self.children],
+        }
+        if self.error:
+            result["error"] = self.error
+        return result
+
+
+class TraceBuffer:
+    """Кольцевой буфер последних завершенных трасс"""
+
+    def __init__(self, capacity: int = 200):
+        self._traces: deque = deque(maxlen=capacity)
+
+    def add(self, root: Span) -> None:
+        self._traces.append((time.time(), root))
+
+    def slowest(self, limit: int = 20, min_duration_ms: float = 0.0) -> List[Dict[str, Any]]:
+        """Самые медленные трассы из буфера с деревьями span"""
+        traces = [(ts, root) for ts, root in self._traces if root.duration * 1000 >= min_duration_ms]
+        traces.sort(key=lambda item: item[1].duration, reverse=True)
+        return [{"timestamp": ts, **root.to_dict()} for ts, root in traces[:limit]]
+
+    def __len__(self) -> int:
+        return len(self._traces)
+
+
+TRACES = TraceBuffer(settings.get('tracing_buffer_size', 200))
+TRACING_ENABLED = settings.get('tracing_enabled', True)
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """Корневой span запроса, по завершении трасса попадает в буфер"""
+    if not TRACING_ENABLED:
+        yield None
+        return
+    root = Span(name, attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = repr(e)
+        raise
+    finally:
+        root.end = time.perf_counter()
+        _current_span.reset(token)
+        if not root.discarded:
+            TRACES.add(root)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Вложенный span, вне трассы ничего не делает"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, attributes)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def traced(name: Optional[str] = None):
+    """Декоратор асинхронной функции, оборачивающий вызов в span"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(span_name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, model_validator
-from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, ConfigDict, Field, StrictBool, StrictInt, StrictStr, model_validator
+from typing import Any, Dict, List, Optional, Union
 
 class Panel(BaseModel):
     id: int
@@ -13,6 +13,7 @@ class DashboardMetadata(BaseModel):
     title: str
     description: Optional[str] = None
     tags: List[str] = []
+    backend: Optional[str] = None
 
 class DashboardCreate(BaseModel):
     dashboard: Dict[str, Any]
@@ -46,6 +47,7 @@ class DashboardResponse(BaseModel):
     title: str
     url: str
     version: int = 1
+    unchanged: bool = False
     
     class Config:
         from_attributes = True
@@ -74,7 +76,8 @@ class PanelCreate(BaseModel):
     type: str = "graph"
     datasource: Dict[str, Any]
     targets: List[PanelTarget]
-    gridPos: Dict[str, int] = {"h": 8, "w": 12, "x": 0, "y": 0}
+    # Без gridPos панель размещается в первом свободном месте сетки
+    gridPos: Optional[Dict[str, int]] = None
     options: Dict[str, Any] = {}
 
 class PanelUpdate(PanelCreate):
@@ -83,3 +86,82 @@ class PanelUpdate(PanelCreate):
 class PanelResponse(PanelUpdate):
     dashboardUid: str
     id: int  # В ответе ID всегда должен быть
+
+
+# Типизированная структура тела дашборда для строгой проверки перед сохранением.
+# Лишние поля Grafana допускаются, скалярные типы известных полей не приводятся.
+_STRUCTURE_CONFIG = ConfigDict(extra="allow")
+
+
+class GridPos(BaseModel):
+    model_config = _STRUCTURE_CONFIG
+
+    h: StrictInt = Field(ge=1)
+    w: StrictInt = Field(ge=1, le=24)
+    x: StrictInt = Field(ge=0, le=23)
+    y: StrictInt = Field(ge=0)
+
+    @model_validator(mode="after")
+    def validate_width(self):
+        if self.x + self.w > 24:
+            raise ValueError("x + w must not exceed 24 grid columns")
+        return self
+
+
+class QueryTarget(BaseModel):
+    model_config = _STRUCTURE_CONFIG
+
+    refId: StrictStr = Field(min_length=1)
+    expr: Optional[StrictStr] = None
+    hide: Optional[StrictBool] = None
+    datasource: Optional[Union[Dict[str, Any], StrictStr]] = None
+
+
+class DashboardPanel(BaseModel):
+    model_config = _STRUCTURE_CONFIG
+
+    id: StrictInt
+    type: Optional[StrictStr] = Field(None, min_length=1)
+    title: Optional[StrictStr] = None
+    gridPos: Optional[GridPos] = None
+    datasource: Optional[Union[Dict[str, Any], StrictStr]] = None
+    targets: List[QueryTarget] = []
+    # Панели внутри свернутой строки (type="row")
+    panels: List["DashboardPanel"] = []
+    # Ссылка на библиотечную панель: тип и цели хранятся в ней самой
+    libraryPanel: Optional[Dict[str, Any]] = None
+
+    @model_validator(mode="before")
+    @classmethod
+    def skip_library_targets(cls, data: Any) -> Any:
+        if isinstance(data, dict) and "libraryPanel" in data and "targets" in data:
+            data = {key: value for key, value in data.items() if key != "targets"}
+        return data
+
+    @model_validator(mode="after")
+    def require_type(self):
+        if self.type is None and self.libraryPanel is None:
+            raise ValueError("type is required")
+        return self
+
+
+class TemplateVariable(BaseModel):
+    model_config = _STRUCTURE_CONFIG
+
+    name: StrictStr = Field(min_length=1)
+    type: StrictStr = Field(min_length=1)
+
+
+class Templating(BaseModel):
+    model_config = _STRUCTURE_CONFIG
+
+    list: List[TemplateVariable] = []
+
+
+class DashboardBody(BaseModel):
+    model_config = _STRUCTURE_CONFIG
+
+    title: StrictStr = Field(min_length=1)
+    uid: Optional[StrictStr] = None
+    panels: List[DashboardPanel] = []
+    templating: Optional[Templating] = None
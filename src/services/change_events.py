@@ -0,0 +1,311 @@
+"""
+События изменения дашбордов для подписчиков Server-Sent Events.
+
+Источники событий: изменения через сервис (создание, обновление, удаление
+дашборда и операции с панелями) и периодическая проверка версий в Grafana
+для изменений, сделанных в обход сервиса. Проверка выполняется, только
+пока есть подписчики: один постраничный поиск на backend и запросы версий
+(поиск Grafana версию не отдает). Версии UID из подписок проверяются
+каждый раз. Для подписчиков на все дашборды появление и удаление видны по
+поиску, запрос версии делается для дашбордов с изменившейся записью поиска
+и по кругу не более version_checks остальных за проверку.
+
+Подписчик - ограниченная очередь готовых байт SSE. Событие кодируется
+один раз и кладется в очереди подписчиков своего UID и подписчиков на все
+дашборды; подписчик на оба получает его один раз. Keepalive рассылает одна
+общая задача, поэтому у простаивающего подписчика нет своих таймеров и
+задач, кроме ожидания очереди. Отставший подписчик (очередь заполнена)
+получает событие resync и должен перечитать данные сам. Последние события
+хранятся для повтора после переподключения по заголовку Last-Event-ID.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.observability.metrics import REGISTRY
+from src.services.dashboard_mirror import latest_version, search_all
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = (
+    "dashboard.created", "dashboard.updated", "dashboard.deleted",
+    "panel.added", "panel.updated", "panel.deleted",
+)
+_KEEPALIVE = b": keepalive\n\n"
+_RESYNC = b"event: resync\ndata: {}\n\n"
+# Маркер закрытия потока при остановке сервиса
+CLOSE = None
+# Версия дашборда еще не проверялась
+_UNKNOWN = object()
+
+
+class Subscription:
+    __slots__ = ("uids", "queue")
+
+    def __init__(self, uids: Optional[Set[str]], queue_size: int):
+        # None - все дашборды
+        self.uids = uids
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+
+class ChangeEvents:
+    def __init__(self, queue_size: int = 100, replay_size: int = 1000, heartbeat_interval: float = 15.0,
+                 version_checks: int = 100):
+        self.queue_size = queue_size
+        self.heartbeat_interval = heartbeat_interval
+        self.version_checks = version_checks
+        # UID -> подписчики; ключ None - подписчики на все дашборды
+        self._subscribers: Dict[Optional[str], Set[Subscription]] = {}
+        self._count = 0
+        self._last_id = 0
+        self._replay: Deque[Tuple[int, str, bytes]] = deque(maxlen=replay_size)
+        # Последняя известная версия дашбордов, за которыми следит проверка версий (None - удален)
+        self._versions: Dict[str, Optional[int]] = {}
+        # Записи поиска (JSON) дашбордов для подписчиков на все дашборды
+        self._listed: Dict[str, str] = {}
+        # uid -> время последней проверки версии: очередность проверок по кругу
+        self._checked: Dict[str, float] = {}
+        # Список дашбордов уже получен: появившиеся после него - новые
+        self._baseline = False
+        self.published_total = 0
+        self.dropped_total = 0
+        REGISTRY.callback("change_events_subscribers", "Open change event streams", "gauge", lambda: self._count)
+        REGISTRY.callback("change_events_published_total", "Dashboard change events published", "counter",
+                          lambda: self.published_total)
+        REGISTRY.callback("change_events_resync_total", "Subscribers that fell behind and were sent resync",
+                          "counter", lambda: self.dropped_total)
+
+    # --- подписки ---
+
+    def subscribe(self, uids: Optional[Iterable[str]] = None, last_event_id: Optional[int] = None) -> Subscription:
+        """Новая подписка на UID (None - на все дашборды) с повтором событий после last_event_id"""
+        subscription = Subscription(set(uids) if uids else None, self.queue_size)
+        for key in (subscription.uids or (None,)):
+            self._subscribers.setdefault(key, set()).add(subscription)
+        self._count += 1
+        if last_event_id is not None:
+            for event_id, uid, data in self._replay:
+                if event_id > last_event_id and (subscription.uids is None or uid in subscription.uids):
+                    self._deliver(subscription, data)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for key in (subscription.uids or (None,)):
+            subscribers = self._subscribers.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[key]
+                    self._forget(key)
+        self._count -= 1
+
+    def _forget(self, key: Optional[str]) -> None:
+        """Перестает следить за версиями, которые больше никому не нужны"""
+        if not self._subscribers:
+            self._versions.clear()
+            self._listed.clear()
+            self._checked.clear()
+            self._baseline = False
+        elif key is None:
+            self._baseline = False
+            self._listed.clear()
+            watched = set(self.watched_uids)
+            self._versions = {uid: version for uid, version in self._versions.items() if uid in watched}
+            self._checked = {uid: checked for uid, checked in self._checked.items() if uid in watched}
+        elif not self.watching_all:
+            self._versions.pop(key, None)
+
+    def close(self) -> None:
+        """Завершает все потоки (остановка сервиса)"""
+        for subscription in self._all_subscriptions():
+            self._deliver(subscription, CLOSE, force=True)
+
+    def _all_subscriptions(self) -> Set[Subscription]:
+        return set().union(*self._subscribers.values()) if self._subscribers else set()
+
+    @property
+    def watched_uids(self) -> List[str]:
+        return [uid for uid in self._subscribers if uid is not None]
+
+    @property
+    def watching_all(self) -> bool:
+        return None in self._subscribers
+
+    # --- публикация ---
+
+    def _deliver(self, subscription: Subscription, data: Optional[bytes], force: bool = False) -> None:
+        try:
+            subscription.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            if data is _KEEPALIVE:
+                return
+            # Отставший подписчик: вместо потерянных событий - одно resync
+            if not force:
+                self.dropped_total += 1
+            while not subscription.queue.empty():
+                subscription.queue.get_nowait()
+            subscription.queue.put_nowait(CLOSE if force else _RESYNC)
+
+    def publish(self, event_type: str, uid: str, **data: Any) -> int:
+        """Рассылает событие подписчикам UID и всех дашбордов; возвращает id события"""
+        if event_type == "dashboard.deleted":
+            self._versions[uid] = None
+        elif data.get("version") is not None:
+            # Изменение уже известно: проверка версий не повторит его
+            self._versions[uid] = data["version"]
+        self._last_id += 1
+        payload = json.dumps({"type": event_type, "uid": uid, "time": time.time(), **data},
+                             ensure_ascii=False, default=str)
+        encoded = f"id: {self._last_id}\nevent: {event_type}\ndata: {payload}\n\n".encode("utf-8")
+        self._replay.append((self._last_id, uid, encoded))
+        self.published_total += 1
+
+        recipients = self._subscribers.get(uid, set())
+        everyone = self._subscribers.get(None)
+        if everyone:
+            recipients = recipients | everyone
+        for subscription in recipients:
+            self._deliver(subscription, encoded)
+        return self._last_id
+
+    async def heartbeat(self) -> None:
+        """Keepalive всем подписчикам с пустой очередью, до отмены задачи"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            for subscription in self._all_subscriptions():
+                if subscription.queue.empty():
+                    self._deliver(subscription, _KEEPALIVE)
+
+    # --- проверка версий ---
+
+    async def poll(self, service, interval: float = 30.0, concurrency: int = 4) -> None:
+        """Периодическая проверка версий до отмены задачи"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check_versions(service, concurrency)
+            except Exception as e:
+                logger.warning("Dashboard version check failed: %s", e)
+
+    async def check_versions(self, service, concurrency: int = 4) -> int:
+        """
+        Сравнивает версии дашбордов подписчиков с Grafana и публикует
+        изменения, сделанные в обход сервиса. Подписчики на все дашборды
+        получают события по всем дашбордам, включая появление новых.
+        Возвращает число опубликованных событий.
+        """
+        if not self._subscribers:
+            return 0
+        names = list(service.backends)
+        results = await asyncio.gather(*(search_all(service, name) for name in names), return_exceptions=True)
+        listed: Dict[str, Tuple[str, Dict]] = {}
+        complete = True
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                # Без списка backend исчезновение дашбордов не определить
+                logger.warning("Version check of Grafana backend %s failed: %s", name, result)
+                complete = False
+                continue
+            for item in result:
+                listed.setdefault(item["uid"], (name, item))
+
+        watching_all = self.watching_all
+        watched = set(self.watched_uids)
+        summaries: Dict[str, str] = {}
+        # Дашборды, запись поиска которых изменилась: их сохраняли
+        resaved: Set[str] = set()
+        to_check = {uid for uid in watched if uid in listed}
+        if watching_all:
+            summaries = {uid: json.dumps(item, sort_keys=True, ensure_ascii=False)
+                         for uid, (_, item) in listed.items()}
+            if self._baseline:
+                resaved = {uid for uid, summary in summaries.items()
+                           if uid in self._listed and self._listed[uid] != summary}
+                # Новые дашборды и изменившиеся записи поиска
+                to_check.update(uid for uid in summaries if uid not in self._listed)
+                to_check.update(resaved)
+            rest = sorted((uid for uid in listed if uid not in to_check), key=lambda uid: self._checked.get(uid, 0.0))
+            to_check.update(rest[:self.version_checks])
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def current_version(uid: str) -> Optional[int]:
+            backend, item = listed[uid]
+            if item.get("version") is not None:
+                return item["version"]
+            async with semaphore:
+                return await latest_version(service, uid, backend)
+
+        checked = list(to_check)
+        versions = await asyncio.gather(*(current_version(uid) for uid in checked), return_exceptions=True)
+        now = time.time()
+        current: Dict[str, Optional[int]] = {}
+        for uid, version in zip(checked, versions):
+            if isinstance(version, Exception):
+                # Повтор в следующую проверку: запись поиска не запоминается
+                summaries.pop(uid, None)
+                if uid in self._listed:
+                    summaries[uid] = self._listed[uid]
+                continue
+            self._checked[uid] = now
+            current[uid] = version
+        if complete:
+            gone = {uid for uid in watched if uid not in listed}
+            if watching_all:
+                gone.update(uid for uid in self._listed if uid not in listed)
+            current.update((uid, None) for uid in gone)
+
+        published = 0
+        for uid, version in current.items():
+            previous = self._versions.get(uid, _UNKNOWN)
+            if previous is _UNKNOWN:
+                if version is None and uid in self._listed:
+                    # Удален дашборд из списка, версию которого еще не проверяли
+                    event_type = "dashboard.deleted"
+                elif version is not None and watching_all and self._baseline and uid not in self._listed:
+                    event_type = "dashboard.created"
+                elif version is not None and uid in resaved:
+                    event_type = "dashboard.updated"
+                else:
+                    # Первая проверка только запоминает состояние; новые дашборды
+                    # видны подписчикам на все дашборды начиная со второй
+                    self._versions[uid] = version
+                    continue
+            elif version == previous:
+                continue
+            elif version is None:
+                event_type = "dashboard.deleted"
+            elif previous is None:
+                event_type = "dashboard.created"
+            else:
+                event_type = "dashboard.updated"
+
+            if event_type == "dashboard.deleted":
+                self.publish(event_type, uid, source="poll")
+            elif event_type == "dashboard.created":
+                self.publish(event_type, uid, source="poll", version=version, title=listed[uid][1].get("title"))
+            else:
+                self.publish(event_type, uid, source="poll", version=version)
+            published += 1
+
+        if watching_all:
+            if complete:
+                self._listed = summaries
+                self._checked = {uid: checked for uid, checked in self._checked.items()
+                                 if uid in listed or uid in watched}
+            else:
+                self._listed.update(summaries)
+            self._baseline = True
+        return published
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": self._count,
+            "watched_uids": len(self.watched_uids),
+            "watching_all": self.watching_all,
+            "last_event_id": self._last_id,
+            "published_total": self.published_total,
+            "resync_total": self.dropped_total,
+        }
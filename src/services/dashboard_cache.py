@@ -0,0 +1,184 @@
+"""
+Кэш дашбордов с хранением в сжатом виде.
+
+Все записи лежат в сжатом тире как gzip-сжатый компактный JSON, небольшое
+число последних использованных записей дополнительно держится
+раскодированными (горячий тир, LRU). Сжатые байты совпадают с телом
+JSON-ответа FastAPI, поэтому их можно отдавать клиенту без повторного
+сжатия. Без сжатого хранения gzip-байты записи вычисляются при первом
+запросе сжатого ответа и хранятся до замены записи. Интерфейс повторяет
+dict, чтобы сервис работал с кэшем как раньше.
+
+Значения хранятся замороженными (см. frozen.py): их можно без копирования
+отдавать параллельным запросам, изменения делаются копированием пути.
+"""
+import json
+import sys
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional
+
+from src.services.frozen import freeze
+
+_GZIP_WBITS = 31
+
+
+def encode_json(value: Any) -> bytes:
+    """JSON в том же виде, что отдает JSONResponse FastAPI"""
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def gzip_compress(data: bytes, level: int = 6) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def gzip_decompress(data: bytes) -> bytes:
+    return zlib.decompress(data, _GZIP_WBITS)
+
+
+def deep_sizeof(value: Any) -> int:
+    """Оценка памяти, занимаемой JSON-подобной структурой"""
+    size = 0
+    stack = [value]
+    seen = set()
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return size
+
+
+class DashboardCache:
+    def __init__(self, compressed: bool = False, hot_entries: int = 32, compression_level: int = 6):
+        self.compressed = compressed
+        self.hot_entries = max(1, hot_entries)
+        self.compression_level = compression_level
+        # key -> (gzip-байты, размер несжатого JSON)
+        self._compressed: Dict[str, tuple] = {}
+        # key -> [значение, оценка размера в памяти или None, пока не запрошена статистика]
+        self._decoded: "OrderedDict[str, list]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.decodes = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._decoded or key in self._compressed
+
+    def __len__(self) -> int:
+        return len(self._compressed) if self.compressed else len(self._decoded)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._compressed) if self.compressed else list(self._decoded))
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        value = freeze(value)
+        if self.compressed:
+            self._compressed[key] = self.pack(value)
+        else:
+            # Сжатая копия прежнего значения больше не актуальна
+            self._compressed.pop(key, None)
+        self._put_decoded(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self.pop(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._decoded.get(key)
+        if entry is not None:
+            self._decoded.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        packed = self._compressed.get(key)
+        if packed is None:
+            self.misses += 1
+            return default
+        # Ленивая распаковка с переносом записи в горячий тир
+        self.hits += 1
+        self.decodes += 1
+        value = freeze(json.loads(gzip_decompress(packed[0])))
+        self._put_decoded(key, value)
+        return value
+
+    def get_compressed(self, key: str) -> Optional[bytes]:
+        """Gzip-сжатый JSON записи, если он уже есть"""
+        packed = self._compressed.get(key)
+        return packed[0] if packed else None
+
+    def peek(self, key: str) -> Any:
+        """Раскодированное значение без учета в статистике и LRU"""
+        entry = self._decoded.get(key)
+        return entry[0] if entry is not None else None
+
+    def pack(self, value: Any) -> tuple:
+        """(gzip-байты, размер JSON) для значения; можно вызывать вне event loop"""
+        raw = encode_json(value)
+        return gzip_compress(raw, self.compression_level), len(raw)
+
+    def attach_compressed(self, key: str, value: Any, packed: tuple) -> None:
+        """Сохраняет сжатую копию, если запись за время сжатия не заменили"""
+        if self.peek(key) is value:
+            self._compressed[key] = packed
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        entry = self._decoded.pop(key, None)
+        packed = self._compressed.pop(key, None)
+        if entry is not None:
+            return entry[0]
+        if packed is not None:
+            return freeze(json.loads(gzip_decompress(packed[0])))
+        return default
+
+    def clear(self) -> None:
+        self._decoded.clear()
+        self._compressed.clear()
+
+    def _put_decoded(self, key: str, value: Any) -> None:
+        # Размер считается только для статистики, см. _decoded_bytes
+        self._decoded[key] = [value, None]
+        self._decoded.move_to_end(key)
+        if self.compressed:
+            while len(self._decoded) > self.hot_entries:
+                self._decoded.popitem(last=False)
+
+    def _decoded_bytes(self) -> int:
+        """Память горячего тира; размер записи вычисляется при первом запросе и запоминается"""
+        total = 0
+        for entry in self._decoded.values():
+            if entry[1] is None:
+                entry[1] = deep_sizeof(entry[0])
+            total += entry[1]
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        """Число записей и занимаемая память по тирам"""
+        return {
+            "compressed_enabled": self.compressed,
+            "entries": len(self),
+            "decoded_entries": len(self._decoded),
+            "decoded_bytes": self._decoded_bytes(),
+            "compressed_entries": len(self._compressed),
+            "compressed_bytes": sum(len(data) for data, _ in self._compressed.values()),
+            "uncompressed_json_bytes": sum(raw for _, raw in self._compressed.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "decodes": self.decodes,
+        }
+
+
+_MISSING = object()
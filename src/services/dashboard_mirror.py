@@ -0,0 +1,384 @@
+"""
+Локальное зеркало дашбордов всех backend'ов Grafana в SQLite.
+
+Фоновая синхронизация после первой полной загрузки работает инкрементально:
+список дашбордов берется из /api/search, заново загружаются только новые
+дашборды и дашборды с изменившейся версией, удаленные в Grafana удаляются
+из зеркала. Поиск Grafana не отдает версию дашборда, поэтому дешевый
+признак изменения - отличие записи поиска (название, теги, папка) от
+сохраненной; версии остальных дашбордов проверяются отдельными запросами
+по кругу, начиная с давно проверенных, столько за проход, чтобы каждый
+был проверен за max_staleness (не меньше version_checks). Изменения через
+сервис сбрасывают запись сразу, до следующей синхронизации списки
+дашбордов этого backend читаются из Grafana.
+
+Чтение из зеркала допускается, пока последняя успешная синхронизация
+backend не старше max_staleness; файл переживает перезапуск сервиса,
+поэтому после рестарта зеркало сразу пригодно для чтения.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from src.observability.metrics import REGISTRY
+from src.services.frozen import freeze
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dashboards (
+    uid TEXT PRIMARY KEY,
+    backend TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    version INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    content TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dashboards_backend ON dashboards (backend);
+CREATE TABLE IF NOT EXISTS sync_state (
+    backend TEXT PRIMARY KEY,
+    last_sync REAL NOT NULL,
+    dashboards INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Размер страницы /api/search (максимум Grafana)
+SEARCH_PAGE_SIZE = 5000
+
+
+class DashboardMirror:
+    """
+    Хранилище зеркала. Методы синхронные и вызываются из пула потоков
+    (asyncio.to_thread): запросы и разбор JSON не занимают event loop
+    """
+
+    def __init__(self, path: str, max_staleness: float = 300.0):
+        self.path = path
+        self.max_staleness = max_staleness
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._writer = self._connect()
+        self._writer.executescript(_SCHEMA)
+        self._writer.commit()
+        self._reader = self._connect()
+        # uid -> (время локального изменения, backend или None, если неизвестен); защищает
+        # от записи устаревшего содержимого синхронизацией, начатой до изменения, а
+        # списки дашбордов backend до следующей синхронизации читаются из Grafana
+        self._invalidated: Dict[str, Tuple[float, Optional[str]]] = {}
+        self.reads = {"hit": 0, "stale": 0, "miss": 0}
+        REGISTRY.callback("dashboards_mirror_entries", "Dashboards stored in the local mirror",
+                          "gauge", self.count)
+        REGISTRY.callback("dashboards_mirror_sync_age_seconds", "Seconds since the last successful sync",
+                          "gauge", lambda: [((backend,), time.time() - last_sync)
+                                            for backend, last_sync in self.sync_times().items()],
+                          ("backend",))
+        REGISTRY.callback("dashboards_mirror_reads_total", "Mirror read attempts by result", "counter",
+                          lambda: [((result,), count) for result, count in self.reads.items()], ("result",))
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # Поиск по подстроке без учета регистра как в Python (LIKE в SQLite - только для ASCII)
+        connection.create_function("contains_ci", 2, _contains_ci, deterministic=True)
+        # WAL позволяет читать, пока синхронизация пишет в другом потоке
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def close(self) -> None:
+        with self._write_lock:
+            self._writer.close()
+        with self._read_lock:
+            self._reader.close()
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    # --- чтение ---
+
+    def count(self) -> int:
+        return self._query("SELECT COUNT(*) FROM dashboards")[0][0]
+
+    def sync_times(self) -> Dict[str, float]:
+        return dict(self._query("SELECT backend, last_sync FROM sync_state"))
+
+    def is_fresh(self, backend: str) -> bool:
+        """Последняя успешная синхронизация backend не старше max_staleness"""
+        return self.all_fresh([backend])
+
+    def all_fresh(self, backends: List[str]) -> bool:
+        sync_times = self.sync_times()
+        now = time.time()
+        return all(backend in sync_times and now - sync_times[backend] <= self.max_staleness
+                   for backend in backends)
+
+    def listing_fresh(self, backends: List[str]) -> bool:
+        """
+        Списку дашбордов backends можно верить: синхронизация свежая и после
+        нее ничего не менялось через сервис (измененная запись удалена из зеркала)
+        """
+        pending = {backend for _, backend in self._invalidated.values()}
+        if pending and (None in pending or not pending.isdisjoint(backends)):
+            return False
+        return self.all_fresh(backends)
+
+    def backend_of(self, uid: str) -> Optional[str]:
+        rows = self._query("SELECT backend FROM dashboards WHERE uid = ?", (uid,))
+        return rows[0][0] if rows else None
+
+    def known(self, backend: str) -> Dict[str, Tuple[int, str, float]]:
+        """uid -> (версия, запись поиска JSON, время последней проверки) дашбордов backend"""
+        return {uid: (version, summary, synced_at) for uid, version, summary, synced_at in self._query(
+            "SELECT uid, version, summary, synced_at FROM dashboards WHERE backend = ?", (backend,))}
+
+    def get(self, uid: str) -> Optional[Dict]:
+        """Дашборд в формате ответа Grafana, если зеркало для его backend и сама запись свежие"""
+        rows = self._query("SELECT backend, content, synced_at FROM dashboards WHERE uid = ?", (uid,))
+        if not rows:
+            self.reads["miss"] += 1
+            return None
+        backend, content, synced_at = rows[0]
+        if time.time() - synced_at > self.max_staleness or not self.is_fresh(backend):
+            self.reads["stale"] += 1
+            return None
+        self.reads["hit"] += 1
+        return freeze(json.loads(content))
+
+    def search(self, backends: List[str], tag: Optional[str] = None, query: Optional[str] = None,
+               limit: int = 100) -> Optional[List[Dict]]:
+        """Список дашбордов из зеркала или None, если хотя бы один backend устарел"""
+        if not self.listing_fresh(backends):
+            self.reads["stale"] += 1
+            return None
+        sql = f"SELECT backend, summary FROM dashboards WHERE backend IN ({','.join('?' * len(backends))})"
+        params: List[Any] = list(backends)
+        if tag:
+            sql += " AND EXISTS (SELECT 1 FROM json_each(summary, '$.tags') WHERE value = ?)"
+            params.append(tag)
+        if query:
+            sql += " AND contains_ci(title, ?)"
+            params.append(query)
+        sql += " ORDER BY title COLLATE NOCASE LIMIT ?"
+        params.append(limit)
+        result = []
+        for backend, summary in self._query(sql, tuple(params)):
+            item = json.loads(summary)
+            item["backend"] = backend
+            result.append(item)
+        self.reads["hit"] += 1
+        return result
+
+    def dashboards_page(self, backends: List[str], after: str = "",
+                        size: int = 100) -> List[Tuple[str, str, Dict]]:
+        """(backend, uid, дашборд) записей backends с uid больше after, по возрастанию uid"""
+        rows = self._query(
+            f"SELECT backend, uid, content FROM dashboards WHERE backend IN ({','.join('?' * len(backends))}) "
+            "AND uid > ? ORDER BY uid LIMIT ?",
+            (*backends, after, size),
+        )
+        return [(backend, uid, json.loads(content)) for backend, uid, content in rows]
+
+    async def iter_dashboards(self, backends: List[str],
+                              page_size: int = 100) -> AsyncIterator[Tuple[str, str, Dict]]:
+        """(backend, uid, дашборд) всех записей backends для задач по всему парку; страницы читаются в пуле потоков"""
+        after = ""
+        while True:
+            page = await asyncio.to_thread(self.dashboards_page, backends, after, page_size)
+            for item in page:
+                yield item
+            if len(page) < page_size:
+                return
+            after = page[-1][1]
+
+    # --- запись (вызывается из пула потоков) ---
+
+    def apply_sync(self, backend: str, upserts: List[Tuple[str, Dict, Dict]], deletes: List[str],
+                   synced_at: float, verified: Iterable[str] = ()) -> None:
+        """
+        Одной транзакцией сохраняет изменения синхронизации backend;
+        verified - дашборды, версия которых проверена и не изменилась
+        """
+        upserts = [entry for entry in upserts if self._invalidated.get(entry[0], (0.0, None))[0] < synced_at]
+        rows = [
+            (uid, backend, summary.get("title", ""), _version(content, summary),
+             json.dumps(summary, ensure_ascii=False), json.dumps(content, ensure_ascii=False), synced_at)
+            for uid, summary, content in upserts
+        ]
+        with self._write_lock:
+            self._writer.execute("BEGIN")
+            try:
+                self._writer.executemany(
+                    "INSERT OR REPLACE INTO dashboards (uid, backend, title, version, summary, content, synced_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                self._writer.executemany("DELETE FROM dashboards WHERE uid = ? AND backend = ?",
+                                         [(uid, backend) for uid in deletes])
+                self._writer.executemany("UPDATE dashboards SET synced_at = ? WHERE uid = ? AND backend = ?",
+                                         [(synced_at, uid, backend) for uid in verified])
+                count = self._writer.execute("SELECT COUNT(*) FROM dashboards WHERE backend = ?",
+                                             (backend,)).fetchone()[0]
+                self._writer.execute(
+                    "INSERT OR REPLACE INTO sync_state (backend, last_sync, dashboards) VALUES (?, ?, ?)",
+                    (backend, synced_at, count))
+                self._writer.execute("COMMIT")
+            except Exception:
+                self._writer.execute("ROLLBACK")
+                raise
+        for uid in [uid for uid, (changed_at, changed_backend) in list(self._invalidated.items())
+                    if changed_at < synced_at and changed_backend in (backend, None)]:
+            self._invalidated.pop(uid, None)
+
+    def invalidate(self, uid: str, backend: Optional[str] = None) -> None:
+        """
+        Удаляет запись после изменения через сервис; следующая синхронизация
+        загрузит ее заново, до нее списки дашбордов backend читаются из Grafana
+        """
+        self._invalidated[uid] = (time.time(), backend or self.backend_of(uid))
+        with self._write_lock:
+            self._writer.execute("DELETE FROM dashboards WHERE uid = ?", (uid,))
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "path": self.path,
+            "entries": self.count(),
+            "max_staleness": self.max_staleness,
+            "sync_age_seconds": {backend: round(now - last_sync, 3)
+                                 for backend, last_sync in self.sync_times().items()},
+            "reads": dict(self.reads),
+        }
+
+
+def _contains_ci(text: Optional[str], needle: str) -> bool:
+    return needle.lower() in (text or "").lower()
+
+
+def _version(content: Dict, summary: Dict) -> int:
+    version = content.get("dashboard", {}).get("version")
+    if version is None:
+        version = summary.get("version", 0)
+    return int(version or 0)
+
+
+async def search_all(service, backend: str) -> List[Dict]:
+    """Все дашборды backend постранично"""
+    summaries = []
+    page = 1
+    while True:
+        result = await service._make_request(
+            "GET", "/api/search", backend=backend,
+            params={"type": "dash-db", "limit": SEARCH_PAGE_SIZE, "page": page})
+        summaries.extend(item for item in result if item.get("uid") and item.get("type", "dash-db") == "dash-db")
+        if len(result) < SEARCH_PAGE_SIZE:
+            return summaries
+        page += 1
+
+
+async def latest_version(service, uid: str, backend: str) -> Optional[int]:
+    """Последняя версия дашборда: поиск Grafana версию не отдает"""
+    versions = await service._make_request(
+        "GET", f"/api/dashboards/uid/{uid}/versions", backend=backend, params={"limit": 1})
+    if isinstance(versions, dict):
+        # Grafana 11+: {"versions": [...], "continueToken": ...}
+        versions = versions.get("versions")
+    return versions[0].get("version") if versions else None
+
+
+class MirrorSync:
+    """Фоновая синхронизация зеркала со всеми backend'ами сервиса"""
+
+    def __init__(self, service, mirror: DashboardMirror, interval: float = 60.0, concurrency: int = 4,
+                 version_checks: int = 500):
+        self.service = service
+        self.mirror = mirror
+        self.interval = interval
+        self.concurrency = concurrency
+        # Запросов версии за проход на backend для дашбордов без версии в поиске
+        self.version_checks = version_checks
+        self.last_result: Dict[str, Dict] = {}
+
+    async def run(self) -> None:
+        """Синхронизация с заданным интервалом до отмены задачи"""
+        while True:
+            await self.sync_once()
+            await asyncio.sleep(self.interval)
+
+    async def sync_once(self) -> Dict[str, Dict]:
+        """Один проход синхронизации всех backend'ов параллельно"""
+        names = list(self.service.backends)
+        results = await asyncio.gather(*(self.sync_backend(name) for name in names), return_exceptions=True)
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.warning("Mirror sync of Grafana backend %s failed: %s", name, result)
+                self.last_result[name] = {"ok": False, "error": str(result)}
+            else:
+                self.last_result[name] = {"ok": True, **result}
+        return self.last_result
+
+    def checks_per_pass(self, dashboards: int) -> int:
+        """
+        Проверок версии за проход: не меньше version_checks и не меньше
+        доли парка, при которой каждый дашборд проверяется за max_staleness
+        """
+        # Один проход в запасе: проход длится дольше паузы между ними
+        passes = max(1, int(self.mirror.max_staleness // max(self.interval, 1e-3)) - 1)
+        return max(self.version_checks, -(-dashboards // passes))
+
+    async def sync_backend(self, backend: str) -> Dict[str, int]:
+        """Инкрементальная синхронизация одного backend"""
+        started = time.time()
+        summaries = await search_all(self.service, backend)
+        known = await asyncio.to_thread(self.mirror.known, backend)
+
+        changed: List[Dict] = []
+        unchecked: List[Dict] = []
+        for item in summaries:
+            entry = known.get(item["uid"])
+            if entry is None or json.dumps(item, ensure_ascii=False) != entry[1]:
+                changed.append(item)
+            elif item.get("version") is not None:
+                # Версия в поиске (прокси, форки Grafana) заменяет отдельный запрос
+                if item["version"] != entry[0]:
+                    changed.append(item)
+            else:
+                unchecked.append(item)
+        unchecked.sort(key=lambda item: known[item["uid"]][2])
+        checked = unchecked[:self.checks_per_pass(len(summaries))]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check(item: Dict) -> bool:
+            async with semaphore:
+                version = await latest_version(self.service, item["uid"], backend)
+            return version is None or version != known[item["uid"]][0]
+
+        # Ошибка проверки (например, дашборд удален после поиска) - повтор в следующий проход
+        results = await asyncio.gather(*(check(item) for item in checked), return_exceptions=True)
+        changed.extend(item for item, is_changed in zip(checked, results) if is_changed is True)
+        verified = [item["uid"] for item, is_changed in zip(checked, results) if is_changed is False]
+
+        async def fetch(item: Dict) -> Tuple[str, Dict, Dict]:
+            async with semaphore:
+                content = await self.service._make_request("GET", f"/api/dashboards/uid/{item['uid']}",
+                                                           backend=backend)
+            return item["uid"], item, content
+
+        fetched = await asyncio.gather(*(fetch(item) for item in changed), return_exceptions=True)
+        upserts = []
+        for item, result in zip(changed, fetched):
+            if isinstance(result, Exception):
+                # Дашборд удален после поиска или недоступен - повтор в следующий проход
+                logger.warning("Mirror sync of %s: failed to load dashboard %s: %s", backend, item["uid"], result)
+            else:
+                upserts.append(result)
+        present = {item["uid"] for item in summaries}
+        deletes = [uid for uid in known if uid not in present]
+        await asyncio.to_thread(self.mirror.apply_sync, backend, upserts, deletes, started, verified)
+        logger.info("Mirror sync of %s: %d dashboards, %d versions checked, %d updated, %d deleted",
+                    backend, len(summaries), len(checked), len(upserts), len(deletes))
+        return {"dashboards": len(summaries), "checked": len(checked), "updated": len(upserts),
+                "deleted": len(deletes)}
@@ -0,0 +1,150 @@
+"""
+Локальная проверка тела дашборда перед сохранением в Grafana.
+
+Режимы:
+    fast   - только структурные инварианты (панели, gridPos, refId целей,
+             переменные шаблонов) обходом словарей без построения моделей;
+    strict - дополнительно типизированные схемы из src.schemas.dashboard,
+             валидаторы которых компилируются pydantic один раз при импорте;
+    off    - без проверки.
+"""
+from typing import Any, Dict, List
+
+from pydantic import ValidationError
+
+from src.schemas.dashboard import DashboardBody
+
+VALIDATION_MODES = ("strict", "fast", "off")
+GRID_COLUMNS = 24
+_GRID_FIELDS = ("h", "w", "x", "y")
+
+
+class DashboardValidationError(ValueError):
+    """Дашборд нарушает структурные инварианты; problems - список всех нарушений"""
+
+    def __init__(self, problems: List[str]):
+        self.problems = problems
+        super().__init__("; ".join(problems))
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _check_grid_pos(grid_pos: Any, where: str, problems: List[str]) -> None:
+    if not isinstance(grid_pos, dict):
+        problems.append(f"{where}.gridPos: must be an object")
+        return
+    for field in _GRID_FIELDS:
+        if not _is_int(grid_pos.get(field)):
+            problems.append(f"{where}.gridPos.{field}: integer is required")
+            return
+    if grid_pos["h"] < 1 or grid_pos["y"] < 0:
+        problems.append(f"{where}.gridPos: h must be positive and y non-negative")
+    if grid_pos["w"] < 1 or grid_pos["x"] < 0 or grid_pos["x"] + grid_pos["w"] > GRID_COLUMNS:
+        problems.append(f"{where}.gridPos: panel must fit into {GRID_COLUMNS} columns")
+
+
+def _check_targets(targets: Any, where: str, problems: List[str]) -> None:
+    if not isinstance(targets, (list, tuple)):
+        problems.append(f"{where}.targets: must be a list")
+        return
+    ref_ids = set()
+    for index, target in enumerate(targets):
+        target_where = f"{where}.targets[{index}]"
+        if not isinstance(target, dict):
+            problems.append(f"{target_where}: must be an object")
+            continue
+        ref_id = target.get("refId")
+        if not isinstance(ref_id, str) or not ref_id:
+            problems.append(f"{target_where}.refId: is required")
+        elif ref_id in ref_ids:
+            problems.append(f"{target_where}.refId: '{ref_id}' is duplicated")
+        else:
+            ref_ids.add(ref_id)
+
+
+def _check_panels(panels: Any, where: str, panel_ids: set, problems: List[str]) -> None:
+    if not isinstance(panels, (list, tuple)):
+        problems.append(f"{where}: must be a list")
+        return
+    for index, panel in enumerate(panels):
+        panel_where = f"{where}[{index}]"
+        if not isinstance(panel, dict):
+            problems.append(f"{panel_where}: must be an object")
+            continue
+        panel_id = panel.get("id")
+        if not _is_int(panel_id):
+            problems.append(f"{panel_where}.id: integer is required")
+        elif panel_id in panel_ids:
+            problems.append(f"{panel_where}.id: {panel_id} is duplicated")
+        else:
+            panel_ids.add(panel_id)
+        if "gridPos" in panel:
+            _check_grid_pos(panel["gridPos"], panel_where, problems)
+        # Ссылка на библиотечную панель ({id, gridPos, libraryPanel}): тип и
+        # цели хранятся в самой библиотечной панели
+        if "libraryPanel" not in panel:
+            if not isinstance(panel.get("type"), str) or not panel["type"]:
+                problems.append(f"{panel_where}.type: is required")
+            if "targets" in panel:
+                _check_targets(panel["targets"], panel_where, problems)
+        if "panels" in panel:
+            _check_panels(panel["panels"], f"{panel_where}.panels", panel_ids, problems)
+
+
+def _check_templating(templating: Any, problems: List[str]) -> None:
+    variables = templating.get("list", []) if isinstance(templating, dict) else None
+    if not isinstance(variables, (list, tuple)):
+        problems.append("templating.list: must be a list")
+        return
+    names = set()
+    for index, variable in enumerate(variables):
+        where = f"templating.list[{index}]"
+        if not isinstance(variable, dict):
+            problems.append(f"{where}: must be an object")
+            continue
+        name = variable.get("name")
+        if not isinstance(name, str) or not name:
+            problems.append(f"{where}.name: is required")
+        elif name in names:
+            problems.append(f"{where}.name: '{name}' is duplicated")
+        else:
+            names.add(name)
+        if not isinstance(variable.get("type"), str) or not variable["type"]:
+            problems.append(f"{where}.type: is required")
+
+
+def check_structure(dashboard: Dict) -> List[str]:
+    """Структурные инварианты дашборда, возвращает список нарушений"""
+    problems: List[str] = []
+    _check_panels(dashboard.get("panels", []), "panels", set(), problems)
+    if dashboard.get("templating") is not None:
+        _check_templating(dashboard["templating"], problems)
+    return problems
+
+
+def _format_error(error: Dict) -> str:
+    location = ".".join(str(part) for part in error["loc"])
+    return f"{location}: {error['msg']}" if location else error["msg"]
+
+
+def validate_dashboard(dashboard: Dict, mode: str = "fast") -> None:
+    """Проверяет дашборд в заданном режиме, при нарушениях бросает DashboardValidationError"""
+    if mode == "off":
+        return
+    if mode not in VALIDATION_MODES:
+        raise ValueError(f"Unknown dashboard validation mode: {mode}")
+
+    problems: List[str] = []
+    if mode == "strict":
+        try:
+            DashboardBody.model_validate(dashboard)
+        except ValidationError as e:
+            problems = [_format_error(error) for error in e.errors()]
+    # Уникальность id панелей и refId схемой не выражается, поэтому структурная
+    # проверка выполняется и в строгом режиме, если схема пройдена
+    if not problems:
+        problems = check_structure(dashboard)
+    if problems:
+        raise DashboardValidationError(problems)
@@ -0,0 +1,144 @@
+"""
+Прореживание рядов для предпросмотра панелей.
+
+Ряды одного запроса лежат на общей сетке времени (start + i * step),
+поэтому пакет рядов обрабатывается как матрица k x n (пропуски - NaN), а
+вычисления идут над массивами сразу для всех рядов. Два метода:
+
+    lttb   - Largest-Triangle-Three-Buckets: в каждой корзине остается точка,
+             образующая наибольший треугольник с соседями, форма графика
+             сохраняется лучше всего
+    minmax - минимум и максимум каждой корзины: сохраняются все пики
+
+numpy - необязательная зависимость и загружается при первом прореживании;
+без нее ряды возвращаются без прореживания.
+"""
+import logging
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax", "none")
+
+_np = None
+_np_missing = False
+
+
+def _numpy():
+    """Модуль numpy или None, если он не установлен"""
+    global _np, _np_missing
+    if _np is None and not _np_missing:
+        try:
+            import numpy
+        except ImportError:
+            _np_missing = True
+            logger.warning("numpy is not installed, panel data is returned without downsampling")
+        else:
+            _np = numpy
+    return _np
+
+
+def _buckets(np, matrix, first: int, count: int, buckets: int):
+    """
+    Столбцы [first, first + count) матрицы, разбитые на buckets корзин почти
+    равного размера: (k, корзины, размер) значений с дополнением NaN и
+    (корзины, размер) индексов столбцов (-1 - дополнение)
+    """
+    edges = first + (np.arange(buckets + 1) * count) // buckets
+    size = int(np.diff(edges).max())
+    positions = edges[:-1, None] + np.arange(size)[None, :]
+    positions = np.where(positions < edges[1:, None], positions, -1)
+    values = matrix[:, positions]
+    values[:, positions < 0] = np.nan
+    return values, positions
+
+
+def minmax_indices(matrix, points: int):
+    """(k, 2 * корзины) индексов минимума и максимума корзин; -1 - точки нет"""
+    np = _numpy()
+    values, positions = _buckets(np, matrix, 0, matrix.shape[1], max(points // 2, 1))
+    missing = np.isnan(values)
+    empty = missing.all(axis=2)
+    low = np.where(missing, np.inf, values).argmin(axis=2)
+    high = np.where(missing, -np.inf, values).argmax(axis=2)
+    first = positions[:, 0][None, :, None]
+    pairs = np.stack((np.minimum(low, high), np.maximum(low, high)), axis=2) + first
+    # Пустые корзины и совпавшие минимум с максимумом дают одну точку или ни одной
+    pairs[:, :, 1] = np.where(low == high, -1, pairs[:, :, 1])
+    pairs[empty] = -1
+    return pairs.reshape(matrix.shape[0], -1)
+
+
+def lttb_indices(matrix, points: int):
+    """(k, points) индексов точек, выбранных LTTB; -1 - точки нет"""
+    np = _numpy()
+    k, n = matrix.shape
+    # Первая и последняя точки сохраняются, середина делится на корзины
+    buckets = min(max(points - 2, 1), n - 2)
+    values, positions = _buckets(np, matrix, 1, n - 2, buckets)
+    positions = positions.astype(float)
+    missing = np.isnan(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Центр каждой корзины (и последней точки) - третья вершина треугольника
+        counts = (~missing).sum(axis=2)
+        centers_y = np.where(missing, 0.0, values).sum(axis=2) / counts
+        centers_x = np.where(missing, 0.0, positions[None]).sum(axis=2) / counts
+    centers_y = np.concatenate((centers_y, matrix[:, -1:]), axis=1)
+    centers_x = np.concatenate((centers_x, np.full((k, 1), n - 1.0)), axis=1)
+
+    selected = np.full((k, buckets + 2), -1)
+    selected[:, 0] = np.where(np.isnan(matrix[:, 0]), -1, 0)
+    selected[:, -1] = np.where(np.isnan(matrix[:, -1]), -1, n - 1)
+    # Вершина предыдущей выбранной точки: первая точка ряда, пока не выбрана другая
+    anchor_x = np.zeros(k)
+    anchor_y = matrix[:, 0].copy()
+    rows = np.arange(k)
+    for bucket in range(buckets):
+        y = values[:, bucket]
+        x = positions[bucket]
+        next_x = centers_x[:, bucket + 1, None]
+        next_y = centers_y[:, bucket + 1, None]
+        # Без вершины или центра следующей корзины площадь не определена:
+        # тогда берется первая существующая точка корзины
+        area = np.abs((anchor_x[:, None] - next_x) * (y - anchor_y[:, None])
+                      - (anchor_x[:, None] - x) * (next_y - anchor_y[:, None]))
+        area = np.where(np.isnan(area), -1.0, area)
+        area = np.where(missing[:, bucket], -2.0, area)
+        best = area.argmax(axis=1)
+        found = ~missing[rows, bucket, best]
+        selected[:, bucket + 1] = np.where(found, x[best], -1)
+        anchor_x = np.where(found, x[best], anchor_x)
+        anchor_y = np.where(found, y[rows, best], anchor_y)
+    return selected
+
+
+def downsample(series: Sequence[Dict[int, float]], start: int, end: int, step: int, points: int,
+               method: str = "lttb") -> Optional[List[List[List]]]:
+    """
+    Прореживает ряды (время -> значение на сетке start..end с шагом step)
+    до points точек, результат - [[время, значение], ...] по рядам.
+    None - прореживание не нужно или недоступно.
+    """
+    n = (end - start) // step + 1
+    if method == "none" or not series or points < 3 or n <= points:
+        return None
+    np = _numpy()
+    if np is None:
+        return None
+
+    matrix = np.full((len(series), n), np.nan)
+    for row, points_map in enumerate(series):
+        if points_map:
+            times = np.fromiter(points_map.keys(), dtype=np.int64, count=len(points_map))
+            matrix[row, (times - start) // step] = np.fromiter(points_map.values(), dtype=float,
+                                                               count=len(points_map))
+    # Бесконечности не отображаются и не участвуют в выборе точек
+    matrix[~np.isfinite(matrix)] = np.nan
+
+    indices = lttb_indices(matrix, points) if method == "lttb" else minmax_indices(matrix, points)
+    result = []
+    for row in range(len(series)):
+        chosen = indices[row][indices[row] >= 0]
+        chosen = chosen[~np.isnan(matrix[row, chosen])]
+        result.append([[t, v] for t, v in zip((start + chosen * step).tolist(), matrix[row, chosen].tolist())])
+    return result
@@ -0,0 +1,243 @@
+"""
+Контентно-адресуемое хранилище экспортов дашбордов.
+
+Экспорт разбивается на части: meta ответа Grafana, тело дашборда без
+панелей и каждая панель верхнего уровня отдельно. Каждая часть хранится
+один раз как gzip-сжатый канонический JSON под своим sha256, поэтому
+одинаковые панели разных дашбордов и версий не дублируются. Экспорт
+описывается манифестом со ссылками на части; манифест, совпадающий с
+последним экспортом того же дашборда, повторно не записывается. Хранилище
+растет вместе с реальными изменениями, а не с числом экспортов.
+
+Раскладка каталога:
+    objects/<2 символа>/<sha256>          - сжатые части
+    manifests/<uid>/<время>-<hash12>.json - манифесты экспортов
+
+Перенос старых полных экспортов (*.json в каталоге exports):
+    python -m src.services.export_store migrate exports
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+MANIFEST_FORMAT = 1
+_GZIP_WBITS = 31
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def canonical_json(value: Any) -> bytes:
+    """Канонический JSON: одинаковое содержимое дает одинаковые байты и хэш"""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _safe_name(value: str) -> str:
+    return _SAFE_NAME.sub("_", value).strip("._") or "dashboard"
+
+
+class ExportStore:
+    def __init__(self, root: str = "exports", compression_level: int = 6):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.manifests_dir = self.root / "manifests"
+        self.compression_level = compression_level
+
+    # --- части ---
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest
+
+    def put_chunk(self, value: Any) -> Tuple[str, bool]:
+        """Сохраняет часть, если ее еще нет; возвращает (хэш, записана ли)"""
+        data = canonical_json(value)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if path.exists():
+            return digest, False
+        compressor = zlib.compressobj(self.compression_level, zlib.DEFLATED, _GZIP_WBITS)
+        self._write_atomic(path, compressor.compress(data) + compressor.flush())
+        return digest, True
+
+    def get_chunk(self, digest: str) -> Any:
+        path = self._object_path(digest)
+        try:
+            data = zlib.decompress(path.read_bytes(), _GZIP_WBITS)
+        except FileNotFoundError:
+            raise KeyError(f"Export chunk {digest} is missing")
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Export chunk {digest} is corrupted")
+        return json.loads(data)
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    # --- экспорты ---
+
+    def save(self, export: Dict) -> Dict:
+        """
+        Сохраняет экспорт в формате ответа Grafana ({"dashboard", "meta"}).
+        Возвращает описание экспорта с его id и числом новых частей.
+        """
+        dashboard = dict(export["dashboard"])
+        panels = dashboard.pop("panels", None)
+        written = 0
+
+        def put(value):
+            nonlocal written
+            digest, is_new = self.put_chunk(value)
+            written += is_new
+            return digest
+
+        chunks = {
+            "meta": put(export.get("meta", {})),
+            "dashboard": put(dashboard),
+            "panels": None if panels is None else [put(panel) for panel in panels],
+        }
+        uid = _safe_name(str(dashboard.get("uid") or dashboard.get("title") or "dashboard"))
+        manifest_hash = hashlib.sha256(canonical_json(chunks)).hexdigest()
+
+        latest = self._latest_manifest(uid)
+        if latest is not None and latest[1]["manifest_hash"] == manifest_hash:
+            return self._describe(uid, latest[0], latest[1], new_chunks=0)
+
+        now = time.time()
+        manifest = {
+            "format": MANIFEST_FORMAT,
+            "uid": dashboard.get("uid"),
+            "title": dashboard.get("title"),
+            "version": dashboard.get("version"),
+            "exported_at": now,
+            "manifest_hash": manifest_hash,
+            "chunks": chunks,
+        }
+        # Время с микросекундами: имена манифестов сортируются в порядке экспорта
+        name = f"{datetime.fromtimestamp(now).strftime('%Y%m%d_%H%M%S_%f')}-{manifest_hash[:12]}.json"
+        self._write_atomic(self.manifests_dir / uid / name,
+                           json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"))
+        return self._describe(uid, name, manifest, new_chunks=written)
+
+    def load(self, export_id: str) -> Dict:
+        """Восстанавливает экспорт в исходном формате ответа Grafana"""
+        manifest = self._read_manifest(export_id)
+        chunks = manifest["chunks"]
+        dashboard = self.get_chunk(chunks["dashboard"])
+        if chunks["panels"] is not None:
+            dashboard["panels"] = [self.get_chunk(digest) for digest in chunks["panels"]]
+        return {"meta": self.get_chunk(chunks["meta"]), "dashboard": dashboard}
+
+    def list(self, uid: Optional[str] = None) -> List[Dict]:
+        """Экспорты (всех дашбордов или одного) от новых к старым"""
+        if uid is not None:
+            directories = [self.manifests_dir / _safe_name(uid)]
+        elif self.manifests_dir.exists():
+            directories = [path for path in self.manifests_dir.iterdir() if path.is_dir()]
+        else:
+            directories = []
+        result = []
+        for directory in directories:
+            if not directory.exists():
+                continue
+            for path in directory.glob("*.json"):
+                manifest = json.loads(path.read_text(encoding="utf-8"))
+                result.append(self._describe(directory.name, path.name, manifest))
+        result.sort(key=lambda item: item["exported_at"], reverse=True)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Число и размер частей и манифестов на диске"""
+        objects = [p for p in self.objects_dir.rglob("*") if p.is_file() and not p.name.startswith(".tmp-")] \
+            if self.objects_dir.exists() else []
+        manifests = list(self.manifests_dir.rglob("*.json")) if self.manifests_dir.exists() else []
+        return {
+            "chunks": len(objects),
+            "chunk_bytes": sum(p.stat().st_size for p in objects),
+            "exports": len(manifests),
+            "manifest_bytes": sum(p.stat().st_size for p in manifests),
+        }
+
+    def _manifest_path(self, export_id: str) -> Path:
+        uid, _, name = export_id.partition("/")
+        if not name or _safe_name(uid) != uid or _safe_name(name) != name:
+            raise KeyError(f"Invalid export id: {export_id}")
+        return self.manifests_dir / uid / name
+
+    def _read_manifest(self, export_id: str) -> Dict:
+        try:
+            manifest = json.loads(self._manifest_path(export_id).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise KeyError(f"Export {export_id} not found")
+        if manifest.get("format") != MANIFEST_FORMAT:
+            raise ValueError(f"Unsupported export manifest format: {manifest.get('format')}")
+        return manifest
+
+    def _latest_manifest(self, uid: str) -> Optional[Tuple[str, Dict]]:
+        directory = self.manifests_dir / uid
+        if not directory.exists():
+            return None
+        names = sorted(path.name for path in directory.glob("*.json"))
+        if not names:
+            return None
+        return names[-1], json.loads((directory / names[-1]).read_text(encoding="utf-8"))
+
+    @staticmethod
+    def _describe(uid: str, name: str, manifest: Dict, new_chunks: Optional[int] = None) -> Dict:
+        description = {
+            "export_id": f"{uid}/{name}",
+            "uid": manifest.get("uid"),
+            "title": manifest.get("title"),
+            "version": manifest.get("version"),
+            "exported_at": manifest.get("exported_at"),
+            "panels": len(manifest["chunks"]["panels"] or []),
+        }
+        if new_chunks is not None:
+            description["new_chunks"] = new_chunks
+        return description
+
+
+def migrate(source_dir: str, store: ExportStore) -> Dict[str, int]:
+    """Переносит полные JSON-экспорты из source_dir в хранилище"""
+    source_bytes = 0
+    migrated = 0
+    for path in sorted(Path(source_dir).glob("*.json")):
+        export = json.loads(path.read_text(encoding="utf-8"))
+        if "dashboard" not in export:
+            continue
+        store.save(export)
+        source_bytes += path.stat().st_size
+        migrated += 1
+    return {"files": migrated, "source_bytes": source_bytes, **store.stats()}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Content-addressed dashboard export store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Import full JSON exports into the store")
+    migrate_parser.add_argument("source_dir")
+    migrate_parser.add_argument("--store", default="exports")
+    args = parser.parse_args(argv)
+
+    result = migrate(args.source_dir, ExportStore(args.store))
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Неизменяемое представление JSON-структур дашбордов.
+
+Закэшированные дашборды хранятся замороженными: словари становятся
+FrozenDict, списки - кортежами. Изменение дашборда делается по принципу
+copy-on-write: копируется только путь до меняемого узла (например,
+верхний словарь и список панелей), остальные узлы разделяются с версией
+в кэше. Поэтому записи кэша безопасно отдавать параллельным запросам, а
+неудачное сохранение не оставляет в кэше испорченный дашборд.
+"""
+from typing import Any
+
+
+class FrozenDict(dict):
+    """dict только для чтения; copy() возвращает обычный изменяемый dict верхнего уровня"""
+
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Cached dashboard data is read-only, copy it before changing")
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    __ior__ = _readonly
+    clear = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    update = _readonly
+
+    def copy(self) -> dict:
+        return dict(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+    def __repr__(self) -> str:
+        return f"FrozenDict({dict.__repr__(self)})"
+
+
+def freeze(value: Any) -> Any:
+    """Рекурсивно замораживает JSON-структуру, уже замороженные узлы не копируются"""
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
@@ -0,0 +1,258 @@
+"""
+Клиент одного экземпляра Grafana.
+
+У каждого backend свой пул соединений httpx, политика повторов, circuit
+breaker, bulkhead и состояние здоровья, поэтому проблемы одной Grafana
+не влияют на запросы к остальным.
+"""
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Dict, Mapping, Optional
+
+import httpx
+
+from config import settings
+from src.observability.metrics import GRAFANA_REQUEST_DURATION, GRAFANA_REQUESTS_TOTAL
+from src.observability.log_pipeline import LazyPayload
+from src.observability.tracing import span
+from src.services.resilience import (
+    Bulkhead,
+    BulkheadFullError,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+# Шаблоны эндпоинтов Grafana для меток метрик (без UID и номеров версий)
+_ENDPOINT_TEMPLATES = [
+    (re.compile(r"^/api/dashboards/uid/[^/]+/versions/[^/]+$"), "/api/dashboards/uid/{uid}/versions/{version}"),
+    (re.compile(r"^/api/dashboards/uid/[^/]+/versions$"), "/api/dashboards/uid/{uid}/versions"),
+    (re.compile(r"^/api/dashboards/uid/[^/]+$"), "/api/dashboards/uid/{uid}"),
+]
+
+def endpoint_template(endpoint: str) -> str:
+    """Шаблон эндпоинта Grafana для меток метрик"""
+    for pattern, template in _ENDPOINT_TEMPLATES:
+        if pattern.match(endpoint):
+            return template
+    return endpoint
+
+# Категория логов на каждый запрос сохранена прежней, чтобы работали настройки log_sampling
+request_logger = logging.getLogger("src.services.grafana_service.requests")
+
+class GrafanaApiError(Exception):
+    pass
+
+class GrafanaUnavailableError(GrafanaApiError):
+    """Grafana недоступна или перегружена, запрос не отправлялся"""
+    pass
+
+class _RetryableError(Exception):
+    """Временная ошибка upstream, после которой запрос можно повторить"""
+    pass
+
+
+class GrafanaBackend:
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        api_key: str = "",
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        retry_attempts: int = 3,
+        retry_backoff_base: float = 0.2,
+        retry_backoff_max: float = 2.0,
+        breaker_failure_threshold: int = 5,
+        breaker_reset_timeout: float = 30.0,
+        max_concurrency: int = 20,
+        bulkhead_timeout: float = 5.0,
+    ):
+        self.name = name
+        self.base_url = url.rstrip("/")
+        self.headers = {
+            "Content-Type": "application/json",
+        }
+        # Пустой ключ дает недопустимый заголовок "Bearer ", поэтому без ключа заголовок не передается
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.retry_policy = RetryPolicy(
+            attempts=retry_attempts,
+            base_delay=retry_backoff_base,
+            max_delay=retry_backoff_max,
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=breaker_failure_threshold,
+            reset_timeout=breaker_reset_timeout,
+        )
+        self.bulkhead = Bulkhead(
+            max_concurrent=max_concurrency,
+            acquire_timeout=bulkhead_timeout,
+        )
+        self.retries_total = 0
+        # Результат последней явной проверки /api/health
+        self.last_health_check: Optional[float] = None
+        self.health_error: Optional[str] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
+
+    @classmethod
+    def from_settings(cls, name: str, config: Mapping[str, Any]) -> "GrafanaBackend":
+        """Backend из секции grafana_backends; незаданные параметры берутся из общих grafana_*"""
+        def option(key, default):
+            value = config.get(key)
+            return value if value is not None else settings.get(f"grafana_{key}", default)
+
+        url = config.get("url")
+        if not url:
+            raise ValueError(f"Grafana backend '{name}' has no url")
+        return cls(
+            name=name,
+            url=url,
+            api_key=config.get("api_key", ""),
+            timeout=option("timeout", 30.0),
+            connect_timeout=option("connect_timeout", 5.0),
+            retry_attempts=option("retry_attempts", 3),
+            retry_backoff_base=option("retry_backoff_base", 0.2),
+            retry_backoff_max=option("retry_backoff_max", 2.0),
+            breaker_failure_threshold=option("breaker_failure_threshold", 5),
+            breaker_reset_timeout=option("breaker_reset_timeout", 30.0),
+            max_concurrency=option("max_concurrency", 20),
+            bulkhead_timeout=option("bulkhead_timeout", 5.0),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Постоянный клиент с пулом соединений, отдельный для каждого event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            limits = httpx.Limits(
+                max_connections=self.bulkhead.max_concurrent,
+                max_keepalive_connections=self.bulkhead.max_concurrent,
+            )
+            self._client = httpx.AsyncClient(base_url=self.base_url, headers=self.headers,
+                                             timeout=self.timeout, limits=limits)
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+
+    @property
+    def healthy(self) -> bool:
+        """Backend принимает запросы и последняя проверка здоровья не завершилась ошибкой"""
+        return self.breaker.state != CircuitBreaker.OPEN and self.health_error is None
+
+    async def check_health(self) -> bool:
+        """Явная проверка /api/health с обновлением состояния здоровья"""
+        try:
+            await self.request("GET", "/api/health")
+            self.health_error = None
+        except GrafanaApiError as e:
+            self.health_error = str(e)
+        self.last_health_check = time.time()
+        return self.health_error is None
+
+    def stats(self) -> Dict:
+        """Состояние повторов, circuit breaker, bulkhead и здоровья"""
+        return {
+            "url": self.base_url,
+            "healthy": self.healthy,
+            "health_error": self.health_error,
+            "last_health_check": self.last_health_check,
+            "retries_total": self.retries_total,
+            "breaker_state": self.breaker.state,
+            "breaker_consecutive_failures": self.breaker.consecutive_failures,
+            "breaker_opened_total": self.breaker.opened_total,
+            "breaker_rejected_total": self.breaker.rejected_total,
+            "bulkhead_in_flight": self.bulkhead.in_flight,
+            "bulkhead_max_concurrent": self.bulkhead.max_concurrent,
+            "bulkhead_rejected_total": self.bulkhead.rejected_total,
+        }
+
+    async def request(self, method: str, endpoint: str, **kwargs) -> Any:
+        """HTTP-запрос к Grafana с повторами идемпотентных методов"""
+        kwargs['timeout'] = self.timeout
+
+        request_logger.debug(
+            "Request to Grafana %s: method=%s, endpoint=%s, params=%s, json=%s",
+            self.name, method, endpoint, kwargs.get('params'), LazyPayload(kwargs.get('json'))
+        )
+
+        # Повторяем только идемпотентные запросы
+        attempts = self.retry_policy.attempts if method.upper() in IDEMPOTENT_METHODS else 1
+        for attempt in range(attempts):
+            try:
+                with span(f"grafana {method} {endpoint_template(endpoint)}", backend=self.name, attempt=attempt + 1):
+                    return await self._send_request(method, endpoint, **kwargs)
+            except _RetryableError as e:
+                if attempt + 1 >= attempts:
+                    raise GrafanaApiError(str(e))
+                delay = self.retry_policy.delay(attempt)
+                self.retries_total += 1
+                request_logger.warning("Retrying %s %s on %s in %.2fs after error: %s",
+                                       method, endpoint, self.name, delay, e)
+                await asyncio.sleep(delay)
+
+    async def _send_request(self, method: str, endpoint: str, **kwargs) -> Any:
+        """Одна попытка запроса через circuit breaker и bulkhead"""
+        try:
+            self.breaker.before_request()
+        except CircuitOpenError as e:
+            raise GrafanaUnavailableError(f"Grafana at {self.base_url} is unavailable: {e}")
+
+        recorded = False
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            async with self.bulkhead:
+                try:
+                    response = await self.client.request(method, endpoint, **kwargs)
+                    outcome = str(response.status_code)
+                    response.raise_for_status()
+                    self.breaker.record_success()
+                    recorded = True
+                    return response.json()
+                except httpx.HTTPStatusError as e:
+                    request_logger.error("HTTP error: %s - %s", e.response.status_code, LazyPayload(e.response.text))
+                    if e.response.status_code in RETRYABLE_STATUS_CODES:
+                        self.breaker.record_failure()
+                        recorded = True
+                        raise _RetryableError(f"API error: {e.response.text}")
+                    # Grafana ответила, ошибка на стороне клиента
+                    self.breaker.record_success()
+                    recorded = True
+                    raise GrafanaApiError(f"API error: {e.response.text}")
+                except httpx.ConnectError:
+                    request_logger.error("Connection error to Grafana at %s", self.base_url)
+                    self.breaker.record_failure()
+                    recorded = True
+                    raise _RetryableError(f"Failed to connect to Grafana at {self.base_url}")
+                except httpx.TimeoutException:
+                    request_logger.error("Timeout while requesting Grafana at %s%s", self.base_url, endpoint)
+                    self.breaker.record_failure()
+                    recorded = True
+                    raise _RetryableError(f"Request to Grafana timed out: {endpoint}")
+                except (GrafanaApiError, _RetryableError):
+                    raise
+                except Exception as e:
+                    request_logger.error("Unexpected error: %s", e)
+                    raise GrafanaApiError(f"Request failed: {str(e)}")
+        except BulkheadFullError as e:
+            outcome = "rejected"
+            raise GrafanaUnavailableError(f"Grafana request rejected: {e}")
+        finally:
+            if not recorded:
+                self.breaker.release()
+            template = endpoint_template(endpoint)
+            GRAFANA_REQUEST_DURATION.labels(self.name, method, template).observe(time.perf_counter() - started)
+            GRAFANA_REQUESTS_TOTAL.labels(self.name, method, template, outcome).inc()
@@ -1,156 +1,595 @@
-from typing import List, Dict, Any, Optional
-import httpx
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple, Union
 import json
+import hashlib
 import asyncio
-from functools import lru_cache
-from datetime import datetime
-from pathlib import Path
+from collections import Counter
 from config import settings
 import logging
 from pydantic import BaseModel, ValidationError
 from os import path
-
-class GrafanaApiError(Exception):
-    pass
+from src.observability.metrics import REGISTRY
+from src.observability.tracing import span, traced
+from src.observability.log_pipeline import LazyPayload
+from src.schemas.dashboard import DashboardCreate
+from src.services.change_events import ChangeEvents
+from src.services.dashboard_cache import DashboardCache
+from src.services.dashboard_mirror import latest_version
+from src.services.dashboard_validator import VALIDATION_MODES, DashboardValidationError, validate_dashboard
+from src.services.export_store import ExportStore
+from src.services.frozen import freeze
+from src.services.grafana_backend import GrafanaApiError, GrafanaBackend
+from src.services.panel_data import PanelDataService, QueryRangeCache, iter_panels
+from src.services.panel_layout import DEFAULT_PANEL_SIZE, compact_panels, place_panel
+from src.services.prometheus import PrometheusClient
+from src.services.query_cost import QueryCostAnalyzer
+from src.services.resilience import CircuitBreaker
+
+# Поля, которые Grafana меняет сама при каждом сохранении и которые
+# не влияют на содержимое дашборда
+VOLATILE_DASHBOARD_FIELDS = ("id", "version", "iteration")
+
+DEFAULT_BACKEND = "default"
+
+logger = logging.getLogger(__name__)
 
 class DashboardSchema(BaseModel):
     dashboard: Dict
     overwrite: bool = False
 
+def build_backends() -> Dict[str, GrafanaBackend]:
+    """Backend'ы из grafana_backends или один backend из grafana_url/grafana_api_key"""
+    configured = settings.get('grafana_backends') or {}
+    if not configured:
+        configured = {DEFAULT_BACKEND: {
+            "url": settings.get('grafana_url', 'http://grafana.localhost:3000'),
+            "api_key": settings.get('grafana_api_key', ''),
+        }}
+    return {str(name).lower(): GrafanaBackend.from_settings(str(name).lower(), config)
+            for name, config in configured.items()}
+
 class GrafanaService:
     def __init__(self):
-        self.base_url = settings.get('grafana_url', 'http://grafana.localhost:3000')  # Исправлен URL
-        self.headers = {
-            "Authorization": f"Bearer {settings.get('grafana_api_key')}",
-            "Content-Type": "application/json",
-        }
-        self._cache = {}
-        self.timeout = httpx.Timeout(30.0)
-
-    async def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict:
-        """Общий метод для выполнения HTTP-запросов с обработкой ошибок"""
-        kwargs['timeout'] = self.timeout
-        
-        logging.debug(f"Request to Grafana: method={method}, endpoint={endpoint}, kwargs={kwargs}")
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.request(
-                    method,
-                    f"{self.base_url}{endpoint}",
-                    headers=self.headers,
-                    **kwargs
-                )
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                logging.error(f"HTTP error: {e.response.status_code} - {e.response.text}")
-                raise GrafanaApiError(f"API error: {e.response.text}")
-            except httpx.ConnectError:
-                logging.error(f"Connection error to Grafana at {self.base_url}")
-                raise GrafanaApiError(f"Failed to connect to Grafana at {self.base_url}")
-            except Exception as e:
-                logging.error(f"Unexpected error: {str(e)}")
-                raise GrafanaApiError(f"Request failed: {str(e)}")
-
-    async def get_dashboards(self, tag: Optional[str] = None, limit: int = 100, search: Optional[str] = None) -> List[Dict]:
-        """Получение списка дашбордов с поддержкой поиска и пагинации"""
+        self.backends = build_backends()
+        self.default_backend = (settings.get('grafana_default_backend') or next(iter(self.backends))).lower()
+        if self.default_backend not in self.backends:
+            raise ValueError(f"grafana_default_backend '{self.default_backend}' is not in grafana_backends")
+        # uid -> имя backend, где найден дашборд
+        self._uid_backends: Dict[str, str] = {}
+        # Локальное зеркало Grafana (DashboardMirror), подключается при mirror_enabled
+        self.mirror = None
+        # Проверка PromQL целей панелей (PromQLValidator), подключается при promql_validation_enabled
+        self.promql = None
+        self._cache = DashboardCache(
+            compressed=settings.get('cache_compression', False),
+            hot_entries=settings.get('cache_hot_entries', 32),
+            compression_level=settings.get('cache_compression_level', 6),
+        )
+        # uid -> {"hash", "id", "url", "version"} последнего известного сохранения
+        self._saved = {}
+        # Число обращений к дашбордам для выбора кандидатов на прогрев кэша
+        self._access_counts = Counter()
+        self.usage_max_entries = settings.get('cache_usage_max_entries', 10000)
+        self.skip_unchanged = settings.get('skip_unchanged_saves', True)
+        self.validation_mode = settings.get('dashboard_validation', 'fast')
+        if self.validation_mode not in VALIDATION_MODES:
+            raise ValueError(f"dashboard_validation must be one of {VALIDATION_MODES}, got {self.validation_mode!r}")
+        # Раскладка панелей: размещение без перекрытий и подъем панелей после удаления
+        self.auto_layout = settings.get('panel_auto_layout', True)
+        self.compact_on_delete = settings.get('panel_compact_on_delete', True)
+        self.export_store = ExportStore(
+            settings.get('export_store_path', 'exports'),
+            compression_level=settings.get('export_compression_level', 6),
+        )
+        # Общий клиент Prometheus: метаданные для проверки PromQL и данные панелей
+        self.prometheus = PrometheusClient.from_settings()
+        self.panel_data = PanelDataService(
+            self.prometheus,
+            QueryRangeCache(
+                max_entries=settings.get('panel_data_cache_entries', 1000),
+                max_points=settings.get('panel_data_cache_max_points', 11000),
+            ),
+            max_points=settings.get('panel_data_max_points', 1000),
+            min_step=settings.get('panel_data_min_step', 15.0),
+            freshness=settings.get('panel_data_freshness', 60.0),
+            downsample_points=settings.get('panel_data_downsample_points', 500),
+            downsample_method=settings.get('panel_data_downsample', 'lttb'),
+            concurrency=settings.get('panel_data_concurrency', 8),
+        )
+        # Оценка стоимости запросов панелей; число рядов - из кэша метаданных (подключается с promql)
+        self.query_cost = QueryCostAnalyzer(
+            self.panel_data, scrape_interval=settings.get('prometheus_scrape_interval', 15.0))
+        # События изменения дашбордов для подписчиков SSE
+        self.events = ChangeEvents(
+            queue_size=settings.get('events_queue_size', 100),
+            replay_size=settings.get('events_replay_size', 1000),
+            heartbeat_interval=settings.get('events_heartbeat_interval', 15.0),
+            version_checks=settings.get('events_poll_version_checks', 100),
+        )
+        self._register_metrics()
+
+    @property
+    def base_url(self) -> str:
+        """URL backend по умолчанию"""
+        return self.backends[self.default_backend].base_url
+
+    def _per_backend(self, value) -> List:
+        return [((name,), value(backend)) for name, backend in self.backends.items()]
+
+    def _register_metrics(self) -> None:
+        """Метрики состояния клиентов Grafana и кэша, вычисляемые при рендере"""
+        REGISTRY.callback("grafana_client_retries_total", "Retried requests to Grafana",
+                          "counter", lambda: self._per_backend(lambda b: b.retries_total), ("backend",))
+        REGISTRY.callback("grafana_client_circuit_open",
+                          "Circuit breaker state (1 = open or half-open, 0 = closed)",
+                          "gauge", lambda: self._per_backend(
+                              lambda b: 0 if b.breaker.state == CircuitBreaker.CLOSED else 1), ("backend",))
+        REGISTRY.callback("grafana_client_circuit_opened_total", "Times the circuit breaker has opened",
+                          "counter", lambda: self._per_backend(lambda b: b.breaker.opened_total), ("backend",))
+        REGISTRY.callback("grafana_client_circuit_rejected_total",
+                          "Requests rejected by the open circuit breaker",
+                          "counter", lambda: self._per_backend(lambda b: b.breaker.rejected_total), ("backend",))
+        REGISTRY.callback("grafana_client_in_flight", "Requests to Grafana currently in flight",
+                          "gauge", lambda: self._per_backend(lambda b: b.bulkhead.in_flight), ("backend",))
+        REGISTRY.callback("grafana_client_bulkhead_rejected_total",
+                          "Requests rejected by the concurrency limit",
+                          "counter", lambda: self._per_backend(lambda b: b.bulkhead.rejected_total), ("backend",))
+        REGISTRY.callback("grafana_backend_healthy", "Grafana backend health (1 = healthy)",
+                          "gauge", lambda: self._per_backend(lambda b: int(b.healthy)), ("backend",))
+        REGISTRY.callback("dashboards_cache_entries", "Dashboards held in the service cache",
+                          "gauge", lambda: len(self._cache))
+        REGISTRY.callback("dashboards_cache_memory_bytes", "Estimated cache memory by tier",
+                          "gauge", self._cache_memory_samples, ("tier",))
+        REGISTRY.callback("dashboards_cache_lookups_total", "Cache lookups by result",
+                          "counter", lambda: [(("hit",), self._cache.hits), (("miss",), self._cache.misses)],
+                          ("result",))
+        REGISTRY.callback("dashboards_saved_hashes", "Dashboards with a recorded content hash",
+                          "gauge", lambda: len(self._saved))
+
+    def _backend(self, name: Optional[str] = None) -> GrafanaBackend:
+        name = (name or self.default_backend).lower()
+        try:
+            return self.backends[name]
+        except KeyError:
+            raise GrafanaApiError(f"Unknown Grafana backend: {name}")
+
+    async def _make_request(self, method: str, endpoint: str, backend: Optional[str] = None, **kwargs) -> Any:
+        """HTTP-запрос к указанному backend (по умолчанию - основному)"""
+        return await self._backend(backend).request(method, endpoint, **kwargs)
+
+    async def _backend_for_uid(self, uid: str) -> str:
+        """Backend, на котором находится дашборд; при промахе карты опрашиваются все backend'ы"""
+        if len(self.backends) == 1:
+            return self.default_backend
+        name = self._uid_backends.get(uid)
+        if name is None and self.mirror is not None:
+            name = await asyncio.to_thread(self.mirror.backend_of, uid)
+        if name is not None:
+            return name
+
+        names = list(self.backends)
+        results = await asyncio.gather(
+            *(self._make_request("GET", "/api/search", backend=n, params={"dashboardUIDs": uid}) for n in names),
+            return_exceptions=True,
+        )
+        for name, result in zip(names, results):
+            if isinstance(result, list) and any(item.get("uid") == uid for item in result):
+                self._uid_backends[uid] = name
+                return name
+        errors = [f"{n}: {r}" for n, r in zip(names, results) if isinstance(r, Exception)]
+        if errors:
+            raise GrafanaApiError(f"Dashboard {uid} not found, unavailable backends: {'; '.join(errors)}")
+        raise GrafanaApiError(f"Dashboard {uid} not found on any Grafana backend")
+
+    async def check_health(self) -> Dict[str, bool]:
+        """Параллельная проверка здоровья всех backend'ов"""
+        names = list(self.backends)
+        results = await asyncio.gather(*(self.backends[n].check_health() for n in names))
+        return dict(zip(names, results))
+
+    async def aclose(self) -> None:
+        """Закрывает пулы соединений всех backend'ов и Prometheus"""
+        for backend in self.backends.values():
+            await backend.aclose()
+        await self.prometheus.aclose()
+
+    def _cache_memory_samples(self) -> List:
+        stats = self._cache.stats()
+        return [(("decoded",), stats["decoded_bytes"]), (("compressed",), stats["compressed_bytes"])]
+
+    def cache_stats(self) -> Dict:
+        """Состояние кэша дашбордов по тирам"""
+        return self._cache.stats()
+
+    def resilience_stats(self) -> Dict:
+        """Состояние повторов, circuit breaker, bulkhead и здоровья по backend'ам"""
+        return {name: backend.stats() for name, backend in self.backends.items()}
+
+    @traced()
+    async def get_dashboards(self, tag: Optional[str] = None, limit: int = 100, search: Optional[str] = None,
+                             backend: Optional[str] = None) -> List[Dict]:
+        """Получение списка дашбордов со всех backend'ов (или одного) с поддержкой поиска и пагинации"""
         params = {"limit": limit}
         if tag:
             params["tag"] = tag
         if search:
             params["query"] = search
-        
-        try:
-            result = await self._make_request("GET", "/api/search", params=params)
-            return [self._parse_dashboard_metadata(item) for item in result]
-        except Exception as e:
-            raise GrafanaApiError(f"Failed to get dashboards: {str(e)}")
 
+        names = [self._backend(backend).name] if backend else list(self.backends)
+        if self.mirror is not None:
+            mirrored = await asyncio.to_thread(self.mirror.search, names, tag, search, limit)
+            if mirrored is not None:
+                return [dict(self._parse_dashboard_metadata(item), backend=item["backend"]) for item in mirrored]
+
+        results = await asyncio.gather(
+            *(self._make_request("GET", "/api/search", backend=name, params=params) for name in names),
+            return_exceptions=True,
+        )
+
+        dashboards = []
+        errors = []
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.warning("Failed to list dashboards on Grafana backend %s: %s", name, result)
+                errors.append(f"{name}: {result}")
+                continue
+            for item in result:
+                metadata = self._parse_dashboard_metadata(item)
+                metadata["backend"] = name
+                if metadata["uid"]:
+                    self._uid_backends.setdefault(metadata["uid"], name)
+                dashboards.append(metadata)
+        # Частичный результат лучше ошибки, если ответил хотя бы один backend
+        if errors and len(errors) == len(names):
+            raise GrafanaApiError(f"Failed to get dashboards: {'; '.join(errors)}")
+
+        if len(names) > 1:
+            dashboards.sort(key=lambda item: item["title"].lower())
+        return dashboards[:limit]
+
+    @traced()
     async def get_dashboard(self, uid: str) -> Dict:
         """Получение полной информации о дашборде"""
         cache_key = f"dashboard_{uid}"
         if cache_key in self._cache:
+            self._count_access(uid)
             return self._cache[cache_key]
 
-        result = await self._make_request("GET", f"/api/dashboards/uid/{uid}")
+        # Свежая копия из локального зеркала избавляет от запроса к Grafana
+        if self.mirror is not None:
+            mirrored = await asyncio.to_thread(self.mirror.get, uid)
+            if mirrored is not None:
+                self._cache[cache_key] = mirrored
+                self._count_access(uid)
+                return mirrored
+
+        # Вызывающий получает тот же замороженный объект, что лежит в кэше
+        backend = await self._backend_for_uid(uid)
+        result = freeze(await self._make_request("GET", f"/api/dashboards/uid/{uid}", backend=backend))
         self._cache[cache_key] = result
+        self._count_access(uid)
         return result
 
-    async def create_dashboard(self, dashboard_data: Dict) -> Dict:
-        """Создание нового дашборда"""
+    def _count_access(self, uid: str) -> None:
+        """Учитывает обращение к существующему дашборду; статистика ограничена usage_max_entries UID"""
+        self._access_counts[uid] += 1
+        if len(self._access_counts) > self.usage_max_entries:
+            # Редкие UID отбрасываются пачкой, а не по одному на каждое обращение
+            self._access_counts = Counter(dict(self._access_counts.most_common(self.usage_max_entries // 2)))
+
+    async def get_dashboard_gzip(self, uid: str) -> Optional[bytes]:
+        """Gzip-сжатый JSON закэшированного дашборда; сжатие выполняется один раз на запись кэша"""
+        cache_key = f"dashboard_{uid}"
+        compressed = self._cache.get_compressed(cache_key)
+        if compressed is not None:
+            return compressed
+        value = self._cache.peek(cache_key)
+        if value is None:
+            return None
+        # Замороженное значение безопасно кодировать и сжимать вне event loop
+        packed = await asyncio.to_thread(self._cache.pack, value)
+        self._cache.attach_compressed(cache_key, value, packed)
+        return packed[0]
+
+    async def warm_up(self, uids: List[str], concurrency: int = 4) -> int:
+        """Фоновая загрузка дашбордов в кэш, возвращает число загруженных"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def load(uid: str) -> bool:
+            async with semaphore:
+                try:
+                    await self.get_dashboard(uid)
+                except GrafanaApiError as e:
+                    logger.warning("Cache warm-up failed for dashboard %s: %s", uid, e)
+                    # Недоступный дашборд больше не предлагается для прогрева
+                    self._access_counts.pop(uid, None)
+                    return False
+                # Прогрев не должен влиять на статистику обращений
+                self._access_counts[uid] -= 1
+                return True
+
+        results = await asyncio.gather(*(load(uid) for uid in uids))
+        return sum(results)
+
+    async def iter_fleet(self, backend: Optional[str] = None, concurrency: int = 8,
+                         known_versions: Optional[Dict[str, Tuple[str, Any]]] = None
+                         ) -> AsyncIterator[Tuple[str, str, Optional[Dict]]]:
+        """
+        (backend, uid, дашборд) всех дашбордов для задач по всему парку: из
+        зеркала, если оно свежее, иначе загрузкой из Grafana параллельно не
+        более чем concurrency запросов (без заполнения кэша). known_versions
+        (uid -> (backend, версия)) - уже обработанные версии: такие дашборды
+        при загрузке из Grafana проверяются запросом последней версии и при
+        совпадении отдаются с дашбордом None, без загрузки содержимого
+        """
+        names = [self._backend(backend).name] if backend else list(self.backends)
+        if self.mirror is not None and await asyncio.to_thread(self.mirror.listing_fresh, names):
+            async for item in self.mirror.iter_dashboards(names):
+                yield item
+            return
+
+        summaries = await self.get_dashboards(limit=5000, backend=backend)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(item: Dict) -> Optional[Tuple[str, str, Optional[Dict]]]:
+            async with semaphore:
+                known = (known_versions or {}).get(item["uid"])
+                if known is not None and known[0] == item["backend"] and known[1] is not None:
+                    try:
+                        if await latest_version(self, item["uid"], item["backend"]) == known[1]:
+                            return item["backend"], item["uid"], None
+                    except GrafanaApiError as e:
+                        # Без истории версий (права, старая Grafana) дашборд загружается целиком
+                        logger.debug("Version check of dashboard %s failed: %s", item["uid"], e)
+                try:
+                    content = await self._make_request("GET", f"/api/dashboards/uid/{item['uid']}",
+                                                       backend=item["backend"])
+                except GrafanaApiError as e:
+                    logger.warning("Failed to load dashboard %s: %s", item["uid"], e)
+                    return None
+                return item["backend"], item["uid"], content
+
+        for future in asyncio.as_completed([fetch(item) for item in summaries if item["uid"]]):
+            result = await future
+            if result is not None:
+                yield result
+
+    async def scan_promql(self, backend: Optional[str] = None, concurrency: int = 8) -> Dict:
+        """Проверка PromQL всех дашбордов парка одним отчетом"""
+        if self.promql is None:
+            raise GrafanaApiError("PromQL validation is disabled")
+        return await self.promql.scan(self.iter_fleet(backend, concurrency), concurrency=concurrency)
+
+    async def analyze_query_cost(self, backend: Optional[str] = None, limit: int = 50, sort: str = "cost",
+                                 concurrency: int = 8) -> Dict:
+        """Рейтинг панелей по оценке стоимости запросов; разбираются только изменившиеся дашборды"""
+        name = self._backend(backend).name if backend else None
+        fleet = self.iter_fleet(name, concurrency, known_versions=self.query_cost.versions())
+        scanned = await self.query_cost.refresh(fleet, name)
+        return {**scanned, **self.query_cost.report(limit, sort, name)}
+
+    def most_used(self, limit: int) -> List[str]:
+        """UID самых запрашиваемых дашбордов"""
+        return [uid for uid, count in self._access_counts.most_common(limit) if count > 0]
+
+    def load_usage(self, filepath: str, limit: int = 100) -> None:
+        """Загрузка статистики обращений (limit самых частых UID), сохраненной предыдущим запуском"""
+        if not path.exists(filepath):
+            return
         try:
-            validated_data = DashboardSchema(**dashboard_data)
-        except ValidationError as e:
-            raise GrafanaApiError(f"Invalid dashboard data: {e}")
+            with open(filepath, 'r', encoding='utf-8') as f:
+                saved = Counter({uid: count for uid, count in json.load(f).items()
+                                 if isinstance(uid, str) and isinstance(count, int) and count > 0})
+            self._access_counts.update(dict(saved.most_common(limit)))
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning("Failed to load dashboard usage from %s: %s", filepath, e)
+
+    def save_usage(self, filepath: str, limit: int = 100) -> None:
+        """Сохранение limit самых частых UID для прогрева при следующем запуске"""
+        try:
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump({uid: count for uid, count in self._access_counts.most_common(limit) if count > 0}, f)
+        except OSError as e:
+            logger.warning("Failed to save dashboard usage to %s: %s", filepath, e)
+
+    def _validate_write(self, dashboard_data: Union[DashboardCreate, DashboardSchema, Dict]) -> Union[DashboardCreate, DashboardSchema]:
+        """Единственная проверка данных записи: уже провалидированная модель не копируется"""
+        if isinstance(dashboard_data, (DashboardCreate, DashboardSchema)):
+            validated = dashboard_data
+        else:
+            try:
+                with span("validate DashboardSchema"):
+                    validated = DashboardSchema.model_validate(dashboard_data)
+            except ValidationError as e:
+                raise GrafanaApiError(f"Invalid dashboard data: {e}")
 
-        if "title" not in dashboard_data["dashboard"]:
+        if "title" not in validated.dashboard:
             raise GrafanaApiError("Field 'title' is required in the dashboard data.")
 
-        logging.debug(f"Dashboard title being returned: {dashboard_data['dashboard']['title']}")
-
-        result = await self._make_request("POST", "/api/dashboards/db", json=validated_data.dict())
+        # Некорректные панели отклоняются локально, без сохранения в Grafana;
+        # проблемы структуры и выражений собираются в один отчет
+        problems = []
+        try:
+            with span("validate dashboard structure", mode=self.validation_mode):
+                validate_dashboard(validated.dashboard, self.validation_mode)
+        except DashboardValidationError as e:
+            problems.extend(e.problems)
+        if self.promql is not None:
+            with span("validate promql"):
+                promql_problems, promql_warnings = self.promql.inspect_dashboard(validated.dashboard)
+            problems.extend(promql_problems)
+            # Неизвестные функции и метрики не блокируют сохранение
+            if promql_warnings:
+                logger.warning("PromQL warnings for dashboard %s: %s",
+                               validated.dashboard.get("uid"), LazyPayload(promql_warnings))
+        if problems:
+            raise GrafanaApiError(f"Invalid dashboard data: {DashboardValidationError(problems)}")
+        return validated
+
+    @staticmethod
+    def _save_payload(validated: Union[DashboardCreate, DashboardSchema]) -> Dict:
+        """Тело запроса сохранения: ссылки на провалидированные данные без model_dump()"""
+        return {"dashboard": validated.dashboard, "overwrite": validated.overwrite}
+
+    @traced()
+    async def create_dashboard(self, dashboard_data: Union[DashboardCreate, Dict], backend: Optional[str] = None) -> Dict:
+        """Создание нового дашборда на указанном backend (по умолчанию - там, где уже есть UID, или основном)"""
+        validated = self._validate_write(dashboard_data)
+        dashboard = validated.dashboard
+
+        logger.debug("Dashboard title being returned: %s", dashboard['title'])
+
+        content_hash = self.content_hash(dashboard)
+        unchanged = self._unchanged_response(dashboard, content_hash)
+        if unchanged is not None:
+            return unchanged
+
+        uid = dashboard.get("uid")
+        if backend is None:
+            backend = self._uid_backends.get(uid, self.default_backend) if uid else self.default_backend
+        backend = self._backend(backend).name
+        result = await self._make_request("POST", "/api/dashboards/db", backend=backend,
+                                          json=self._save_payload(validated))
+        self._uid_backends[result["uid"]] = backend
         
         # Логируем данные для отладки
-        logging.debug(f"Grafana response: {result}")
+        logger.debug("Grafana response: %s", LazyPayload(result))
         
         # Преобразуем ответ Grafana API в формат DashboardResponse
         response_data = {
             "id": result["id"],
             "uid": result["uid"],
-            "title": dashboard_data["dashboard"]["title"],
+            "title": dashboard["title"],
             "url": result["url"],
             "version": result["version"]
         }
-        logging.debug(f"Final response data: {response_data}")
+        self._remember_save(response_data, content_hash)
+        await self._dashboard_changed(response_data["uid"], "dashboard.created", version=response_data["version"])
+        logger.debug("Final response data: %s", response_data)
         return response_data
 
-    async def update_dashboard(self, uid: str, dashboard_data: Dict) -> Dict:
-        """Обновление существующего дашборда"""
+    @traced()
+    async def update_dashboard(self, uid: str, dashboard_data: Union[DashboardCreate, Dict],
+                               change: Optional[Dict] = None) -> Dict:
+        """Обновление существующего дашборда; change - событие для подписчиков ({"event": ..., поля}) вместо dashboard.updated"""
         current = await self.get_dashboard(uid)
-        dashboard_data["dashboard"]["version"] = current["dashboard"]["version"]
-        dashboard_data["dashboard"]["id"] = current["dashboard"]["id"]
-
-        logging.debug(f"Updating dashboard with data: {dashboard_data}")
-
-        try:
-            validated_data = DashboardSchema(**dashboard_data)
-        except ValidationError as e:
-            raise GrafanaApiError(f"Invalid dashboard data: {e}")
-
-        if "title" not in dashboard_data["dashboard"]:
-            raise GrafanaApiError("Field 'title' is required in the dashboard data.")
-
-        result = await self._make_request("POST", "/api/dashboards/db", json=validated_data.dict())
+        validated = self._validate_write(dashboard_data)
+        dashboard = validated.dashboard
+        dashboard["version"] = current["dashboard"]["version"]
+        dashboard["id"] = current["dashboard"]["id"]
+
+        logger.debug("Updating dashboard %s with data: %s", uid, LazyPayload(dashboard))
+
+        content_hash = self.content_hash(dashboard)
+        if self.skip_unchanged and content_hash == self.content_hash(current["dashboard"]):
+            logger.debug("Dashboard %s is unchanged, skipping save", uid)
+            return {
+                "id": current["dashboard"]["id"],
+                "uid": uid,
+                "title": dashboard["title"],
+                "url": current.get("meta", {}).get("url", ""),
+                "version": current["dashboard"]["version"],
+                "unchanged": True
+            }
+
+        result = await self._make_request("POST", "/api/dashboards/db", backend=await self._backend_for_uid(uid),
+                                          json=self._save_payload(validated))
 
         # Преобразуем ответ Grafana API в формат DashboardResponse
-        return {
+        response_data = {
             "id": result["id"],
             "uid": result["uid"],
-            "title": dashboard_data["dashboard"]["title"],
+            "title": dashboard["title"],
             "url": result["url"],
             "version": result["version"]
         }
+        self._remember_save(response_data, content_hash)
+        change = dict(change or {"event": "dashboard.updated"})
+        await self._dashboard_changed(response_data["uid"], change.pop("event"),
+                                      version=response_data["version"], **change)
+        return response_data
 
-    async def export_dashboard(self, uid: str, output_dir: str = "exports") -> str:
-        """Экспорт дашборда в JSON файл"""
-        try:
-            dashboard = await self.get_dashboard(uid)
-            output_dir = Path(output_dir)
-            output_dir.mkdir(exist_ok=True)
-
-            filename = f"{dashboard['dashboard']['title']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            filepath = output_dir / filename
+    @staticmethod
+    def content_hash(dashboard: Dict) -> str:
+        """Канонический хэш содержимого дашборда без id, version и служебных полей"""
+        content = {k: v for k, v in dashboard.items() if k not in VOLATILE_DASHBOARD_FIELDS}
+        canonical = json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _unchanged_response(self, dashboard: Dict, content_hash: str) -> Optional[Dict]:
+        """Ответ для сохранения без изменений или None, если сохранение нужно"""
+        uid = dashboard.get("uid")
+        if not self.skip_unchanged or not uid:
+            return None
+
+        cached = self._cache.get(f"dashboard_{uid}")
+        if cached is not None:
+            if self.content_hash(cached["dashboard"]) != content_hash:
+                return None
+            saved = {
+                "id": cached["dashboard"].get("id"),
+                "url": cached.get("meta", {}).get("url", ""),
+                "version": cached["dashboard"].get("version", 1),
+            }
+        else:
+            saved = self._saved.get(uid)
+            if saved is None or saved["hash"] != content_hash:
+                return None
+
+        logger.debug("Dashboard %s is unchanged, skipping save", uid)
+        return {
+            "id": saved["id"],
+            "uid": uid,
+            "title": dashboard["title"],
+            "url": saved["url"],
+            "version": saved["version"],
+            "unchanged": True
+        }
 
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(dashboard, f, indent=2)
+    async def _dashboard_changed(self, uid: str, event: str, **data: Any) -> None:
+        """
+        Сбрасывает производные данные дашборда, измененного через сервис
+        (зеркало и разбор стоимости), и публикует событие подписчикам
+        """
+        self.query_cost.forget(uid)
+        if self.mirror is not None:
+            backend = self._uid_backends.get(uid) or (self.default_backend if len(self.backends) == 1 else None)
+            await asyncio.to_thread(self.mirror.invalidate, uid, backend)
+        self.events.publish(event, uid, source="service", **data)
+
+    def _remember_save(self, response_data: Dict, content_hash: str) -> None:
+        """Запоминает хэш последнего успешного сохранения дашборда"""
+        self._saved[response_data["uid"]] = {
+            "hash": content_hash,
+            "id": response_data["id"],
+            "url": response_data["url"],
+            "version": response_data["version"],
+        }
+        # Закэшированная копия больше не соответствует Grafana
+        self._cache.pop(f"dashboard_{response_data['uid']}", None)
 
-            return str(filepath)
+    @traced()
+    async def export_dashboard(self, uid: str) -> Dict:
+        """Экспорт дашборда в хранилище экспортов; сохраняются только изменившиеся части"""
+        try:
+            dashboard = await self.get_dashboard(uid)
+            return await asyncio.to_thread(self.export_store.save, dashboard)
         except Exception as e:
-            logging.error(f"Failed to export dashboard {uid}: {e}")
+            logger.error(f"Failed to export dashboard {uid}: {e}")
             raise GrafanaApiError(f"Failed to export dashboard {uid}: {e}")
 
-    async def import_dashboard(self, filepath: str) -> Dict:
+    async def list_exports(self, uid: str) -> List[Dict]:
+        """Экспорты дашборда от новых к старым"""
+        return await asyncio.to_thread(self.export_store.list, uid)
+
+    async def load_export(self, export_id: str) -> Dict:
+        """Экспорт, восстановленный из хранилища в формате ответа Grafana"""
+        try:
+            return await asyncio.to_thread(self.export_store.load, export_id)
+        except (KeyError, ValueError) as e:
+            raise GrafanaApiError(f"Failed to load export {export_id}: {e.args[0]}")
+
+    @traced()
+    async def import_dashboard(self, filepath: str, backend: Optional[str] = None) -> Dict:
         """Импорт дашборда из JSON файла"""
         if not path.exists(filepath):
             raise GrafanaApiError(f"File {filepath} does not exist")
@@ -158,18 +597,22 @@ class GrafanaService:
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
                 dashboard_data = json.load(f)
-            return await self.create_dashboard(dashboard_data)
+            return await self.create_dashboard(dashboard_data, backend=backend)
         except json.JSONDecodeError as e:
-            logging.error(f"Failed to parse JSON from {filepath}: {e}")
+            logger.error(f"Failed to parse JSON from {filepath}: {e}")
             raise GrafanaApiError(f"Invalid JSON format in {filepath}: {e}")
         except Exception as e:
-            logging.error(f"Failed to import dashboard from {filepath}: {e}")
+            logger.error(f"Failed to import dashboard from {filepath}: {e}")
             raise GrafanaApiError(f"Failed to import dashboard from {filepath}: {e}")
 
+    @traced()
     async def compare_versions(self, uid: str, version1: int, version2: int) -> Dict:
         """Сравнение двух версий дашборда"""
-        v1 = await self._make_request("GET", f"/api/dashboards/uid/{uid}/versions/{version1}")
-        v2 = await self._make_request("GET", f"/api/dashboards/uid/{uid}/versions/{version2}")
+        backend = await self._backend_for_uid(uid)
+        v1, v2 = await asyncio.gather(
+            self._make_request("GET", f"/api/dashboards/uid/{uid}/versions/{version1}", backend=backend),
+            self._make_request("GET", f"/api/dashboards/uid/{uid}/versions/{version2}", backend=backend),
+        )
         return {
             "additions": self._compare_dict(v1["dashboard"], v2["dashboard"]),
             "deletions": self._compare_dict(v2["dashboard"], v1["dashboard"])
@@ -221,19 +664,27 @@ class GrafanaService:
         
         return "\n".join(output)
 
+    def _next_panel_id(self, dashboard_data: Dict) -> int:
+        """Генерирует новый ID панели"""
+        return max((p.get("id", 0) for p in dashboard_data.get("panels", [])), default=0) + 1
+
+    @traced()
     async def add_panel(self, dashboard_uid: str, panel_data: Dict) -> Dict:
         """Добавление новой панели на дашборд"""
         dashboard = await self.get_dashboard(dashboard_uid)
+        # Закэшированный дашборд заморожен: копируем только верхний уровень
+        # и список панелей, сами панели разделяются с кэшем
         dashboard_data = dashboard["dashboard"].copy()
         
-        # Генерируем новый ID панели
-        max_id = max([p.get("id", 0) for p in dashboard_data.get("panels", [])], default=0)
-        panel_id = max_id + 1
+        panel_id = self._next_panel_id(dashboard_data)
         panel_data["id"] = panel_id
         
-        # Добавляем панель
-        if "panels" not in dashboard_data:
-            dashboard_data["panels"] = []
+        dashboard_data["panels"] = list(dashboard_data.get("panels", []))
+        if self.auto_layout:
+            panel_data = place_panel(dashboard_data["panels"], panel_data)
+        elif not panel_data.get("gridPos"):
+            w, h = DEFAULT_PANEL_SIZE
+            panel_data["gridPos"] = {"h": h, "w": w, "x": 0, "y": 0}
         dashboard_data["panels"].append(panel_data)
         
         # Обновляем дашборд с сохранением версии и структуры
@@ -243,26 +694,33 @@ class GrafanaService:
             "overwrite": True
         }
         
-        await self.update_dashboard(dashboard_uid, update_data)
+        await self.update_dashboard(dashboard_uid, update_data,
+                                    change={"event": "panel.added", "panel_id": panel_id})
         
         # Очищаем кэш дашборда для обеспечения согласованности данных
         cache_key = f"dashboard_{dashboard_uid}"
         if cache_key in self._cache:
             del self._cache[cache_key]
         
-        # Возвращаем ID созданной панели
-        return {"panel_id": panel_id}
+        # Возвращаем ID и итоговую позицию созданной панели
+        return {"panel_id": panel_id, "gridPos": panel_data["gridPos"]}
 
+    @traced()
     async def update_panel(self, dashboard_uid: str, panel_id: int, panel_data: Dict) -> Dict:
         """Обновление существующей панели"""
         dashboard = await self.get_dashboard(dashboard_uid)
         dashboard_data = dashboard["dashboard"].copy()
         
-        # Ищем и обновляем панель
+        # Заменяем панель в копии списка, остальные панели разделяются с кэшем
+        dashboard_data["panels"] = list(dashboard_data.get("panels", []))
         panel_found = False
         for idx, panel in enumerate(dashboard_data.get("panels", [])):
             if panel.get("id") == panel_id:
                 panel_data["id"] = panel_id  # Сохраняем ID панели
+                if not panel_data.get("gridPos") and panel.get("gridPos"):
+                    panel_data["gridPos"] = panel["gridPos"]
+                if self.auto_layout:
+                    panel_data = place_panel(dashboard_data["panels"], panel_data, exclude_id=panel_id)
                 dashboard_data["panels"][idx] = panel_data
                 panel_found = True
                 break
@@ -277,7 +735,8 @@ class GrafanaService:
             "overwrite": True
         }
         
-        await self.update_dashboard(dashboard_uid, update_data)
+        await self.update_dashboard(dashboard_uid, update_data,
+                                    change={"event": "panel.updated", "panel_id": panel_id})
         
         # Очищаем кэш дашборда для обеспечения согласованности данных
         cache_key = f"dashboard_{dashboard_uid}"
@@ -285,8 +744,9 @@ class GrafanaService:
             del self._cache[cache_key]
         
         # Возвращаем обновленную панель
-        return {"panel_id": panel_id, "updated": True}
+        return {"panel_id": panel_id, "updated": True, "gridPos": panel_data.get("gridPos")}
 
+    @traced()
     async def delete_panel(self, dashboard_uid: str, panel_id: int) -> None:
         """Удаление панели с дашборда"""
         dashboard = await self.get_dashboard(dashboard_uid)
@@ -297,11 +757,13 @@ class GrafanaService:
         if not panel_exists:
             raise GrafanaApiError(f"Panel {panel_id} not found")
         
-        # Удаляем панель
+        # Удаляем панель, собирая новый список из разделяемых с кэшем панелей
         dashboard_data["panels"] = [
             p for p in dashboard_data.get("panels", [])
             if p.get("id") != panel_id
         ]
+        if self.compact_on_delete:
+            dashboard_data["panels"] = compact_panels(dashboard_data["panels"])
         
         # Обновляем дашборд с сохранением версии и структуры
         update_data = {
@@ -310,13 +772,15 @@ class GrafanaService:
             "overwrite": True
         }
         
-        await self.update_dashboard(dashboard_uid, update_data)
+        await self.update_dashboard(dashboard_uid, update_data,
+                                    change={"event": "panel.deleted", "panel_id": panel_id})
         
         # Очищаем кэш дашборда для обеспечения согласованности данных
         cache_key = f"dashboard_{dashboard_uid}"
         if cache_key in self._cache:
             del self._cache[cache_key]
 
+    @traced()
     async def get_panel(self, dashboard_uid: str, panel_id: int) -> Dict:
         """Получение информации о конкретной панели"""
         dashboard = await self.get_dashboard(dashboard_uid)
@@ -328,17 +792,47 @@ class GrafanaService:
                 
         raise GrafanaApiError(f"Panel {panel_id} not found")
 
+    @traced()
+    async def get_panel_data(self, dashboard_uid: str, panel_id: int, time_from: Optional[str] = None,
+                             time_to: Optional[str] = None,
+                             variables: Optional[Dict[str, str]] = None, points: Optional[int] = None) -> Dict:
+        """Данные целей панели из Prometheus за окно (по умолчанию - время дашборда)"""
+        dashboard = (await self.get_dashboard(dashboard_uid))["dashboard"]
+        panel = next((item for item in iter_panels(dashboard.get("panels")) if item.get("id") == panel_id), None)
+        if panel is None:
+            raise GrafanaApiError(f"Panel {panel_id} not found")
+        # Некорректное окно времени - ValueError
+        result = await self.panel_data.panel_data(dashboard, panel, time_from, time_to, variables, points)
+        return {"uid": dashboard_uid, "panel_id": panel_id, **result}
+
+    @traced()
+    async def get_dashboard_data(self, dashboard_uid: str, time_from: Optional[str] = None,
+                                 time_to: Optional[str] = None, variables: Optional[Dict[str, str]] = None,
+                                 points: Optional[int] = None, concurrency: Optional[int] = None) -> Dict:
+        """Данные всех панелей дашборда; одинаковые запросы разных панелей выполняются один раз"""
+        dashboard = (await self.get_dashboard(dashboard_uid))["dashboard"]
+        # Некорректное окно времени - ValueError
+        result = await self.panel_data.dashboard_data(dashboard, time_from, time_to, variables, points, concurrency)
+        return {"uid": dashboard_uid, **result}
+
+    @traced()
     async def delete_dashboard(self, uid: str) -> None:
         """Удаление дашборда по UID"""
         try:
-            await self._make_request("DELETE", f"/api/dashboards/uid/{uid}")
+            backend = await self._backend_for_uid(uid)
+            await self._make_request("DELETE", f"/api/dashboards/uid/{uid}", backend=backend)
+            self._uid_backends.pop(uid, None)
             cache_key = f"dashboard_{uid}"
             if cache_key in self._cache:
                 del self._cache[cache_key]
+            self._saved.pop(uid, None)
+            self._access_counts.pop(uid, None)
+            await self._dashboard_changed(uid, "dashboard.deleted")
         except GrafanaApiError as e:
-            logging.error(f"Failed to delete dashboard {uid}: {e}")
+            logger.error(f"Failed to delete dashboard {uid}: {e}")
             raise
 
+    @traced()
     async def duplicate_dashboard(self, uid: str) -> Dict:
         """Дублирование дашборда"""
         dashboard = await self.get_dashboard(uid)
@@ -346,4 +840,6 @@ class GrafanaService:
         dash_data.pop("id", None)
         dash_data["title"] = f"{dash_data.get('title', '')} (Copy)"
         dash_data["uid"] = None  # Позволяет Grafana сгенерировать новый UID
-        return await self.create_dashboard({"dashboard": dash_data, "overwrite": False})
\ No newline at end of file
+        # Копия создается на том же backend, что и исходный дашборд
+        return await self.create_dashboard({"dashboard": dash_data, "overwrite": False},
+                                           backend=await self._backend_for_uid(uid))
\ No newline at end of file
@@ -0,0 +1,402 @@
+"""
+Данные панелей из Prometheus (query_range) для предпросмотра без Grafana.
+
+Шаг запроса выбирается как у Grafana (диапазон / maxDataPoints, не меньше
+минимального интервала) и округляется до "круглого" значения, а границы
+окна выравниваются по шагу. Поэтому соседние обновления одной панели дают
+одинаковые метки времени, и результаты складываются в кэш по (выражение,
+шаг): при сдвиге окна из Prometheus запрашиваются только недостающие
+отрезки - обычно новый хвост. Точки моложе panel_data_freshness секунд не
+кэшируются: Prometheus еще может их дополнить. Перед ответом ряды
+прореживаются до заданного числа точек (src.services.downsample).
+"""
+import asyncio
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from src.observability.metrics import REGISTRY
+from src.services.downsample import DOWNSAMPLE_METHODS, downsample
+from src.services.prometheus import PrometheusApiError, PrometheusClient
+from src.services.promql_validator import normalize_expr
+
+# Допустимые шаги, секунды: округление вверх до ближайшего дает одинаковый шаг
+# для близких диапазонов и повторное использование кэша
+NICE_STEPS = (1, 2, 5, 10, 15, 20, 30, 60, 120, 300, 600, 900, 1200, 1800, 3600,
+              7200, 10800, 21600, 43200, 86400)
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h|d|w|y)")
+_DURATION_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "y": 31536000}
+_VARIABLE = re.compile(r"\$\{([A-Za-z0-9_]+)(?::[^}]*)?\}|\$([A-Za-z0-9_]+)|\[\[([A-Za-z0-9_]+)(?::[^\]]*)?\]\]")
+# Интервал опроса Prometheus по умолчанию для $__rate_interval, как в Grafana
+DEFAULT_SCRAPE_INTERVAL = 15
+
+
+def parse_duration(text: str) -> float:
+    """Длительность Prometheus/Grafana ("30s", "1h30m", "500ms") в секундах"""
+    text = text.strip()
+    position = 0
+    seconds = 0.0
+    for match in _DURATION.finditer(text):
+        if match.start() != position:
+            break
+        seconds += float(match.group(1)) * _DURATION_SECONDS[match.group(2)]
+        position = match.end()
+    if not text or position != len(text):
+        raise ValueError(f"Invalid duration: {text!r}")
+    return seconds
+
+
+def parse_time(value: Any, now: float) -> float:
+    """Время Grafana ("now", "now-6h") или unix-время в секундах/миллисекундах"""
+    text = str(value).strip()
+    if text == "now":
+        return now
+    if text.startswith("now-"):
+        return now - parse_duration(text[4:])
+    try:
+        timestamp = float(text)
+    except ValueError:
+        raise ValueError(f"Invalid time: {text!r}")
+    # Как в Grafana URL: большие значения - миллисекунды
+    return timestamp / 1000 if timestamp > 1e11 else timestamp
+
+
+def choose_step(start: float, end: float, max_points: int, min_step: float) -> int:
+    """Шаг запроса: не больше max_points точек, не меньше min_step, округлен вверх"""
+    raw = max((end - start) / max(max_points, 1), min_step, 1)
+    for step in NICE_STEPS:
+        if step >= raw:
+            return step
+    return int(math.ceil(raw / 86400)) * 86400
+
+
+def interpolate(expr: str, variables: Mapping[str, str]) -> str:
+    """Подстановка переменных Grafana; неизвестные переменные остаются как есть"""
+    def replace(match):
+        name = match.group(1) or match.group(2) or match.group(3)
+        return variables.get(name, match.group(0))
+
+    return _VARIABLE.sub(replace, expr)
+
+
+def dashboard_variables(dashboard: Mapping) -> Dict[str, str]:
+    """Текущие значения переменных шаблона дашборда; несколько значений - как regex"""
+    variables = {}
+    templating = dashboard.get("templating")
+    for variable in (templating.get("list", ()) if isinstance(templating, Mapping) else ()):
+        if not isinstance(variable, Mapping) or not variable.get("name"):
+            continue
+        current = variable.get("current")
+        value = current.get("value") if isinstance(current, Mapping) else None
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple)):
+            value = "|".join(str(item) for item in value)
+        variables[variable["name"]] = ".*" if value == "$__all" else str(value)
+    return variables
+
+
+def _series_key(metric: Mapping[str, str]) -> Tuple:
+    return tuple(sorted(metric.items()))
+
+
+class _Entry:
+    """Кэш одного (выражение, шаг): покрытый отрезок [start, end] и точки рядов"""
+    __slots__ = ("start", "end", "series")
+
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+        # ключ меток -> (метки, {время: значение})
+        self.series: Dict[Tuple, Tuple[Dict[str, str], Dict[int, float]]] = {}
+
+
+class QueryRangeCache:
+    """Кэш результатов query_range по выровненным по шагу отрезкам (LRU по выражениям)"""
+
+    def __init__(self, max_entries: int = 1000, max_points: int = 11000):
+        self.max_entries = max_entries
+        # Дальше этого числа шагов покрытие не растягивается, старая история отбрасывается
+        self.max_points = max_points
+        self._entries: "OrderedDict[Tuple[str, int], _Entry]" = OrderedDict()
+        self.lookups = {"hit": 0, "partial": 0, "miss": 0}
+        REGISTRY.callback("panel_data_cache_entries", "Query range results held in the panel data cache",
+                          "gauge", lambda: len(self._entries))
+        REGISTRY.callback("panel_data_cache_lookups_total", "Panel data cache lookups by result", "counter",
+                          lambda: [((result,), count) for result, count in self.lookups.items()], ("result",))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def missing(self, expr: str, step: int, start: int, end: int) -> List[Tuple[int, int]]:
+        """Отрезки [start, end], которых нет в кэше"""
+        entry = self._entries.get((expr, step))
+        if entry is None or entry.end + step < start or end + step < entry.start:
+            # Кэша нет или он не пересекается и не примыкает к окну
+            self.lookups["miss"] += 1
+            return [(start, end)]
+        self._entries.move_to_end((expr, step))
+        gaps = []
+        if start < entry.start:
+            gaps.append((start, entry.start - step))
+        if end > entry.end:
+            gaps.append((max(start, entry.end + step), end))
+        self.lookups["partial" if gaps else "hit"] += 1
+        return gaps
+
+    def store(self, expr: str, step: int, start: int, end: int, result: List[Dict]) -> None:
+        """Сохраняет результат запроса отрезка [start, end] (end уже обрезан по свежести)"""
+        if end < start:
+            return
+        key = (expr, step)
+        entry = self._entries.get(key)
+        if entry is None or entry.end + step < start or end + step < entry.start:
+            entry = _Entry(start, end)
+            self._entries[key] = entry
+        else:
+            entry.start = min(entry.start, start)
+            entry.end = max(entry.end, end)
+            if (entry.end - entry.start) // step > self.max_points:
+                self._trim(entry, step, keep_start=start, keep_end=end)
+        self._entries.move_to_end(key)
+        for item in result:
+            metric = item.get("metric", {})
+            _, points = entry.series.setdefault(_series_key(metric), (metric, {}))
+            for timestamp, value in item.get("values", ()):
+                timestamp = int(timestamp)
+                if start <= timestamp <= end:
+                    points[timestamp] = float(value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _trim(self, entry: _Entry, step: int, keep_start: int, keep_end: int) -> None:
+        """
+        Сокращает покрытие до max_points шагов со стороны, противоположной
+        новому отрезку [keep_start, keep_end]: при сдвиге окна вперед
+        отбрасывается старая история, при сдвиге назад - новейшие точки
+        """
+        span = self.max_points * step
+        if keep_end >= entry.end:
+            entry.start = min(keep_start, entry.end - span)
+        else:
+            entry.end = max(keep_end, entry.start + span)
+        for key in list(entry.series):
+            points = entry.series[key][1]
+            for timestamp in [t for t in points if t < entry.start or t > entry.end]:
+                del points[timestamp]
+            if not points:
+                del entry.series[key]
+
+    def series(self, expr: str, step: int, start: int, end: int) -> Dict[Tuple, Tuple[Dict, Dict[int, float]]]:
+        """Закэшированные точки окна [start, end] по рядам"""
+        entry = self._entries.get((expr, step))
+        if entry is None:
+            return {}
+        result = {}
+        for key, (metric, points) in entry.series.items():
+            window = {t: points[t] for t in range(max(start, entry.start), min(end, entry.end) + 1, step)
+                      if t in points}
+            if window:
+                result[key] = (metric, window)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "lookups": dict(self.lookups)}
+
+
+def _json_value(value: float) -> Optional[float]:
+    """NaN и бесконечности в JSON не допускаются"""
+    return value if math.isfinite(value) else None
+
+
+class PanelDataService:
+    def __init__(self, client: PrometheusClient, cache: QueryRangeCache, max_points: int = 1000,
+                 min_step: float = 15.0, freshness: float = 60.0, downsample_points: int = 0,
+                 downsample_method: str = "lttb", concurrency: int = 8):
+        if downsample_method not in DOWNSAMPLE_METHODS:
+            raise ValueError(f"panel_data_downsample must be one of {DOWNSAMPLE_METHODS}, got {downsample_method!r}")
+        self.client = client
+        self.cache = cache
+        self.max_points = max_points
+        self.min_step = min_step
+        self.freshness = freshness
+        # Число точек ряда в ответе; 0 - без прореживания
+        self.downsample_points = downsample_points
+        self.downsample_method = downsample_method
+        # Запросов к Prometheus одновременно при загрузке данных всего дашборда
+        self.concurrency = concurrency
+
+    def _min_step(self, panel: Mapping, target: Mapping) -> float:
+        for interval in (target.get("interval"), panel.get("interval")):
+            if isinstance(interval, str) and interval and "$" not in interval:
+                try:
+                    return parse_duration(interval.lstrip(">"))
+                except ValueError:
+                    pass
+        return self.min_step
+
+    async def query_range(self, expr: str, start: int, end: int, step: int) -> List[Tuple[Dict, Dict[int, float]]]:
+        """Ряды выражения на окне; из Prometheus запрашиваются только отсутствующие в кэше отрезки"""
+        # Записи кэша по нормализованному выражению: разная запись одного запроса - одна запись
+        key = normalize_expr(expr)
+        cacheable_end = int((time.time() - self.freshness) // step) * step
+        gaps = self.cache.missing(key, step, start, min(end, cacheable_end)) if start <= cacheable_end else []
+        if end > cacheable_end:
+            # Свежий хвост запрашивается всегда и в кэш не попадает; примыкающий
+            # недостающий отрезок запрашивается вместе с ним одним запросом
+            if gaps and gaps[-1][1] == cacheable_end:
+                gaps[-1] = (gaps[-1][0], end)
+            else:
+                gaps.append((max(start, cacheable_end + step), end))
+
+        results = await asyncio.gather(*(
+            self.client.query_range(expr, gap_start, gap_end, step) for gap_start, gap_end in gaps))
+
+        volatile: Dict[Tuple, Tuple[Dict, Dict[int, float]]] = {}
+        for (gap_start, gap_end), result in zip(gaps, results):
+            self.cache.store(key, step, gap_start, min(gap_end, cacheable_end), result)
+            if gap_end > cacheable_end:
+                for item in result:
+                    metric = item.get("metric", {})
+                    _, points = volatile.setdefault(_series_key(metric), (metric, {}))
+                    points.update((int(t), float(v)) for t, v in item.get("values", ()) if int(t) > cacheable_end)
+
+        series = self.cache.series(key, step, start, min(end, cacheable_end))
+        for key, (metric, points) in volatile.items():
+            series.setdefault(key, (metric, {}))[1].update(points)
+        return list(series.values())
+
+    async def format_series(self, series: List[Tuple[Dict, Dict[int, float]]], start: int, end: int, step: int,
+                            points: Optional[int] = None) -> Tuple[List[Dict], bool]:
+        """(ряды в формате Prometheus, прорежены ли); прореживание - в пуле потоков"""
+        points = self.downsample_points if points is None else points
+        reduced = None
+        if points and any(len(values) > points for _, values in series):
+            reduced = await asyncio.to_thread(downsample, [values for _, values in series], start, end, step,
+                                              points, self.downsample_method)
+        if reduced is not None:
+            return [{"metric": metric, "values": values} for (metric, _), values in zip(series, reduced)], True
+        return [
+            {"metric": metric, "values": [[t, _json_value(values[t])] for t in sorted(values)]}
+            for metric, values in series
+        ], False
+
+    @staticmethod
+    def window(dashboard: Mapping, time_from: Any, time_to: Any) -> Tuple[float, float]:
+        """Окно запроса; по умолчанию - время дашборда"""
+        now = time.time()
+        dashboard_time = dashboard.get("time") or {}
+        start = parse_time(time_from or dashboard_time.get("from", "now-1h"), now)
+        end = parse_time(time_to or dashboard_time.get("to", "now"), now)
+        if end <= start:
+            raise ValueError("'to' must be after 'from'")
+        return start, end
+
+    def panel_queries(self, panel: Mapping, start: float, end: float,
+                       values: Mapping[str, str]) -> List[Tuple[Mapping, str, int, int, int]]:
+        """(цель, выражение с подставленными переменными, начало, конец, шаг) PromQL-целей панели"""
+        max_points = panel.get("maxDataPoints") or self.max_points
+        queries = []
+        for target in panel.get("targets") or ():
+            if not isinstance(target, Mapping) or target.get("hide") or not target.get("expr"):
+                continue
+            datasource = target.get("datasource") or panel.get("datasource")
+            datasource_type = datasource.get("type") if isinstance(datasource, Mapping) else None
+            if datasource_type not in (None, "prometheus"):
+                continue
+            step = choose_step(start, end, max_points, self._min_step(panel, target))
+            aligned_start = int(start // step) * step
+            aligned_end = int(math.ceil(end / step)) * step
+            rate_interval = max(step + DEFAULT_SCRAPE_INTERVAL, 4 * DEFAULT_SCRAPE_INTERVAL)
+            builtins = {
+                "__interval": f"{step}s", "__interval_ms": str(step * 1000),
+                "__rate_interval": f"{rate_interval}s",
+                "__range": f"{int(end - start)}s", "__range_s": str(int(end - start)),
+                "__range_ms": str(int((end - start) * 1000)),
+            }
+            queries.append((target, interpolate(target["expr"], {**values, **builtins}),
+                            aligned_start, aligned_end, step))
+        return queries
+
+    async def _run_panels(self, dashboard: Mapping, panels: List[Mapping], start: float, end: float,
+                          variables: Optional[Mapping[str, str]], points: Optional[int],
+                          concurrency: int) -> Tuple[List[List[Dict]], Dict[str, int]]:
+        """
+        Цели панелей по группам панелей. Одинаковые после нормализации запросы
+        (выражение, окно, шаг) выполняются один раз, не более concurrency
+        одновременно, и их результат раздается всем целям.
+        """
+        values = dashboard_variables(dashboard)
+        values.update(variables or {})
+        plans = [self.panel_queries(panel, start, end, values) for panel in panels]
+
+        unique: Dict[Tuple, Tuple[str, int, int, int]] = {}
+        for queries in plans:
+            for _, expr, query_start, query_end, step in queries:
+                unique.setdefault((normalize_expr(expr), query_start, query_end, step),
+                                  (expr, query_start, query_end, step))
+
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+        async def run(expr: str, query_start: int, query_end: int, step: int):
+            async with semaphore:
+                try:
+                    series = await self.query_range(expr, query_start, query_end, step)
+                except PrometheusApiError as e:
+                    return e
+                return await self.format_series(series, query_start, query_end, step, points)
+
+        keys = list(unique)
+        results = dict(zip(keys, await asyncio.gather(*(run(*unique[key]) for key in keys))))
+
+        response = []
+        targets = 0
+        for queries in plans:
+            items = []
+            for target, expr, query_start, query_end, step in queries:
+                item = {"refId": target.get("refId"), "expr": expr, "step": step,
+                        "from": query_start, "to": query_end}
+                result = results[(normalize_expr(expr), query_start, query_end, step)]
+                if isinstance(result, PrometheusApiError):
+                    item["error"] = str(result)
+                else:
+                    item["series"], item["downsampled"] = result
+                items.append(item)
+            targets += len(items)
+            response.append(items)
+        return response, {"targets": targets, "queries": len(unique), "duplicates": targets - len(unique)}
+
+    async def panel_data(self, dashboard: Mapping, panel: Mapping, time_from: Any = None, time_to: Any = None,
+                         variables: Optional[Mapping[str, str]] = None,
+                         points: Optional[int] = None) -> Dict[str, Any]:
+        """Данные всех целей панели; цели выполняются параллельно, points - точек на ряд в ответе"""
+        start, end = self.window(dashboard, time_from, time_to)
+        targets, _ = await self._run_panels(dashboard, [panel], start, end, variables, points,
+                                            concurrency=len(panel.get("targets") or ()))
+        return {"from": start, "to": end, "targets": targets[0]}
+
+    async def dashboard_data(self, dashboard: Mapping, time_from: Any = None, time_to: Any = None,
+                             variables: Optional[Mapping[str, str]] = None, points: Optional[int] = None,
+                             concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """Данные всех панелей дашборда с однократным выполнением повторяющихся запросов"""
+        start, end = self.window(dashboard, time_from, time_to)
+        panels = [panel for panel in iter_panels(dashboard.get("panels")) if panel.get("targets")]
+        targets, meta = await self._run_panels(dashboard, panels, start, end, variables, points,
+                                               concurrency or self.concurrency)
+        return {
+            "from": start,
+            "to": end,
+            "panels": [{"id": panel.get("id"), "title": panel.get("title"), "targets": items}
+                       for panel, items in zip(panels, targets)],
+            "meta": {"panels": len(panels), **meta},
+        }
+
+
+def iter_panels(panels: Any) -> Iterator[Mapping]:
+    """Панели дашборда, включая вложенные в свернутые строки"""
+    for panel in panels or ():
+        if isinstance(panel, Mapping):
+            yield panel
+            yield from iter_panels(panel.get("panels"))
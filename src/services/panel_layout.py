@@ -0,0 +1,166 @@
+"""
+Раскладка панелей на 24-колоночной сетке Grafana.
+
+Занятость сетки хранится по строкам: каждая строка - битовая маска из 24
+бит, поэтому проверка, свободна ли область w x h, стоит h операций над
+целыми, а поиск первого свободного места для ширины w проверяет сразу все
+колонки строки. Строки, заполненные целиком, и строки без w свободных
+колонок подряд пропускаются, так что размещение остается быстрым и на
+дашбордах с тысячами панелей.
+
+Панели внутри свернутых строк (type="row", collapsed) на сетке не лежат
+и не учитываются; развернутая строка занимает всю ширину.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.services.dashboard_validator import GRID_COLUMNS
+
+DEFAULT_PANEL_SIZE = (12, 8)
+_FULL_ROW = (1 << GRID_COLUMNS) - 1
+
+
+def _grid_box(panel: Dict) -> Optional[Tuple[int, int, int, int]]:
+    """(x, y, w, h) панели или None, если позиция не задана или некорректна"""
+    grid_pos = panel.get("gridPos")
+    if not isinstance(grid_pos, dict):
+        return None
+    try:
+        x, y, w, h = int(grid_pos["x"]), int(grid_pos["y"]), int(grid_pos["w"]), int(grid_pos["h"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if w < 1 or h < 1:
+        return None
+    w = min(w, GRID_COLUMNS)
+    return min(max(x, 0), GRID_COLUMNS - w), max(y, 0), w, h
+
+
+class GridOccupancy:
+    """Занятость сетки: строка y -> битовая маска занятых колонок"""
+
+    def __init__(self):
+        self.rows: List[int] = []
+        # Все строки выше этой заполнены целиком
+        self._first_open_row = 0
+
+    @classmethod
+    def from_panels(cls, panels: Iterable[Dict], exclude_id: Any = None) -> "GridOccupancy":
+        occupancy = cls()
+        for panel in panels:
+            if exclude_id is not None and panel.get("id") == exclude_id:
+                continue
+            box = _grid_box(panel)
+            if box is not None:
+                occupancy.add(*box)
+        return occupancy
+
+    @staticmethod
+    def _mask(x: int, w: int) -> int:
+        return ((1 << w) - 1) << x
+
+    def _row(self, y: int) -> int:
+        return self.rows[y] if y < len(self.rows) else 0
+
+    def add(self, x: int, y: int, w: int, h: int) -> None:
+        if len(self.rows) < y + h:
+            self.rows.extend([0] * (y + h - len(self.rows)))
+        mask = self._mask(x, w)
+        self.rows[y:y + h] = [row | mask for row in self.rows[y:y + h]]
+        while self._first_open_row < len(self.rows) and self.rows[self._first_open_row] == _FULL_ROW:
+            self._first_open_row += 1
+
+    def remove(self, x: int, y: int, w: int, h: int) -> None:
+        mask = ~self._mask(x, w)
+        self.rows[y:y + h] = [row & mask for row in self.rows[y:y + h]]
+        self._first_open_row = min(self._first_open_row, y)
+
+    def fits(self, x: int, y: int, w: int, h: int) -> bool:
+        if x < 0 or y < 0 or x + w > GRID_COLUMNS:
+            return False
+        mask = self._mask(x, w)
+        return all(not self._row(row) & mask for row in range(y, y + h))
+
+    @staticmethod
+    def _runs(row_mask: int, w: int) -> int:
+        """Биты x, начиная с которых в строке свободно w колонок подряд"""
+        free = ~row_mask & _FULL_ROW
+        runs = free
+        for shift in range(1, w):
+            runs &= free >> shift
+        return runs
+
+    def find_slot(self, w: int, h: int, start_y: int = 0, prefer_x: Optional[int] = None) -> Tuple[int, int]:
+        """Первое сверху свободное место w x h не выше start_y, при равенстве - ближайшее к prefer_x"""
+        w = min(max(w, 1), GRID_COLUMNS)
+        h = max(h, 1)
+        y = max(start_y, self._first_open_row)
+        empty_row_runs = self._runs(0, w)
+        runs_cache: Dict[int, int] = {}
+        while True:
+            candidates = empty_row_runs
+            # Ниже последней занятой строки сетка пуста
+            for row in range(y, min(y + h, len(self.rows))):
+                runs = runs_cache.get(row)
+                if runs is None:
+                    runs = runs_cache[row] = self._runs(self.rows[row], w)
+                if not runs:
+                    # В строке нет w свободных колонок подряд: ни одно окно с ней не подходит
+                    y = row + 1
+                    break
+                candidates &= runs
+                if not candidates:
+                    # Окно со следующей строки может подойти в других колонках
+                    y += 1
+                    break
+            else:
+                return self._pick(candidates, prefer_x), y
+
+    @staticmethod
+    def _pick(candidates: int, prefer_x: Optional[int]) -> int:
+        if prefer_x is None:
+            return (candidates & -candidates).bit_length() - 1
+        return min((x for x in range(GRID_COLUMNS) if candidates >> x & 1),
+                   key=lambda x: (abs(x - prefer_x), x))
+
+
+def _with_grid_pos(panel: Dict, x: int, y: int, w: int, h: int) -> Dict:
+    """Копия панели с новой позицией (панели из кэша заморожены)"""
+    return {**panel, "gridPos": {**(panel.get("gridPos") or {}), "x": x, "y": y, "w": w, "h": h}}
+
+
+def place_panel(panels: List[Dict], panel: Dict, exclude_id: Any = None) -> Dict:
+    """
+    Позиция для новой или измененной панели. Без gridPos панель ставится
+    в первое свободное место сверху; заданная позиция сохраняется, если
+    свободна, иначе панель сдвигается вниз до ближайшего свободного места.
+    """
+    box = _grid_box(panel)
+    occupancy = GridOccupancy.from_panels(panels, exclude_id=exclude_id)
+    if box is None:
+        w, h = DEFAULT_PANEL_SIZE
+        x, y = occupancy.find_slot(w, h)
+    else:
+        x, y, w, h = box
+        if not occupancy.fits(x, y, w, h):
+            x, y = occupancy.find_slot(w, h, start_y=y, prefer_x=x)
+    return _with_grid_pos(panel, x, y, w, h)
+
+
+def compact_panels(panels: List[Dict]) -> List[Dict]:
+    """
+    Поднимает панели вверх на освободившиеся места, сохраняя колонки и
+    порядок сверху вниз. Неизменившиеся панели возвращаются как есть.
+    """
+    boxes = [(box, index) for index, box in enumerate(_grid_box(panel) for panel in panels) if box is not None]
+    boxes.sort(key=lambda item: (item[0][1], item[0][0]))
+    # Нижняя граница уже уложенных панелей по колонкам: панель поднимается
+    # до самой низкой из них под своими колонками. Так же устраняются
+    # исходные перекрытия - панель встает сразу под перекрывающей
+    heights = [0] * GRID_COLUMNS
+    result = list(panels)
+    for (x, _, w, h), index in boxes:
+        new_y = max(heights[x:x + w])
+        heights[x:x + w] = [new_y + h] * w
+        grid_pos = panels[index]["gridPos"]
+        if (grid_pos.get("x"), grid_pos.get("y"), grid_pos.get("w"), grid_pos.get("h")) != (x, new_y, w, h):
+            result[index] = _with_grid_pos(panels[index], x, new_y, w, h)
+    return result
@@ -0,0 +1,176 @@
+"""
+Клиент HTTP API Prometheus и кэш метаданных метрик.
+
+Список имен метрик, их метаданные и число рядов по метрикам (статистика
+TSDB) загружаются целиком и обновляются в фоне, поэтому проверка и оценка
+стоимости выражений панелей не обращаются к Prometheus на каждый дашборд.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, List, Optional
+
+import httpx
+
+from config import settings
+from src.observability.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+class PrometheusApiError(Exception):
+    pass
+
+
+class PrometheusClient:
+    """Постоянный httpx-клиент Prometheus, отдельный для каждого event loop"""
+
+    def __init__(self, url: str, timeout: float = 30.0, connect_timeout: float = 5.0, max_connections: int = 20):
+        self.base_url = url.rstrip("/")
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
+
+    @classmethod
+    def from_settings(cls) -> "PrometheusClient":
+        return cls(
+            settings.get('prometheus_url', 'http://prometheus.localhost:9090'),
+            timeout=settings.get('prometheus_timeout', 30.0),
+            connect_timeout=settings.get('prometheus_connect_timeout', 5.0),
+            max_connections=settings.get('prometheus_max_connections', 20),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            limits = httpx.Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.max_connections)
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits)
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+
+    async def request(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """GET к API Prometheus, возвращает поле data успешного ответа"""
+        try:
+            response = await self.client.get(endpoint, params=params)
+        except httpx.HTTPError as e:
+            raise PrometheusApiError(f"Request to Prometheus at {self.base_url} failed: {e}")
+        try:
+            body = response.json()
+        except ValueError:
+            raise PrometheusApiError(f"Invalid response from Prometheus: HTTP {response.status_code}")
+        if response.status_code >= 400 or body.get("status") != "success":
+            raise PrometheusApiError(f"Prometheus error: {body.get('error', response.text)}")
+        return body["data"]
+
+    async def metric_names(self) -> List[str]:
+        return await self.request("/api/v1/label/__name__/values")
+
+    async def metadata(self) -> Dict[str, List[Dict]]:
+        return await self.request("/api/v1/metadata")
+
+    async def tsdb_status(self, limit: int = 10000) -> Dict[str, Any]:
+        """Статистика TSDB; seriesCountByMetricName - limit метрик с наибольшим числом рядов"""
+        return await self.request("/api/v1/status/tsdb", {"limit": limit})
+
+    async def query_range(self, query: str, start: float, end: float, step: float) -> List[Dict]:
+        """Результат range-запроса (matrix): [{"metric": {...}, "values": [[время, "значение"], ...]}]"""
+        data = await self.request("/api/v1/query_range",
+                                  {"query": query, "start": start, "end": end, "step": step})
+        return data.get("result", [])
+
+
+class MetricMetadataCache:
+    """Имена и метаданные метрик Prometheus с фоновым обновлением"""
+
+    def __init__(self, client: PrometheusClient, refresh_interval: float = 300.0, cardinality_limit: int = 10000):
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.cardinality_limit = cardinality_limit
+        self.names: FrozenSet[str] = frozenset()
+        self.metadata: Dict[str, List[Dict]] = {}
+        # Метрика -> число рядов; список усечен, если Prometheus вернул ровно cardinality_limit метрик
+        self.series_counts: Dict[str, int] = {}
+        self.series_counts_truncated = False
+        # Оценка для метрик вне списка: наименьшее значение усеченного списка, иначе 0
+        self._series_count_floor = 0
+        self.refreshed_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        # Первая буква -> имена; кандидаты для подсказок при опечатках
+        self._by_initial: Dict[str, List[str]] = {}
+        REGISTRY.callback("promql_metadata_metrics", "Metric names in the cached Prometheus metadata",
+                          "gauge", lambda: len(self.names))
+        REGISTRY.callback("promql_metadata_age_seconds", "Seconds since the last metadata refresh",
+                          "gauge", lambda: time.time() - self.refreshed_at if self.refreshed_at else -1)
+
+    @property
+    def loaded(self) -> bool:
+        return self.refreshed_at is not None
+
+    async def refresh(self) -> bool:
+        """Загружает имена, метаданные и число рядов; при ошибке остается прежняя копия"""
+        try:
+            names, metadata, status = await asyncio.gather(
+                self.client.metric_names(), self.client.metadata(), self._tsdb_status())
+        except PrometheusApiError as e:
+            self.last_error = str(e)
+            logger.warning("Failed to refresh Prometheus metric metadata: %s", e)
+            return False
+        if status is not None:
+            counts = status.get("seriesCountByMetricName") or []
+            self.series_counts = {item["name"]: int(item["value"]) for item in counts}
+            self.series_counts_truncated = bool(counts) and len(counts) >= self.cardinality_limit
+            self._series_count_floor = min(self.series_counts.values()) if self.series_counts_truncated else 0
+        by_initial = defaultdict(list)
+        for name in names:
+            by_initial[name[:1]].append(name)
+        self.names = frozenset(names)
+        self.metadata = metadata
+        self._by_initial = dict(by_initial)
+        self.refreshed_at = time.time()
+        self.last_error = None
+        return True
+
+    async def _tsdb_status(self) -> Optional[Dict[str, Any]]:
+        """Статистика TSDB или None: без нее (старый Prometheus) имена и метаданные все равно обновляются"""
+        try:
+            return await self.client.tsdb_status(self.cardinality_limit)
+        except PrometheusApiError as e:
+            logger.warning("Failed to load Prometheus TSDB status: %s", e)
+            return None
+
+    def series_count(self, name: str) -> int:
+        """
+        Число рядов метрики. Статистика TSDB содержит метрики с наибольшим
+        числом рядов, поэтому для отсутствующей в усеченном списке метрики
+        берется наименьшее значение списка (оценка сверху), в полном - 0
+        """
+        return self.series_counts.get(name, self._series_count_floor)
+
+    async def run(self) -> None:
+        """Обновление с заданным интервалом до отмены задачи"""
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.refresh_interval)
+
+    def candidates(self, name: str) -> List[str]:
+        return self._by_initial.get(name[:1], [])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.client.base_url,
+            "metrics": len(self.names),
+            "series_counts": len(self.series_counts),
+            "refreshed_at": self.refreshed_at,
+            "refresh_interval": self.refresh_interval,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,297 @@
+"""
+Проверка PromQL-выражений целей панелей.
+
+Выражение разбирается легким лексером: проверяются парность скобок и
+кавычек, имена функций и агрегаций, а имена метрик сверяются с кэшем
+метаданных Prometheus (MetricMetadataCache). Ошибки синтаксиса блокируют
+сохранение дашборда, неизвестные функции и метрики - только предупреждения:
+кэш метаданных и список функций могут отставать от Prometheus. Метрики
+внутри absent(...)/absent_over_time(...) не проверяются - их отсутствие
+ожидаемо. Переменные Grafana ($var, ${var}, [[var]]) допускаются; имена
+метрик с переменными не проверяются.
+Результат разбора кэшируется по тексту выражения, поэтому повторные
+сохранения и проверка всего парка дашбордов разбирают каждое выражение
+один раз.
+"""
+import asyncio
+import difflib
+import re
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from src.services.prometheus import MetricMetadataCache
+
+FUNCTIONS = frozenset((
+    "abs", "absent", "absent_over_time", "acos", "acosh", "asin", "asinh", "atan", "atanh",
+    "avg_over_time", "ceil", "changes", "clamp", "clamp_max", "clamp_min", "cos", "cosh",
+    "count_over_time", "day_of_month", "day_of_week", "day_of_year", "days_in_month", "deg",
+    "delta", "deriv", "double_exponential_smoothing", "end", "exp", "floor", "histogram_avg",
+    "histogram_count", "histogram_fraction", "histogram_quantile", "histogram_stddev",
+    "histogram_stdvar", "histogram_sum", "holt_winters", "hour", "idelta", "increase", "info",
+    "irate", "label_join", "label_replace", "last_over_time", "ln", "log10", "log2",
+    "mad_over_time", "max_over_time", "min_over_time", "minute", "month", "pi", "predict_linear",
+    "present_over_time", "quantile_over_time", "rad", "rate", "resets", "round", "scalar", "sgn",
+    "sin", "sinh", "sort", "sort_by_label", "sort_by_label_desc", "sort_desc", "sqrt", "start",
+    "stddev_over_time", "stdvar_over_time", "sum_over_time", "tan", "tanh", "time", "timestamp",
+    "vector", "year",
+))
+AGGREGATIONS = frozenset((
+    "avg", "bottomk", "count", "count_values", "group", "limit_ratio", "limitk", "max", "min",
+    "quantile", "stddev", "stdvar", "sum", "topk",
+))
+# Функции, аргумент которых - метрика, которой может не быть
+_ABSENT_FUNCTIONS = frozenset(("absent", "absent_over_time"))
+# После этих слов в скобках идет список меток, а не выражение
+_LABEL_LIST_KEYWORDS = frozenset(("by", "without", "on", "ignoring", "group_left", "group_right"))
+_KEYWORDS = frozenset(("and", "or", "unless", "atan2", "bool", "offset", "inf", "nan")) | _LABEL_LIST_KEYWORDS
+
+_VARIABLE = re.compile(r"\$\{[^}]*\}|\$[A-Za-z_][A-Za-z0-9_]*|\[\[[^\]]*\]\]")
+# Подстановка вместо переменной: в имени метрики помечает его как непроверяемое
+_VARIABLE_MARK = "\x00"
+_TOKEN = re.compile(r"""
+    (?P<space>\s+|\#[^\n]*)
+  | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|`[^`]*`)
+  | (?P<number>0[xX][0-9a-fA-F]+|(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?[a-zA-Z]*)
+  | (?P<ident>[A-Za-z_:\x00][A-Za-z0-9_:\x00]*)
+  | (?P<quote>["'`])
+  | (?P<open>[(\[{])
+  | (?P<close>[)\]}])
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+_PAIRS = {")": "(", "]": "[", "}": "{"}
+
+# Типы источников данных с PromQL; цели других источников (Loki и т.п.) не проверяются
+PROMQL_DATASOURCE_TYPES = frozenset(("prometheus",))
+
+
+class ParsedExpr(NamedTuple):
+    # Все имена метрик выражения (для оценки стоимости и т.п.)
+    metrics: Tuple[str, ...]
+    # Синтаксические ошибки
+    problems: Tuple[str, ...]
+    # Неизвестные функции
+    warnings: Tuple[str, ...]
+    # Метрики, встречающиеся только внутри absent(...)/absent_over_time(...)
+    absent_metrics: Tuple[str, ...]
+
+
+@lru_cache(maxsize=65536)
+def parse_expr(expr: str) -> ParsedExpr:
+    """Имена метрик, синтаксические проблемы и предупреждения выражения"""
+    text = _VARIABLE.sub(_VARIABLE_MARK, expr)
+    tokens = []
+    problems = []
+    position = 0
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match.lastgroup == "quote":
+            # Кавычка, для которой не нашлось закрывающей
+            problems.append(f"unterminated string at position {position}")
+            break
+        position = match.end()
+        if match.lastgroup != "space":
+            tokens.append((match.lastgroup, match.group()))
+
+    metrics = []
+    present = set()
+    warnings = []
+    stack: List[str] = []
+    # Глубина стека, на которой начался список меток после by/without/...
+    label_list_depth: Optional[int] = None
+    # Глубина стека, на которой начался аргумент absent(...)
+    absent_depth: Optional[int] = None
+    for index, (kind, value) in enumerate(tokens):
+        next_value = tokens[index + 1][1] if index + 1 < len(tokens) else None
+        if kind == "open":
+            if label_list_depth is None and value == "(" and index > 0 and tokens[index - 1][1] in _LABEL_LIST_KEYWORDS:
+                label_list_depth = len(stack)
+            if absent_depth is None and value == "(" and index > 0 and tokens[index - 1][1] in _ABSENT_FUNCTIONS:
+                absent_depth = len(stack)
+            stack.append(value)
+        elif kind == "close":
+            if not stack or stack[-1] != _PAIRS[value]:
+                problems.append(f"unexpected '{value}'")
+                break
+            stack.pop()
+            if label_list_depth is not None and len(stack) == label_list_depth:
+                label_list_depth = None
+            if absent_depth is not None and len(stack) == absent_depth:
+                absent_depth = None
+        elif kind == "ident":
+            # Метки в {...}, длительности в [...] и списки меток не являются метриками
+            if label_list_depth is not None or (stack and stack[-1] in "{["):
+                continue
+            if value in _KEYWORDS or value.lower() in ("inf", "nan"):
+                continue
+            if value in AGGREGATIONS:
+                continue
+            if next_value == "(":
+                if _VARIABLE_MARK not in value and value not in FUNCTIONS:
+                    warnings.append(f"unknown function '{value}'")
+                continue
+            if _VARIABLE_MARK not in value:
+                metrics.append(value)
+                if absent_depth is None:
+                    present.add(value)
+    else:
+        for bracket in reversed(stack):
+            problems.append(f"unclosed '{bracket}'")
+    metrics = list(dict.fromkeys(metrics))
+    return ParsedExpr(tuple(metrics), tuple(problems), tuple(dict.fromkeys(warnings)),
+                      tuple(name for name in metrics if name not in present))
+
+
+@lru_cache(maxsize=65536)
+def normalize_expr(expr: str) -> str:
+    """
+    Каноническая запись выражения: без лишних пробелов и комментариев, с
+    отсортированными матчерами меток. Выражения, отличающиеся только
+    записью, дают одну строку; некорректное выражение возвращается как есть.
+    """
+    tokens = []
+    position = 0
+    while position < len(expr):
+        match = _TOKEN.match(expr, position)
+        if match.lastgroup == "quote":
+            return expr
+        position = match.end()
+        if match.lastgroup != "space":
+            tokens.append((match.lastgroup, match.group()))
+
+    parts: List[str] = []
+    index = 0
+    while index < len(tokens):
+        kind, value = tokens[index]
+        if value == "{":
+            # Матчеры до закрывающей скобки: name op "value", через запятую
+            end = next((i for i in range(index + 1, len(tokens)) if tokens[i][1] == "}"), None)
+            if end is None:
+                return expr
+            matchers, current = [], []
+            for _, item in tokens[index + 1:end]:
+                if item == ",":
+                    matchers.append("".join(current))
+                    current = []
+                else:
+                    current.append(item)
+            matchers.append("".join(current))
+            parts.append("{" + ",".join(sorted(m for m in matchers if m)) + "}")
+            index = end + 1
+            continue
+        # Пробел нужен только между словами: "sum by", "a and b", "offset 5m"
+        if parts and kind in ("ident", "number") and (parts[-1][-1:].isalnum() or parts[-1][-1:] in "_:"):
+            parts.append(" ")
+        parts.append(value)
+        index += 1
+    return "".join(parts)
+
+
+def iter_expressions(dashboard: Dict) -> Iterator[Tuple[str, str]]:
+    """(путь, выражение) PromQL-целей всех панелей, включая вложенные в строки"""
+    for where, panel_index, target_index, expr in _walk_targets(dashboard.get("panels", []), "panels", None):
+        yield f"{where}[{panel_index}].targets[{target_index}].expr", expr
+
+
+def _walk_targets(panels: Any, where: str, inherited: Optional[str]) -> Iterator[Tuple[str, int, int, str]]:
+    """(путь к списку панелей, индекс панели, индекс цели, выражение); путь собирается только при ошибке"""
+    if not isinstance(panels, (list, tuple)):
+        return
+    for index, panel in enumerate(panels):
+        if not isinstance(panel, dict):
+            continue
+        datasource = panel.get("datasource")
+        panel_type = datasource.get("type") if isinstance(datasource, dict) else None
+        panel_type = panel_type or inherited
+        for target_index, target in enumerate(panel.get("targets") or ()):
+            if not isinstance(target, dict):
+                continue
+            expr = target.get("expr")
+            if not isinstance(expr, str) or not expr.strip():
+                continue
+            datasource = target.get("datasource")
+            target_type = (datasource.get("type") if isinstance(datasource, dict) else None) or panel_type
+            if target_type is not None and target_type not in PROMQL_DATASOURCE_TYPES:
+                continue
+            yield where, index, target_index, expr
+        if "panels" in panel:
+            yield from _walk_targets(panel["panels"], f"{where}[{index}].panels", panel_type)
+
+
+class PromQLValidator:
+    def __init__(self, metadata: Optional[MetricMetadataCache] = None):
+        self.metadata = metadata
+
+    def _suggest(self, name: str) -> Optional[str]:
+        matches = difflib.get_close_matches(name, self.metadata.candidates(name), n=1, cutoff=0.8)
+        return matches[0] if matches else None
+
+    def check_expr(self, expr: str) -> Tuple[List[str], List[str]]:
+        """(ошибки, предупреждения) одного выражения"""
+        parsed = parse_expr(expr)
+        warnings = list(parsed.warnings)
+        # Без загруженных метаданных проверяется только синтаксис
+        if self.metadata is not None and self.metadata.loaded:
+            names = self.metadata.names
+            for name in parsed.metrics:
+                if name not in names and name not in parsed.absent_metrics:
+                    suggestion = self._suggest(name)
+                    hint = f", did you mean '{suggestion}'?" if suggestion else ""
+                    warnings.append(f"unknown metric '{name}'{hint}")
+        return list(parsed.problems), warnings
+
+    def inspect_dashboard(self, dashboard: Dict) -> Tuple[List[str], List[str]]:
+        """(ошибки, предупреждения) PromQL дашборда"""
+        problems: List[str] = []
+        warnings: List[str] = []
+        for where, panel_index, target_index, expr in _walk_targets(dashboard.get("panels", []), "panels", None):
+            expr_problems, expr_warnings = self.check_expr(expr)
+            if expr_problems or expr_warnings:
+                prefix = f"{where}[{panel_index}].targets[{target_index}].expr"
+                problems.extend(f"{prefix}: {problem}" for problem in expr_problems)
+                warnings.extend(f"{prefix}: {warning}" for warning in expr_warnings)
+        return problems, warnings
+
+    def check_dashboard(self, dashboard: Dict) -> List[str]:
+        """Ошибки PromQL дашборда, блокирующие сохранение"""
+        return self.inspect_dashboard(dashboard)[0]
+
+    async def scan(self, dashboards: Union[Iterable, AsyncIterator], concurrency: int = 8) -> Dict[str, Any]:
+        """
+        Проверка парка дашбордов: dashboards - итератор (backend, uid, дашборд
+        в формате ответа Grafana). Разбор выполняется в пуле потоков не более
+        чем concurrency дашбордов одновременно, чтобы не блокировать event loop.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        report: Dict[str, Dict] = {}
+        checked = 0
+
+        async def check(backend: str, uid: str, content: Dict) -> None:
+            nonlocal checked
+            try:
+                dashboard = content.get("dashboard", content)
+                problems, warnings = await asyncio.to_thread(self.inspect_dashboard, dashboard)
+                checked += 1
+                if problems or warnings:
+                    report[uid] = {"backend": backend, "title": dashboard.get("title"),
+                                   "problems": problems, "warnings": warnings}
+            finally:
+                semaphore.release()
+
+        tasks = []
+        if hasattr(dashboards, "__aiter__"):
+            async for backend, uid, content in dashboards:
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(check(backend, uid, content)))
+        else:
+            for backend, uid, content in dashboards:
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(check(backend, uid, content)))
+        await asyncio.gather(*tasks)
+        return {
+            "dashboards": checked,
+            "with_problems": sum(1 for item in report.values() if item["problems"]),
+            "problems": sum(len(item["problems"]) for item in report.values()),
+            "warnings": sum(len(item["warnings"]) for item in report.values()),
+            "metadata_loaded": self.metadata is not None and self.metadata.loaded,
+            "report": report,
+        }
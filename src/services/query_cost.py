@@ -0,0 +1,198 @@
+"""
+Оценка стоимости запросов панелей для поиска самых дорогих.
+
+Стоимость цели - оценка числа сэмплов, которые Prometheus читает при одной
+загрузке панели:
+
+    ряды метрик выражения x точки (диапазон / шаг) x сэмплов на точку
+
+Число рядов берется из кэшированной статистики TSDB (MetricMetadataCache;
+матчеры меток не учитываются, это оценка сверху). Диапазон и шаг те же,
+что при загрузке данных панели (время дашборда, maxDataPoints, интервал).
+Сэмплов на точку - окно range-селектора ([5m]) на интервал опроса.
+hourly_cost дополнительно учитывает автообновление дашборда (refresh).
+
+Разбор выражений выполняется для дашборда один раз на версию: повторный
+анализ пересчитывает только изменившиеся дашборды, а изменения через
+сервис сбрасывают запись сразу. Без зеркала содержимое загружается из
+Grafana только для новых дашбордов и дашбордов с изменившейся версией
+(версия проверяется запросом истории версий, поиск Grafana ее не
+отдает). Число рядов подставляется при построении отчета, поэтому
+обновление статистики TSDB не требует нового разбора.
+"""
+import asyncio
+import re
+from typing import Any, AsyncIterator, Dict, NamedTuple, Optional, Tuple
+
+from src.services.panel_data import (
+    DEFAULT_SCRAPE_INTERVAL,
+    PanelDataService,
+    dashboard_variables,
+    iter_panels,
+    parse_duration,
+)
+from src.services.prometheus import MetricMetadataCache
+from src.services.promql_validator import parse_expr
+
+COST_SORT_KEYS = ("cost", "hourly_cost")
+# Окно range-селектора или подзапроса: [5m], [1h:1m]
+_RANGE = re.compile(r"\[\s*([0-9][0-9a-z.]*)\s*(?::[^\]]*)?\]")
+
+
+class TargetProfile(NamedTuple):
+    """Разобранная цель панели; стоимость - при построении отчета"""
+    ref_id: Optional[str]
+    expr: str
+    metrics: Tuple[str, ...]
+    step: int
+    points: int
+    samples_per_point: float
+
+
+def _seconds(value: Any) -> Optional[float]:
+    try:
+        return parse_duration(value) if isinstance(value, str) and value else None
+    except ValueError:
+        return None
+
+
+class QueryCostAnalyzer:
+    def __init__(self, panel_data: PanelDataService, metadata: Optional[MetricMetadataCache] = None,
+                 scrape_interval: float = DEFAULT_SCRAPE_INTERVAL):
+        self.panel_data = panel_data
+        # Кэш метаданных с числом рядов, подключается вместе с проверкой PromQL
+        self.metadata = metadata
+        self.scrape_interval = scrape_interval
+        # uid -> {"backend", "version", "title", "loads_per_hour", "panels": [(id, title, [TargetProfile])]}
+        self._dashboards: Dict[str, Dict] = {}
+        self.analyzed_total = 0
+
+    def __len__(self) -> int:
+        return len(self._dashboards)
+
+    def versions(self) -> Dict[str, Tuple[str, Any]]:
+        """uid -> (backend, версия) разобранных дашбордов"""
+        return {uid: (entry["backend"], entry["version"]) for uid, entry in self._dashboards.items()}
+
+    def forget(self, uid: str) -> None:
+        """Сбрасывает разбор дашборда, измененного или удаленного через сервис"""
+        self._dashboards.pop(uid, None)
+
+    def _is_current(self, backend: str, uid: str, dashboard: Dict) -> bool:
+        entry = self._dashboards.get(uid)
+        version = dashboard.get("version")
+        return entry is not None and version is not None and entry["version"] == version \
+            and entry["backend"] == backend
+
+    def update(self, backend: str, uid: str, content: Dict) -> bool:
+        """Разбирает дашборд (в формате ответа Grafana), если его версия изменилась"""
+        dashboard = content.get("dashboard", content)
+        if self._is_current(backend, uid, dashboard):
+            return False
+        self._dashboards[uid] = self._analyze(backend, dashboard)
+        self.analyzed_total += 1
+        return True
+
+    def _analyze(self, backend: str, dashboard: Dict) -> Dict:
+        start, end = self.panel_data.window(dashboard, None, None)
+        values = dashboard_variables(dashboard)
+        panels = []
+        for panel in iter_panels(dashboard.get("panels")):
+            targets = []
+            for target, expr, query_start, query_end, step in self.panel_data.panel_queries(panel, start, end, values):
+                windows = [_seconds(match.group(1)) or 0.0 for match in _RANGE.finditer(expr)]
+                targets.append(TargetProfile(
+                    ref_id=target.get("refId"),
+                    expr=expr,
+                    metrics=parse_expr(expr)[0],
+                    step=step,
+                    points=(query_end - query_start) // step + 1,
+                    samples_per_point=max(1.0, max(windows, default=0.0) / self.scrape_interval),
+                ))
+            if targets:
+                panels.append((panel.get("id"), panel.get("title"), targets))
+        refresh = _seconds(dashboard.get("refresh"))
+        return {
+            "backend": backend,
+            "version": dashboard.get("version"),
+            "title": dashboard.get("title"),
+            # Без автообновления дашборд считается загружаемым раз в час
+            "loads_per_hour": 3600.0 / refresh if refresh else 1.0,
+            "panels": panels,
+        }
+
+    async def refresh(self, fleet: AsyncIterator[Tuple[str, str, Optional[Dict]]],
+                      backend: Optional[str] = None) -> Dict[str, int]:
+        """
+        Обновляет разбор по парку дашбордов; дашборд None - версия не
+        изменилась (см. GrafanaService.iter_fleet). Дашборды, которых больше
+        нет, удаляются
+        """
+        seen = set()
+        analyzed = 0
+        async for item_backend, uid, content in fleet:
+            seen.add(uid)
+            if content is None:
+                continue
+            dashboard = content.get("dashboard", content)
+            if self._is_current(item_backend, uid, dashboard):
+                continue
+            # Разбор - в пуле потоков, запись в словарь - в event loop: параллельный
+            # отчет обходит словарь, не ожидая изменения его размера
+            self._dashboards[uid] = await asyncio.to_thread(self._analyze, item_backend, dashboard)
+            self.analyzed_total += 1
+            analyzed += 1
+        removed = [uid for uid, entry in self._dashboards.items()
+                   if uid not in seen and (backend is None or entry["backend"] == backend)]
+        for uid in removed:
+            del self._dashboards[uid]
+        return {"scanned": len(seen), "analyzed": analyzed, "removed": len(removed)}
+
+    @property
+    def cardinality_loaded(self) -> bool:
+        return self.metadata is not None and bool(self.metadata.series_counts)
+
+    def report(self, limit: int = 50, sort: str = "cost", backend: Optional[str] = None) -> Dict[str, Any]:
+        """Панели по убыванию стоимости с долей от общей стоимости"""
+        if sort not in COST_SORT_KEYS:
+            raise ValueError(f"sort must be one of {COST_SORT_KEYS}, got {sort!r}")
+        # Без статистики TSDB каждая метрика считается одним рядом: остается относительная оценка
+        series_count = self.metadata.series_count if self.cardinality_loaded else (lambda name: 1)
+        series: Dict[str, int] = {}
+
+        ranking = []
+        for uid, entry in self._dashboards.items():
+            if backend is not None and entry["backend"] != backend:
+                continue
+            for panel_id, panel_title, targets in entry["panels"]:
+                items = []
+                for target in targets:
+                    metrics = {}
+                    for name in target.metrics:
+                        if name not in series:
+                            series[name] = series_count(name)
+                        metrics[name] = series[name]
+                    cost = sum(metrics.values()) * target.points * target.samples_per_point
+                    items.append({"refId": target.ref_id, "expr": target.expr, "metrics": metrics,
+                                  "step": target.step, "points": target.points,
+                                  "samples_per_point": target.samples_per_point, "cost": cost})
+                cost = sum(item["cost"] for item in items)
+                ranking.append({
+                    "uid": uid, "backend": entry["backend"], "dashboard": entry["title"],
+                    "panel_id": panel_id, "panel": panel_title,
+                    "cost": cost, "hourly_cost": cost * entry["loads_per_hour"], "targets": items,
+                })
+
+        totals = {key: sum(item[key] for item in ranking) for key in COST_SORT_KEYS}
+        ranking.sort(key=lambda item: item[sort], reverse=True)
+        for item in ranking[:limit]:
+            item["share"] = item[sort] / totals[sort] if totals[sort] else 0.0
+        return {
+            "dashboards": len({item["uid"] for item in ranking}),
+            "panels": len(ranking),
+            "total_cost": totals["cost"],
+            "total_hourly_cost": totals["hourly_cost"],
+            "cardinality_loaded": self.cardinality_loaded,
+            "sort": sort,
+            "ranking": ranking[:limit],
+        }
@@ -0,0 +1,107 @@
+import asyncio
+import random
+import time
+
+
+class CircuitOpenError(Exception):
+    """Запрос отклонен: circuit breaker разомкнут"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuit breaker is open, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class BulkheadFullError(Exception):
+    """Запрос отклонен: исчерпан лимит одновременных запросов"""
+
+
+class RetryPolicy:
+    """Повторы с экспоненциальной задержкой и полным джиттером"""
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.2, max_delay: float = 2.0):
+        self.attempts = max(1, int(attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Задержка перед повтором номер attempt (с нуля)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Размыкается после серии отказов подряд и пропускает пробный запрос по таймауту"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_total = 0
+        self.rejected_total = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_request(self) -> None:
+        """Проверка перед запросом, выбрасывает CircuitOpenError при разомкнутой цепи"""
+        if self.state == self.OPEN:
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed < self.reset_timeout:
+                self.rejected_total += 1
+                raise CircuitOpenError(self.reset_timeout - elapsed)
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected_total += 1
+                raise CircuitOpenError(self.reset_timeout)
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened_total += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Снимает пробный запрос без результата (например, при отмене)"""
+        self._probe_in_flight = False
+
+
+class Bulkhead:
+    """Ограничение числа одновременных запросов к upstream"""
+
+    def __init__(self, max_concurrent: int = 20, acquire_timeout: float = 5.0):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.acquire_timeout = acquire_timeout
+        self.in_flight = 0
+        self.rejected_total = 0
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+    async def __aenter__(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.rejected_total += 1
+            raise BulkheadFullError(
+                f"Too many concurrent requests ({self.max_concurrent} in flight)"
+            )
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self._semaphore.release()
+        return False
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Генерация дашбордов заданного размера на основе шаблонов из templates/"""
+
+import copy
+import json
+from pathlib import Path
+
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates"
+
+
+def load_template_panels():
+    """Панели шаблона router1, используемые как образцы"""
+    with open(TEMPLATES_DIR / "router1_dashboard_template.json", "r", encoding="utf-8") as f:
+        return json.load(f)["dashboard"]["panels"]
+
+
+_TEMPLATE_PANELS = load_template_panels()
+
+
+def generate_panel(panel_id, x=0, y=0):
+    """Панель по образцу шаблона с уникальным ID и позицией на сетке"""
+    panel = copy.deepcopy(_TEMPLATE_PANELS[(panel_id - 1) % len(_TEMPLATE_PANELS)])
+    panel["id"] = panel_id
+    panel["title"] = f"{panel['title']} #{panel_id}"
+    panel["gridPos"] = {"h": 8, "w": 12, "x": x, "y": y}
+    for target in panel.get("targets", []):
+        target["expr"] = target["expr"].replace("router1", f"router{panel_id % 50}")
+    return panel
+
+
+def generate_dashboard(panel_count, uid="bench", title=None):
+    """Дашборд с panel_count панелями в две колонки"""
+    panels = [
+        generate_panel(i, x=((i - 1) % 2) * 12, y=((i - 1) // 2) * 8)
+        for i in range(1, panel_count + 1)
+    ]
+    return {
+        "uid": uid,
+        "title": title or f"Generated Dashboard {uid}",
+        "tags": ["generated", "benchmark"],
+        "timezone": "browser",
+        "schemaVersion": 16,
+        "refresh": "30s",
+        "time": {"from": "now-1h", "to": "now"},
+        "templating": {"list": [{"name": "instance", "type": "query"}]},
+        "panels": panels,
+    }
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Локальная замена Grafana для нагрузочных тестов.
+
+Реализует используемую сервисом часть HTTP API Grafana на хранилище в
+памяти. Задержка ответа, доля ошибок и размер дашбордов настраиваются.
+
+Запуск отдельно:
+    python tests/fake_grafana.py --port 3001 --dashboards 50 --panels 40 --latency-ms 20
+"""
+
+import argparse
+import asyncio
+import copy
+import random
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from dashboard_factory import generate_dashboard
+
+
+def create_app(dashboards=20, panels=20, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=42, uid_prefix="bench"):
+    """ASGI-приложение с набором сгенерированных дашбордов; uid_prefix различает несколько экземпляров"""
+    rng = random.Random(seed)
+    app = FastAPI(title="Fake Grafana")
+    store = {}
+    for i in range(dashboards):
+        uid = f"{uid_prefix}-{i:04d}"
+        dashboard = generate_dashboard(panels, uid=uid, title=f"Benchmark Dashboard {i}")
+        dashboard["id"] = i + 1
+        dashboard["version"] = 1
+        store[uid] = dashboard
+    app.state.store = store
+    app.state.stats = {"requests": 0, "errors": 0}
+
+    @app.middleware("http")
+    async def simulate_upstream(request: Request, call_next):
+        app.state.stats["requests"] += 1
+        delay = latency_ms + (rng.uniform(-jitter_ms, jitter_ms) if jitter_ms else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if error_rate and rng.random() < error_rate:
+            app.state.stats["errors"] += 1
+            return JSONResponse({"message": "Simulated upstream failure"}, status_code=503)
+        return await call_next(request)
+
+    @app.get("/api/health")
+    async def health():
+        return {"database": "ok", "version": "fake"}
+
+    @app.get("/api/search")
+    async def search(query: str = None, tag: str = None, limit: int = 1000, dashboardUIDs: str = None):
+        result = []
+        for uid, dash in store.items():
+            if dashboardUIDs and uid != dashboardUIDs:
+                continue
+            if query and query.lower() not in dash["title"].lower():
+                continue
+            if tag and tag not in dash.get("tags", []):
+                continue
+            result.append({
+                "id": dash["id"], "uid": uid, "title": dash["title"],
+                "url": f"/d/{uid}", "type": "dash-db", "tags": dash.get("tags", []),
+                "isStarred": False,
+            })
+        return result[:limit]
+
+    @app.get("/api/dashboards/uid/{uid}")
+    async def get_dashboard(uid: str):
+        if uid not in store:
+            raise HTTPException(status_code=404, detail="Dashboard not found")
+        return {"dashboard": store[uid], "meta": {"url": f"/d/{uid}", "version": store[uid]["version"]}}
+
+    @app.get("/api/dashboards/uid/{uid}/versions")
+    async def dashboard_versions(uid: str, limit: int = 0):
+        # Как и в Grafana, версия есть только здесь и в самом дашборде, но не в поиске
+        if uid not in store:
+            raise HTTPException(status_code=404, detail="Dashboard not found")
+        versions = [{"id": version, "dashboardId": store[uid]["id"], "version": version,
+                     "created": "2024-01-01T00:00:00Z", "createdBy": "admin", "message": ""}
+                    for version in range(store[uid]["version"], 0, -1)]
+        return versions[:limit] if limit > 0 else versions
+
+    @app.post("/api/dashboards/db")
+    async def save_dashboard(request: Request):
+        body = await request.json()
+        dashboard = copy.deepcopy(body["dashboard"])
+        uid = dashboard.get("uid") or f"gen-{len(store):04d}"
+        previous = store.get(uid)
+        dashboard["uid"] = uid
+        dashboard["id"] = previous["id"] if previous else len(store) + 1
+        dashboard["version"] = (previous["version"] if previous else 0) + 1
+        store[uid] = dashboard
+        return {"id": dashboard["id"], "uid": uid, "url": f"/d/{uid}",
+                "status": "success", "version": dashboard["version"]}
+
+    @app.delete("/api/dashboards/uid/{uid}")
+    async def delete_dashboard(uid: str):
+        if store.pop(uid, None) is None:
+            raise HTTPException(status_code=404, detail="Dashboard not found")
+        return {"title": uid, "message": "Dashboard deleted"}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Grafana API for load tests")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--dashboards", type=int, default=20)
+    parser.add_argument("--panels", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--uid-prefix", default="bench")
+    args = parser.parse_args()
+
+    app = create_app(args.dashboards, args.panels, args.latency_ms, args.jitter_ms, args.error_rate,
+                     uid_prefix=args.uid_prefix)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Локальная замена Prometheus для тестов проверки PromQL.
+
+Отдает список имен метрик и их метаданные. По умолчанию это метрики из
+шаблонов templates/, которые используют сгенерированные дашборды.
+query_range возвращает детерминированные ряды для любого выражения;
+запрошенные окна записываются в app.state.stats["query_range"].
+Число рядов метрик в статистике TSDB тоже детерминировано (series_count).
+
+Запуск отдельно:
+    python tests/fake_prometheus.py --port 9090 --extra-metrics 10000
+"""
+
+import argparse
+import asyncio
+import math
+import sys
+import zlib
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from fastapi import FastAPI, Request
+
+from dashboard_factory import _TEMPLATE_PANELS
+from src.services.promql_validator import iter_expressions, parse_expr
+
+
+def template_metric_names():
+    """Имена метрик в выражениях панелей шаблона"""
+    names = []
+    for _, expr in iter_expressions({"panels": _TEMPLATE_PANELS}):
+        names.extend(parse_expr(expr)[0])
+    return sorted(set(names))
+
+
+def sample_value(query, instance, timestamp):
+    """Значение ряда в момент времени: одно и то же при повторных запросах"""
+    seed = zlib.crc32(f"{query}|{instance}".encode())
+    return round(100 + 50 * math.sin(timestamp / 600 + seed % 628 / 100), 3)
+
+
+def series_count(name):
+    """Число рядов метрики в статистике TSDB"""
+    return 1 + zlib.crc32(name.encode()) % 5000
+
+
+def create_app(metrics=None, extra_metrics=0, latency_ms=0.0, series_per_query=2):
+    """ASGI-приложение; extra_metrics добавляет синтетические имена для объема метаданных"""
+    app = FastAPI(title="Fake Prometheus")
+    names = list(metrics if metrics is not None else template_metric_names())
+    names.extend(f"synthetic_metric_{i:06d}_total" for i in range(extra_metrics))
+    app.state.metrics = names
+    app.state.stats = {"requests": 0, "query_range": []}
+
+    @app.middleware("http")
+    async def simulate_upstream(request: Request, call_next):
+        app.state.stats["requests"] += 1
+        if latency_ms > 0:
+            await asyncio.sleep(latency_ms / 1000)
+        return await call_next(request)
+
+    @app.get("/api/v1/label/__name__/values")
+    async def metric_names():
+        return {"status": "success", "data": sorted(app.state.metrics)}
+
+    @app.get("/api/v1/metadata")
+    async def metadata():
+        return {"status": "success", "data": {
+            name: [{"type": "counter" if name.endswith("_total") else "gauge", "help": f"Fake {name}", "unit": ""}]
+            for name in app.state.metrics
+        }}
+
+    @app.get("/api/v1/status/tsdb")
+    async def tsdb_status(limit: int = 10):
+        counts = sorted(((series_count(name), name) for name in app.state.metrics), reverse=True)[:limit]
+        return {"status": "success", "data": {
+            "headStats": {"numSeries": sum(series_count(name) for name in app.state.metrics)},
+            "seriesCountByMetricName": [{"name": name, "value": count} for count, name in counts],
+        }}
+
+    @app.get("/api/v1/query_range")
+    async def query_range(query: str, start: float, end: float, step: float):
+        app.state.stats["query_range"].append((query, start, end, step))
+        if step <= 0 or (end - start) / step > 11000:
+            return {"status": "error", "errorType": "bad_data",
+                    "error": "exceeded maximum resolution of 11,000 points per timeseries"}
+        timestamps = [start + i * step for i in range(int((end - start) // step) + 1)]
+        return {"status": "success", "data": {"resultType": "matrix", "result": [
+            {"metric": {"instance": f"node{n}"},
+             "values": [[t, str(sample_value(query, f"node{n}", t))] for t in timestamps]}
+            for n in range(series_per_query)
+        ]}}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Prometheus API for tests")
+    parser.add_argument("--port", type=int, default=9090)
+    parser.add_argument("--extra-metrics", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    app = create_app(extra_metrics=args.extra_metrics, latency_ms=args.latency_ms)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк dashboards-service против локальной замены Grafana.
+
+Поднимает fake_grafana, fake_prometheus и сервис в фоновых потоках, гоняет смешанную
+нагрузку чтения и редактирования панелей с фиксированной конкурентностью
+и сохраняет пропускную способность и p50/p95/p99 по операциям в JSON
+для сравнения между сборками.
+
+Запуск:
+    python tests/load_benchmark.py --duration 30 --concurrency 32 --output load_results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import httpx
+import uvicorn
+
+from fake_grafana import create_app as create_fake_grafana
+from fake_prometheus import create_app as create_fake_prometheus
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_in_thread(app, port):
+    """Запускает uvicorn в отдельном потоке и ждет готовности"""
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 15
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Server on port {port} did not start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def percentile(sorted_values, pct):
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3) if values else None,
+        "p95_ms": round(percentile(values, 95) * 1000, 3) if values else None,
+        "p99_ms": round(percentile(values, 99) * 1000, 3) if values else None,
+        "max_ms": round(values[-1] * 1000, 3) if values else None,
+    }
+
+
+def new_panel(rng):
+    return {
+        "title": f"Load panel {rng.randrange(1_000_000)}",
+        "type": "graph",
+        "datasource": {"type": "prometheus", "uid": "prometheus"},
+        "targets": [{
+            "refId": "A",
+            "expr": "rate(ifInOctets{instance=\"router1\"}[5m])",
+            "datasource": {"type": "prometheus", "uid": "prometheus"},
+        }],
+    }
+
+
+async def run_workload(base_url, uids, duration, concurrency, read_ratio, seed):
+    """Смешанная нагрузка: list/get на чтение и add/update панели на запись"""
+    rng = random.Random(seed)
+    latencies = {"list": [], "get": [], "add_panel": [], "update_panel": []}
+    errors = {name: 0 for name in latencies}
+    added_panels = {}
+    deadline = time.perf_counter() + duration
+
+    async def one_request(client):
+        uid = rng.choice(uids)
+        if rng.random() < read_ratio:
+            op = "list" if rng.random() < 0.2 else "get"
+        else:
+            op = "update_panel" if added_panels.get(uid) and rng.random() < 0.5 else "add_panel"
+
+        started = time.perf_counter()
+        if op == "list":
+            response = await client.get(f"{base_url}/api/")
+        elif op == "get":
+            response = await client.get(f"{base_url}/api/{uid}")
+        elif op == "add_panel":
+            response = await client.post(f"{base_url}/api/{uid}/panels", json=new_panel(rng))
+            if response.status_code == 200:
+                added_panels.setdefault(uid, []).append(response.json()["id"])
+        else:
+            panel_id = rng.choice(added_panels[uid])
+            response = await client.put(f"{base_url}/api/{uid}/panels/{panel_id}", json=new_panel(rng))
+        latencies[op].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors[op] += 1
+
+    async def worker(client):
+        while time.perf_counter() < deadline:
+            try:
+                await one_request(client)
+            except httpx.HTTPError:
+                errors["get"] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60.0, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "overall": summarize(all_latencies, sum(errors.values()), elapsed),
+        "operations": {op: summarize(latencies[op], errors[op], elapsed) for op in latencies},
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark for dashboards-service")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of unrecorded warm-up load")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--read-ratio", type=float, default=0.8, help="Share of read requests")
+    parser.add_argument("--dashboards", type=int, default=20)
+    parser.add_argument("--panels", type=int, default=50, help="Panels per generated dashboard")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="Fake Grafana latency")
+    parser.add_argument("--jitter-ms", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake Grafana 503s")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="load_results.json")
+    args = parser.parse_args()
+    args.output = os.path.abspath(args.output)
+
+    grafana_port, prometheus_port, service_port = free_port(), free_port(), free_port()
+    fake_grafana = create_fake_grafana(args.dashboards, args.panels, args.latency_ms,
+                                       args.jitter_ms, args.error_rate, args.seed)
+    serve_in_thread(fake_grafana, grafana_port)
+    serve_in_thread(create_fake_prometheus(), prometheus_port)
+
+    # Сервис читает настройки при импорте, поэтому окружение задается заранее
+    os.environ["SYSTEM_MONITORING_GRAFANA_URL"] = f"http://127.0.0.1:{grafana_port}"
+    os.environ["SYSTEM_MONITORING_PROMETHEUS_URL"] = f"http://127.0.0.1:{prometheus_port}"
+    os.environ["SYSTEM_MONITORING_ADMISSION_ENABLED"] = "false"
+    os.environ["SYSTEM_MONITORING_LOG_LEVEL"] = "WARNING"
+    os.environ["SYSTEM_MONITORING_CACHE_WARMUP_ENABLED"] = "false"
+    os.chdir(ROOT_DIR)
+    import main as service
+    serve_in_thread(service.app, service_port)
+
+    base_url = f"http://127.0.0.1:{service_port}"
+    uids = sorted(fake_grafana.state.store)
+    if args.warmup > 0:
+        asyncio.run(run_workload(base_url, uids, args.warmup, args.concurrency, args.read_ratio, args.seed))
+    results = asyncio.run(run_workload(base_url, uids, args.duration, args.concurrency,
+                                       args.read_ratio, args.seed + 1))
+
+    report = {
+        "benchmark": "dashboards-service-load",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "upstream_requests": fake_grafana.state.stats["requests"],
+        "upstream_errors": fake_grafana.state.stats["errors"],
+        **results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    overall = results["overall"]
+    print(f"📊 {overall['requests']} requests, {overall['throughput_rps']} req/s, "
+          f"p50={overall['p50_ms']}ms p95={overall['p95_ms']}ms p99={overall['p99_ms']}ms, "
+          f"errors={overall['errors']}")
+    for op, stats in results["operations"].items():
+        print(f"   {op:<13} n={stats['requests']:<6} p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms errors={stats['errors']}")
+    print(f"📝 INFO: results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарки CPU-операций сервиса на дашбордах от 10 до 5000 панелей.
+
+Для каждой операции и размера измеряется лучшее время из нескольких
+повторов и пиковое выделение памяти (tracemalloc). Результат сравнивается
+с сохраненной базой micro_benchmark_baseline.json: при замедлении или
+росте памяти больше допуска скрипт завершается с кодом 1.
+
+База снята на другой машине, поэтому время сравнивается с поправкой на
+общую скорость машины (медиана отношений текущего времени к базе по всем
+операциям), а замедления меньше абсолютного порога --time-floor-us
+считаются шумом: микросекундные операции на малых дашбордах нестабильны.
+Операции с регрессией времени перемеряются (--retries), в зачет идет
+лучший результат.
+
+Запуск:
+    python tests/micro_benchmark.py                      # сравнение с базой
+    python tests/micro_benchmark.py --update-baseline    # перезапись базы
+"""
+
+import argparse
+import copy
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from dashboard_factory import generate_dashboard
+from src.schemas.dashboard import DashboardCreate
+from src.services.dashboard_validator import validate_dashboard
+from src.services.grafana_service import DashboardSchema, GrafanaService
+from src.services.panel_layout import compact_panels, place_panel
+from src.services.promql_validator import PromQLValidator
+
+BASELINE_FILE = Path(__file__).resolve().parent / "micro_benchmark_baseline.json"
+DEFAULT_SIZES = [10, 100, 1000, 5000]
+
+
+def build_cases(service, panel_count):
+    """Операции для дашборда заданного размера: имя -> функция без аргументов"""
+    dashboard = generate_dashboard(panel_count, uid=f"micro-{panel_count}")
+    changed = copy.deepcopy(dashboard)
+    # Изменение в последней панели, чтобы сравнение списка панелей проходило его целиком
+    changed["panels"][-1]["title"] += " (changed)"
+    changed["refresh"] = "1m"
+    payload = {"dashboard": dashboard, "folderId": 0, "overwrite": True}
+    encoded = json.dumps(payload)
+    validated = DashboardCreate(**payload)
+    # Удаление панели в начале дашборда: при подъеме сдвигается вся колонка под ней
+    after_delete = dashboard["panels"][1:]
+
+    def write_three_pass():
+        # Прежний путь записи: валидация в роуте, model_dump(), повторная валидация в сервисе и .dict()
+        dumped = DashboardCreate(**payload).model_dump()
+        return DashboardSchema(**dumped).model_dump()
+
+    def write_single_pass():
+        return service._save_payload(service._validate_write(DashboardCreate(**payload)))
+
+    return {
+        "compare_dict": lambda: service._compare_dict(dashboard, changed),
+        "visualize_dashboard": lambda: service.visualize_dashboard(payload),
+        "next_panel_id": lambda: service._next_panel_id(dashboard),
+        "dashboard_create_validation": lambda: DashboardCreate(**payload),
+        "dashboard_create_dump": lambda: validated.model_dump(),
+        "dashboard_write_three_pass": write_three_pass,
+        "dashboard_write_single_pass": write_single_pass,
+        "dashboard_check_fast": lambda: validate_dashboard(dashboard, "fast"),
+        "dashboard_check_strict": lambda: validate_dashboard(dashboard, "strict"),
+        "promql_check": lambda: PromQLValidator().check_dashboard(dashboard),
+        "panel_place": lambda: place_panel(dashboard["panels"], {"id": panel_count + 1}),
+        "panel_compact": lambda: compact_panels(after_delete),
+        "json_encode": lambda: json.dumps(payload),
+        "json_decode": lambda: json.loads(encoded),
+    }
+
+
+def measure_time(func, min_time=0.2, repeats=5):
+    """Лучшее среднее время вызова из repeats серий длительностью не меньше min_time"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / repeats or number >= 1_000_000:
+            break
+        number *= 2
+
+    best = elapsed / number
+    for _ in range(repeats - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+def measure_peak_memory(func):
+    """Пиковое выделение памяти за один вызов, байты"""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run(sizes, operations=None, keys=None):
+    service = GrafanaService()
+    results = {}
+    for size in sizes:
+        for name, func in build_cases(service, size).items():
+            key = f"{name}[{size}]"
+            if (operations and name not in operations) or (keys is not None and key not in keys):
+                continue
+            results[key] = {
+                "time_us": round(measure_time(func) * 1e6, 3),
+                "peak_bytes": measure_peak_memory(func),
+            }
+            print(f"   {key:<36} {results[key]['time_us']:>12.3f} us  {results[key]['peak_bytes']:>12} B")
+    return results
+
+
+def machine_factor(results, baseline):
+    """Во сколько раз машина медленнее той, где снята база: медиана отношений времени"""
+    ratios = [current["time_us"] / baseline[key]["time_us"] for key, current in results.items()
+              if baseline.get(key) and baseline[key]["time_us"] > 0]
+    return statistics.median(ratios) if ratios else 1.0
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance, time_floor_us=50.0, factor=1.0):
+    """Регрессии относительно базы {ключ: описание}, время базы умножается на factor"""
+    regressions = {}
+    for key, current in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        expected = base["time_us"] * factor
+        if current["time_us"] > expected * (1 + time_tolerance) and current["time_us"] - expected > time_floor_us:
+            regressions[key] = (f"{key}: time {expected:.3f}us (baseline {base['time_us']}us x {factor:.2f}) "
+                                f"-> {current['time_us']}us")
+        if current["peak_bytes"] > base["peak_bytes"] * (1 + memory_tolerance):
+            regressions[key + " memory"] = f"{key}: peak memory {base['peak_bytes']}B -> {current['peak_bytes']}B"
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU hot path microbenchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Panel counts")
+    parser.add_argument("--only", nargs="+", help="Run only these operations")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="Allowed slowdown, 0.5 = +50%%")
+    parser.add_argument("--time-floor-us", type=float, default=50.0,
+                        help="Slowdowns below this absolute difference are treated as noise")
+    parser.add_argument("--no-normalize", action="store_true",
+                        help="Compare absolute times without correcting for machine speed")
+    parser.add_argument("--retries", type=int, default=2, help="Re-measure cases flagged as slower")
+    parser.add_argument("--memory-tolerance", type=float, default=0.2, help="Allowed peak memory growth")
+    parser.add_argument("--output", help="Write results JSON to this file")
+    args = parser.parse_args()
+
+    print("=== Microbenchmarks ===")
+    results = run(args.sizes, args.only)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+        baseline.update(results)
+        baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"📝 INFO: baseline updated: {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"📝 INFO: no baseline at {baseline_path}, run with --update-baseline")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    factor = 1.0 if args.no_normalize else machine_factor(results, baseline)
+    print(f"📝 INFO: machine speed factor vs baseline: {factor:.2f}")
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance,
+                          args.time_floor_us, factor)
+    for _ in range(args.retries):
+        slow = {key for key in regressions if key in results}
+        if not slow:
+            break
+        print(f"📝 INFO: re-measuring {len(slow)} case(s)")
+        for key, current in run(args.sizes, args.only, slow).items():
+            results[key]["time_us"] = min(results[key]["time_us"], current["time_us"])
+        regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance,
+                              args.time_floor_us, factor)
+    if regressions:
+        for line in regressions.values():
+            print(f"❌ FAIL: {line}")
+        return 1
+    print("✅ PASS: no regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
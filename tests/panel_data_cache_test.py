@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Проверка кэша данных панелей (QueryRangeCache в src/services/panel_data.py)
+без Prometheus: окно автообновляемой панели сдвигается вперед, ответ
+сравнивается с полным окном. При ошибке скрипт завершается с кодом 1.
+
+Запуск:
+    python tests/panel_data_cache_test.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.services.panel_data import PanelDataService, QueryRangeCache
+
+STEP = 15
+
+
+class FakePrometheus:
+    """query_range с точкой на каждый шаг; запоминает запрошенные отрезки"""
+
+    def __init__(self):
+        self.requests = []
+
+    async def query_range(self, expr, start, end, step):
+        self.requests.append((start, end))
+        values = [[t, str(t)] for t in range(start, end + 1, step)]
+        return [{"metric": {"__name__": expr}, "values": values}] if values else []
+
+
+def check_sliding_window(max_points=100, window_steps=51, shift_steps=10, refreshes=30):
+    """Окно из window_steps шагов сдвигается на shift_steps при каждом обновлении"""
+    failures = []
+    client = FakePrometheus()
+    service = PanelDataService(client, QueryRangeCache(max_points=max_points), freshness=0)
+    for refresh in range(refreshes):
+        start = refresh * shift_steps * STEP
+        end = start + (window_steps - 1) * STEP
+        series = asyncio.run(service.query_range("up", start, end, STEP))
+        points = series[0][1] if series else {}
+        expected = set(range(start, end + 1, STEP))
+        if set(points) != expected:
+            failures.append(f"window [{start // STEP}, {end // STEP}]: {len(points)} of {len(expected)} points")
+        if refresh and client.requests[-1][0] != end - (shift_steps - 1) * STEP:
+            failures.append(f"window [{start // STEP}, {end // STEP}]: requested {client.requests[-1]}, "
+                            f"expected only the new {shift_steps} steps")
+    return failures
+
+
+def main():
+    failures = check_sliding_window() + check_sliding_window(max_points=60, window_steps=51, shift_steps=3)
+    for failure in failures[:20]:
+        print(f"❌ FAIL: {failure}")
+    if failures:
+        print(f"{len(failures)} panel data cache checks failed")
+        return 1
+    print("✅ PASS: panel data cache checks")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
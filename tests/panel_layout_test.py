@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Проверка раскладки панелей (src/services/panel_layout.py) без сервиса и Grafana.
+
+Известные случаи плюс сравнение find_slot с полным перебором на случайных
+сетках. При ошибке скрипт завершается с кодом 1.
+
+Запуск:
+    python tests/panel_layout_test.py
+"""
+
+import random
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.services.dashboard_validator import GRID_COLUMNS
+from src.services.panel_layout import GridOccupancy, place_panel
+
+
+def panel(panel_id, x, y, w, h):
+    return {"id": panel_id, "gridPos": {"x": x, "y": y, "w": w, "h": h}}
+
+
+def brute_force_slot(occupancy, w, h, start_y=0, prefer_x=None):
+    """Первое сверху свободное место полным перебором"""
+    y = start_y
+    while True:
+        free = [x for x in range(GRID_COLUMNS - w + 1) if occupancy.fits(x, y, w, h)]
+        if free:
+            if prefer_x is None:
+                return free[0], y
+            return min(free, key=lambda x: (abs(x - prefer_x), x)), y
+        y += 1
+
+
+def check_known_cases():
+    failures = []
+    # Окно, заблокированное в колонках 0-11, сразу подходит в колонках 12-23 со следующей строки
+    staggered = [panel(1, 12, 0, 12, 1), panel(2, 0, 1, 12, 1)]
+    cases = [
+        ("default size below a staggered pair", place_panel(staggered, {"id": 3}), (12, 1, 12, 8)),
+        ("requested position below a staggered pair",
+         place_panel(staggered, panel(3, 0, 0, 12, 2)), (12, 1, 12, 2)),
+        ("empty dashboard", place_panel([], {"id": 1}), (0, 0, 12, 8)),
+        ("free requested position is kept",
+         place_panel(staggered, panel(3, 0, 4, 6, 3)), (0, 4, 6, 3)),
+        ("next to a half-width panel", place_panel([panel(1, 0, 0, 12, 8)], {"id": 2}), (12, 0, 12, 8)),
+    ]
+    for name, placed, expected in cases:
+        grid_pos = placed["gridPos"]
+        actual = (grid_pos["x"], grid_pos["y"], grid_pos["w"], grid_pos["h"])
+        if actual != expected:
+            failures.append(f"{name}: expected {expected}, got {actual}")
+    return failures
+
+
+def check_random_grids(iterations=2000, seed=7):
+    rng = random.Random(seed)
+    failures = []
+    for _ in range(iterations):
+        occupancy = GridOccupancy()
+        for _ in range(rng.randint(0, 12)):
+            w, h = rng.randint(1, 16), rng.randint(1, 4)
+            occupancy.add(rng.randint(0, GRID_COLUMNS - w), rng.randint(0, 10), w, h)
+        w, h = rng.randint(1, 24), rng.randint(1, 6)
+        start_y = rng.randint(0, 8)
+        prefer_x = rng.choice([None, rng.randint(0, GRID_COLUMNS - 1)])
+        expected = brute_force_slot(occupancy, w, h, start_y, prefer_x)
+        actual = occupancy.find_slot(w, h, start_y, prefer_x)
+        if actual != expected:
+            failures.append(f"find_slot({w}, {h}, {start_y}, {prefer_x}) on rows {occupancy.rows}: "
+                            f"expected {expected}, got {actual}")
+    return failures
+
+
+def main():
+    failures = check_known_cases() + check_random_grids()
+    for failure in failures[:20]:
+        print(f"❌ FAIL: {failure}")
+    if failures:
+        print(f"{len(failures)} layout checks failed")
+        return 1
+    print("✅ PASS: panel layout checks")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())